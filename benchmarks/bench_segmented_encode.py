@@ -0,0 +1,68 @@
+"""
+Сравнение ускорения видео одним процессом и сегментами.
+
+    python benchmarks/bench_segmented_encode.py input.mp4 --coefficient 5 --profile balanced
+
+Для каждого режима выводится время, скорость относительно реального времени
+и разница длительностей видео- и аудиодорожек результата (проверка синхронизации).
+Профиль фиксируется: автоматический выбор зависит от нагрузки, и режимы
+иначе сравнивались бы на разных пресетах.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.video_speed import VideoSpeedService
+
+
+async def stream_durations(path: str) -> dict:
+    process = await asyncio.create_subprocess_exec(
+        'ffprobe', '-v', 'quiet', '-print_format', 'json', '-show_streams', path,
+        stdout=asyncio.subprocess.PIPE
+    )
+    stdout, _ = await process.communicate()
+    streams = json.loads(stdout or b'{}').get('streams', [])
+    return {stream['codec_type']: float(stream.get('duration', 0)) for stream in streams}
+
+
+async def run(args):
+    service = VideoSpeedService(os.path.dirname(os.path.abspath(args.input)))
+    service.profile_selector.config = dict(service.profile_selector.config, PROFILE=args.profile)
+    info = await service.get_video_info(args.input)
+    print(f"Вход: {info['duration']:.1f} с, {info['width']}x{info['height']}, профиль {args.profile}, "
+          f"бюджет планировщика {service.scheduler.budget} потоков")
+
+    timings = {}
+    for segmented in (False, True):
+        label = "сегменты" if segmented else "один процесс"
+        started = time.monotonic()
+        output = await service.speed_up_video(
+            args.input, args.coefficient, keep_original=True, segmented=segmented
+        )
+        elapsed = time.monotonic() - started
+        if not output:
+            print(f"{label:14s} ошибка")
+            continue
+
+        timings[segmented] = elapsed
+        durations = await stream_durations(output)
+        drift = abs(durations.get('video', 0) - durations.get('audio', 0))
+        print(f"{label:14s} {elapsed:8.1f} с  x{info['duration'] / elapsed:5.2f}  "
+              f"расхождение дорожек {drift * 1000:.0f} мс")
+        os.remove(output)
+
+    if len(timings) == 2:
+        print(f"Ускорение от сегментов: x{timings[False] / timings[True]:.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("input")
+    parser.add_argument("--coefficient", type=int, default=5, help="Коэффициент 1-10 (1.01x-1.10x)")
+    parser.add_argument("--profile", default="balanced", choices=("quality", "balanced", "fast"))
+    asyncio.run(run(parser.parse_args()))
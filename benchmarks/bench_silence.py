@@ -0,0 +1,82 @@
+"""
+Сравнение удаления пауз: pydub split_on_silence против SilenceRemover (NumPy).
+
+    python benchmarks/bench_silence.py                  # синтетическая речь, 1/5/10 минут
+    python benchmarks/bench_silence.py --file input.mp3
+
+Экспорт в mp3 не замеряется: он одинаков для обоих движков. Проверяется,
+что итоговый PCM совпадает побайтно.
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+from pydub import AudioSegment
+from pydub.silence import split_on_silence
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config.config import AUDIO_CONFIG
+from services.silence_remover import SilenceRemover
+
+
+def synthetic_speech(minutes: float, frame_rate: int = 44100, seed: int = 0) -> AudioSegment:
+    """Шум с чередованием «речи» и пауз разной длины"""
+    rng = np.random.default_rng(seed)
+    total = int(minutes * 60 * frame_rate)
+    samples = np.empty(total, dtype=np.int16)
+    position = 0
+    speaking = True
+    while position < total:
+        length = int(rng.uniform(0.03, 1.5 if speaking else 0.4) * frame_rate)
+        amplitude = 3000 if speaking else 20
+        chunk = (rng.standard_normal(min(length, total - position)) * amplitude)
+        samples[position:position + len(chunk)] = np.clip(chunk, -32768, 32767)
+        position += len(chunk)
+        speaking = not speaking
+    return AudioSegment(samples.tobytes(), frame_rate=frame_rate, sample_width=2, channels=1)
+
+
+def measure(func):
+    tracemalloc.start()
+    started = time.perf_counter()
+    result = func()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak / 1024 / 1024
+
+
+def run(audio: AudioSegment, label: str, skip_pydub: bool):
+    params = dict(
+        min_silence_len=AUDIO_CONFIG['MIN_SILENCE_LEN'],
+        silence_thresh=AUDIO_CONFIG['SILENCE_THRESH'],
+        keep_silence=AUDIO_CONFIG['KEEP_SILENCE'],
+    )
+
+    fast, fast_time, fast_peak = measure(lambda: SilenceRemover(audio).remove_silence(**params))
+    line = f"{label:>12s}  numpy {fast_time:8.2f} с {fast_peak:8.1f} MB"
+
+    if not skip_pydub:
+        slow, slow_time, slow_peak = measure(lambda: sum(split_on_silence(audio, **params)))
+        same = slow.raw_data == fast.raw_data
+        line += (f"  pydub {slow_time:8.2f} с {slow_peak:8.1f} MB"
+                 f"  ускорение x{slow_time / fast_time:.1f}  совпадает={same}")
+    print(line)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", help="Аудио файл вместо синтетики")
+    parser.add_argument("--minutes", type=float, nargs="+", default=[1, 5, 10])
+    parser.add_argument("--skip-pydub", action="store_true", help="Только NumPy (для часовых файлов)")
+    args = parser.parse_args()
+
+    if args.file:
+        run(AudioSegment.from_file(args.file), os.path.basename(args.file), args.skip_pydub)
+    else:
+        for minutes in args.minutes:
+            run(synthetic_speech(minutes), f"{minutes:g} мин", args.skip_pydub)
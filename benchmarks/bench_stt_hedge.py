@@ -0,0 +1,63 @@
+"""
+Бенчмарк хеджирования распознавания на заглушке ElevenLabs.
+
+    python benchmarks/bench_stt_hedge.py sample.wav --lang ru --latency 40
+
+Для каждого режима (off, deadline, parallel) измеряется время до результата
+и движок, который ответил первым. Бенчмарк работает во временном каталоге:
+кэш, контрольные точки и кэш ffprobe не попадают в рабочую базу бота.
+"""
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from fake_elevenlabs import start_fake_server
+from services.transcriber import VideoTranscriber
+from services.transcript_cache import TranscriptCache, TranscriptionCheckpoints
+
+
+async def run(args):
+    port = 8765
+    runner, fake = await start_fake_server(port=port, latency=args.latency, error_rate=args.error_rate)
+    wav_path = os.path.abspath(args.wav)
+    tmp_dir = tempfile.mkdtemp()
+    # DB_FILE относительный - все, что сервисы пишут по умолчанию, остается во временном каталоге
+    os.chdir(tmp_dir)
+
+    try:
+        for mode in ("off", "deadline", "parallel"):
+            # Отдельная БД на режим, чтобы каждый режим считал с нуля
+            db_file = os.path.join(tmp_dir, f"bench_{mode}.db")
+            transcriber = VideoTranscriber(models_dir=os.path.join(ROOT, "models"))
+            transcriber.cache = TranscriptCache(db_file)
+            transcriber.checkpoints = TranscriptionCheckpoints(db_file)
+            transcriber.use_elevenlabs = True
+            transcriber.api_key = "fake"
+            transcriber.stt_config = dict(transcriber.stt_config, BASE_URL=f"http://127.0.0.1:{port}/v1")
+            transcriber.hedge_config = {'MODE': mode, 'DELAY': args.hedge_delay}
+
+            started = time.monotonic()
+            text = await transcriber.transcribe(wav_path, args.lang)
+            elapsed = time.monotonic() - started
+            engine = transcriber.tier_timings[-1]['engine'] if transcriber.tier_timings else '-'
+            print(f"{mode:9s} {elapsed:8.2f} с  движок={engine:12s} символов={len(text or '')}"
+                  f"  запросов к заглушке={fake.stats['stt_requests']}")
+            await transcriber.close()
+    finally:
+        await runner.cleanup()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("wav", help="WAV 16 кГц моно")
+    parser.add_argument("--lang", default="ru")
+    parser.add_argument("--latency", type=float, default=30.0, help="Задержка заглушки ElevenLabs, сек")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--hedge-delay", type=float, default=5.0)
+    asyncio.run(run(parser.parse_args()))
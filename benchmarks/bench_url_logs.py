@@ -0,0 +1,116 @@
+"""
+Задержка запросов к url_logs на большой таблице: старая схема против миграции.
+
+    python benchmarks/bench_url_logs.py                   # 10 млн строк
+    python benchmarks/bench_url_logs.py --rows 1000000
+
+Старая схема - timestamp строкой без индексов, как до миграции. Затем та же
+база открывается через Database (миграция до текущей версии) и замеры
+повторяются; в конце - пачка удаления по сроку хранения.
+"""
+import argparse
+import asyncio
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.database import Database
+
+USERS = 50000
+
+
+def fill_legacy(path: str, rows: int):
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=OFF')
+    conn.execute('''
+        CREATE TABLE url_logs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER,
+            username TEXT,
+            url TEXT,
+            timestamp DATETIME,
+            status TEXT,
+            error_message TEXT
+        )
+    ''')
+    rng = random.Random(0)
+    start = datetime.now() - timedelta(days=60)
+    step = timedelta(days=60) / rows
+    chunk = 100000
+    for offset in range(0, rows, chunk):
+        batch = []
+        for i in range(offset, min(offset + chunk, rows)):
+            user_id = rng.randrange(USERS)
+            batch.append((user_id, f"user{user_id}", f"https://www.instagram.com/reel/{i:x}/",
+                          str(start + step * i), "success" if rng.random() < 0.9 else "error", None))
+        conn.executemany('''
+            INSERT INTO url_logs (user_id, username, url, timestamp, status, error_message)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', batch)
+        conn.commit()
+        print(f"\rЗаполнение: {min(offset + chunk, rows)}/{rows}", end="", flush=True)
+    print()
+    conn.close()
+
+
+def timed(func, repeat: int) -> str:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        samples.append((time.perf_counter() - started) * 1000)
+    return f"медиана {statistics.median(samples):8.2f} мс  максимум {max(samples):8.2f} мс"
+
+
+def bench_queries(path: str, label: str, repeat: int):
+    conn = sqlite3.connect(path)
+    rng = random.Random(1)
+    print(f"--- {label}")
+    print("get_user_history ", timed(lambda: conn.execute('''
+        SELECT url, status, error_message, timestamp FROM url_logs
+        WHERE user_id = ? ORDER BY timestamp DESC LIMIT 10
+    ''', (rng.randrange(USERS),)).fetchall(), repeat))
+    print("get_all_history  ", timed(lambda: conn.execute('''
+        SELECT username, url, status, error_message, timestamp FROM url_logs
+        ORDER BY timestamp DESC LIMIT 30
+    ''').fetchall(), repeat))
+    conn.close()
+
+
+async def bench_retention(path: str):
+    db = Database(path)
+    started = time.perf_counter()
+    deleted = await db.cleanup_old_records(days=30)
+    elapsed = time.perf_counter() - started
+    db.close()
+    print(f"Удаление старше 30 дней: {deleted} строк за {elapsed:.1f} с")
+
+
+def run(args):
+    workdir = tempfile.mkdtemp(prefix="bench_url_logs_")
+    path = os.path.join(workdir, "bench.db")
+    fill_legacy(path, args.rows)
+    bench_queries(path, "старая схема", max(3, args.repeat // 20))
+
+    started = time.perf_counter()
+    Database(path).close()
+    print(f"Миграция: {time.perf_counter() - started:.1f} с")
+    bench_queries(path, "после миграции", args.repeat)
+
+    asyncio.run(bench_retention(path))
+    bench_queries(path, "после очистки", args.repeat)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--repeat", type=int, default=200)
+    run(parser.parse_args())
@@ -1,14 +1,19 @@
 from aiogram import Bot, Dispatcher, types
 from aiogram.filters import Command
 from aiogram.types import ReplyKeyboardMarkup, KeyboardButton, ReplyKeyboardRemove
-from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.fsm.context import FSMContext
 from aiogram.filters import Command, StateFilter
 
 from handlers.video_handler import VideoHandler
+from handlers.admin_handler import AdminHandler
 from states.states import VideoProcessing
 from services.File_Manager import FileManager
 from services.chunk_uploader import ChunkUploader
+from services.sqlite_storage import SQLiteStorage
+from services.metrics import MetricsRegistry
+from services.metrics_server import MetricsServer
+from services.monitoring import MonitoringService
+from services.loop_watchdog import LoopWatchdog
 
 
 from config.config import BOT_TOKEN, setup_logging
@@ -20,11 +25,15 @@ logger = setup_logging(__name__)
 
 class VideoBot:
     def __init__(self):
-        self.storage = MemoryStorage()
+        self.storage = SQLiteStorage()
         self.bot = None
         self.dp = None
         self.video_handler = VideoHandler()
+        self.watchdog = LoopWatchdog()
+        self.admin_handler = AdminHandler(self.video_handler.db, self.watchdog)
         self.file_manager = FileManager()
+        self.metrics_server = MetricsServer()
+        self.background_tasks = []
 
     async def initialize(self):
         """Инициализация бота и диспетчера"""
@@ -48,7 +57,17 @@ class VideoBot:
             logger.info("Бот запущен")
             
             # Запускаем очистку
-            cleanup_task = asyncio.create_task(self.video_handler.periodic_cleanup())
+            self.background_tasks = [
+                asyncio.create_task(self.video_handler.periodic_cleanup()),
+                asyncio.create_task(self.video_handler.db.retention_loop()),
+                asyncio.create_task(self.video_handler.db.rollup_loop()),
+                asyncio.create_task(self.storage.eviction_loop()),
+                asyncio.create_task(MetricsRegistry().flush_loop()),
+                asyncio.create_task(MonitoringService().loop_lag_loop()),
+            ]
+            MonitoringService().watch_queue('db_writer', self.video_handler.db.pending_writes)
+            await self.metrics_server.start()
+            self.watchdog.start()
             
             # Запускаем поллинг
             await self.dp.start_polling(self.bot)
@@ -103,6 +122,10 @@ class VideoBot:
             logger.info("🔥🔥🔥 ОБРАБОТЧИК ВЫЗВАН!")  # ВРЕМЕННОЕ ЛОГИРОВАНИЕ
             await self.video_handler.handle_speed_coefficient_input(message, state)
 
+        @self.dp.callback_query(lambda c: c.data and c.data.startswith('speedcancel_'))
+        async def speed_cancel_handler(callback_query: types.CallbackQuery):
+            await self.video_handler.handle_speed_cancel(callback_query)
+
         @self.dp.message(lambda m: m.text and any(x in m.text.lower() for x in ['youtube.com', 'youtu.be', 'instagram.com', 'kuaishou.com', 'pin.it', 'pinterest.com']))
         async def url_handler(message: types.Message, state: FSMContext):
             if message.from_user.id in self.video_handler.active_users:
@@ -134,42 +157,19 @@ class VideoBot:
 
         @self.dp.message(Command(commands=['urlbase']))
         async def url_base_command(message: types.Message):
-            try:
-                history = self.video_handler.db.get_all_history(30)
-                
-                if not history:
-                    await message.reply("📭 История запросов пуста")
-                    return
-                    
-                response = "📊 История обработки URL:\n\n"
-                for entry in history:
-                    username, url, status, error, timestamp = entry
-                    status_emoji = "✅" if status == "success" else "❌"
-                    
-                    entry_text = f"{status_emoji} @{username}\n"
-                    entry_text += f"🔗 {url}\n"
-                    entry_text += f"📅 {timestamp}\n"
-                    
-                    if error:
-                        entry_text += f"⚠️ Ошибка: {error}\n"
-                        
-                    entry_text += "➖➖➖➖➖➖➖➖\n"
-                    
-                    if len(response + entry_text) > 4000:
-                        await message.reply(response)
-                        response = entry_text
-                    else:
-                        response += entry_text
-                
-                if response:
-                    await message.reply(response)
-                    
-            except Exception as e:
-                error_msg = f"❌ Ошибка при получении истории: {str(e)}"
-                logger.error(error_msg)
-                await message.reply(error_msg)
+            await self.admin_handler.handle_urlbase(message)
 
-        
+        @self.dp.callback_query(lambda c: c.data and c.data.startswith('urlb:'))
+        async def url_base_page_handler(callback_query: types.CallbackQuery):
+            await self.admin_handler.handle_urlbase_page(callback_query)
+
+        @self.dp.message(Command(commands=['stats']))
+        async def stats_command(message: types.Message):
+            await self.admin_handler.handle_stats(message)
+
+        @self.dp.message(Command(commands=['perf']))
+        async def perf_command(message: types.Message):
+            await self.admin_handler.handle_perf(message)
 
         @self.dp.message(Command(commands=['tts']))
         async def tts_command(message: types.Message, state: FSMContext):
@@ -220,12 +220,23 @@ class VideoBot:
     async def stop(self):
         """Корректное завершение работы бота"""
         try:
+            # Фоновые циклы пишут в БД и хранилище - останавливаем их до закрытия
+            for task in self.background_tasks:
+                task.cancel()
+            await asyncio.gather(*self.background_tasks, return_exceptions=True)
+            self.background_tasks = []
+
             # Очистка временных файлов
             await self.file_manager.cleanup_on_shutdown()
             
             # Закрываем сессию видео хэндлера
             await self.video_handler.close_session()
             
+            await self.storage.close()
+            await self.metrics_server.stop()
+            self.watchdog.stop()
+            await MetricsRegistry().flush()
+            
             # Закрываем сессию бота
             if hasattr(self.bot, 'session'):
                 await self.bot.session.close()
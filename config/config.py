@@ -22,6 +22,75 @@ SUPPORTED_LANGUAGES = ['ru', 'en', 'zh']
 # Настройки базы данных
 DB_FILE = "bot_database.db"
 
+DATABASE_CONFIG = {
+    'BATCH_SIZE': 200,          # Максимум записей в одной транзакции
+    'FLUSH_INTERVAL': 0.5,      # Сколько ждать накопления пачки (сек)
+    'BUSY_TIMEOUT_MS': 5000,    # Ожидание блокировки другими соединениями
+    'RETENTION_DAYS': int(os.getenv("URL_LOG_RETENTION_DAYS", "7")),  # Срок хранения url_logs
+    'RETENTION_BATCH': 5000,    # Строк за одну транзакцию удаления
+    'RETENTION_PAUSE': 0.05,    # Пауза между пачками (сек)
+    'RETENTION_INTERVAL': 3600, # Период фоновой очистки (сек)
+    'ROLLUP_BATCH': 100000,     # Строк url_logs за одну транзакцию сводки
+    'ROLLUP_INTERVAL': 60,      # Период обновления сводок (сек)
+    'HISTORY_PAGE_SIZE': 10,    # Записей на странице /urlbase
+}
+
+# Кэш транскрипций: поиск того же аудио по отпечатку, устойчивому к перекодированию
+TRANSCRIPT_CACHE_CONFIG = {
+    'FINGERPRINT_SECONDS': 600,   # Отпечаток строится по началу аудио такой длины (сек)
+    'MAX_PROBES': 1000,           # Суботпечатков запроса для поиска кандидатов по индексу
+    'MAX_CANDIDATES': 5,          # Кандидатов на проверку по доле различающихся бит
+    'MAX_BIT_ERROR': 0.3,         # Доля различающихся бит, ниже которой аудио считается тем же
+    'MIN_OVERLAP': 0.8,           # Минимальное перекрытие отпечатков после выравнивания
+    'DURATION_TOLERANCE': 0.05,   # Допустимая разница длительностей (доля, но не меньше 3 с)
+    'PERSIST_DAYS': 30,           # Сколько хранить транскрипции и их отпечатки
+}
+
+# FSM хранилище (общий файл SQLite можно указать нескольким процессам бота)
+FSM_STORAGE_CONFIG = {
+    'DB_FILE': os.getenv("FSM_DB_FILE", DB_FILE),
+    'TTL': int(os.getenv("FSM_TTL_SECONDS", str(6 * 3600))),  # Сессия без изменений дольше - удаляется
+    'EVICT_INTERVAL': 600,      # Период очистки (сек)
+    'BUSY_TIMEOUT_MS': 5000,
+    'FILE_KEYS': ('video_path', 'audio_path', 'wav_path'),  # Файлы брошенной сессии
+}
+
+# Реестр метрик процесса
+METRICS_CONFIG = {
+    'SNAPSHOT_FILE': "monitoring_stats.json",
+    'FLUSH_INTERVAL': 60,         # Период сохранения снимка (сек)
+    'ERRORS_PER_SERVICE': 50,     # Последних ошибок на сервис
+    'LAG_PROBE_INTERVAL': 0.5,    # Период замера задержки event loop (сек)
+    # HTTP /metrics и /healthz; без METRICS_PORT сервер не запускается
+    'HTTP_HOST': os.getenv("METRICS_HOST", "127.0.0.1"),
+    'HTTP_PORT': int(os.getenv("METRICS_PORT", "0")),
+    'HEALTH_MAX_LAG': 2.0,        # Задержка event loop, при которой /healthz отвечает 503 (сек)
+}
+
+# Сторож event loop: поиск блокирующих вызовов в корутинах
+WATCHDOG_CONFIG = {
+    'ENABLED': os.getenv("LOOP_WATCHDOG", "1") != "0",
+    'THRESHOLD': float(os.getenv("LOOP_STALL_THRESHOLD", "0.25")),  # Зависание дольше - записывается (сек)
+    'BEAT_INTERVAL': 0.05,      # Период пульса event loop (сек)
+    'SAMPLE_INTERVAL': 0.05,    # Период проверки и снимков стека во время зависания (сек)
+    'STACK_DEPTH': 15,          # Кадров стека в логе
+    'MAX_SITES': 200,           # Разных мест вызова в метриках, остальные - 'other'
+}
+
+# Трассировка задач (этапы от запроса до отправки) и команда /perf
+TRACE_CONFIG = {
+    'SAMPLE_RATE': float(os.getenv("TRACE_SAMPLE_RATE", "0.1")),  # Доля трасс для перцентилей
+    'SLOW_SECONDS': 60,         # Трассы дольше сохраняются всегда (как и ошибки)
+    'OPEN_TTL': 6 * 3600,       # Незавершенная трасса закрывается как брошенная (сек)
+    'MAX_SPANS': 200,           # Спанов в одной трассе
+    'RETENTION_DAYS': 14,       # Срок хранения трасс
+    'PERF_WINDOW_HOURS': 24,    # Окно /perf по умолчанию
+    'PERF_SLOWEST': 5,          # Самых медленных задач в /perf
+}
+
+# Telegram ID администраторов через запятую; пусто - команды доступны всем
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").split(",") if x.strip()}
+
 # Таймауты и повторы
 RETRY_COUNT = 5
 DOWNLOAD_TIMEOUT = 60
@@ -85,12 +154,83 @@ PROXY_TTS = os.getenv("PROXY_TTS_1")
 
 ELEVENLABS_API_KEY = os.getenv("API_ELEVENLABS")
 
+ELEVENLABS_STT_CONFIG = {
+    'BASE_URL': os.getenv("ELEVENLABS_BASE_URL", "https://api.elevenlabs.io/v1"),
+    'UPLOAD_CODEC': os.getenv("ELEVENLABS_STT_CODEC", "opus"),  # opus, flac или wav
+    'OPUS_BITRATE': '32k',       # Битрейт Opus для речи
+    'MAX_CONCURRENT_REQUESTS': int(os.getenv("ELEVENLABS_STT_CONCURRENCY", "3")),
+    'SPLIT_LONG_AUDIO': os.getenv("ELEVENLABS_STT_SPLIT", "true").lower() == "true",
+    'CHUNK_DURATION': 600,       # Длительность части при разбиении длинного аудио (сек)
+    'REQUEST_TIMEOUT': 600,      # Таймаут одного запроса (сек)
+    'MAX_DURATION': int(os.getenv("ELEVENLABS_STT_MAX_DURATION", "0")),  # 0 - без ограничения
+}
+
+# Хеджирование распознавания: off - по очереди, deadline - локальный движок
+# стартует через HEDGE_DELAY секунд, parallel - оба движка сразу
+STT_HEDGE_CONFIG = {
+    'MODE': os.getenv("STT_HEDGE_MODE", "off"),
+    'DELAY': float(os.getenv("STT_HEDGE_DELAY", "30")),
+}
+
+# Удаление пауз в аудио: numpy - векторизованный движок, pydub - исходный split_on_silence
+AUDIO_CONFIG = {
+    'SILENCE_ENGINE': os.getenv("SILENCE_ENGINE", "numpy"),
+    'MIN_SILENCE_LEN': 50,    # Минимальная длительность паузы (мс)
+    'SILENCE_THRESH': -50,    # Порог тишины (dBFS)
+    'KEEP_SILENCE': 50,       # Отступ тишины вокруг фрагментов (мс)
+    # Файлы больше порога обрабатываются потоково фильтром ffmpeg silenceremove
+    'STREAMING_THRESHOLD': int(os.getenv("SILENCE_STREAMING_THRESHOLD_MB", "50")) * 1024 * 1024,
+    'MP3_BITRATE': '128k',
+}
+
+# Планировщик медиа задач (ffmpeg, pydub, постпроцессоры yt-dlp)
+MEDIA_SCHEDULER_CONFIG = {
+    'CPU_BUDGET': int(os.getenv("MEDIA_CPU_BUDGET", "0")),          # 0 - по числу ядер
+    'THREADS_PER_ENCODE': int(os.getenv("MEDIA_ENCODE_THREADS", "0")),  # 0 - половина бюджета
+    'SHORT_CLIP_SECONDS': 120,     # Короче - приоритет интерактивных задач
+    'LONG_RENDER_SECONDS': 1200,   # Длиннее - в конец очереди
+    'AGING_SECONDS': int(os.getenv("MEDIA_AGING_SECONDS", "120")),  # Ожидание, за которое задача поднимается на класс
+}
+
+# Кэш результатов ffprobe
+MEDIA_PROBE_CONFIG = {
+    'MEMORY_ENTRIES': 512,     # Записей в памяти (LRU)
+    'PERSIST_DAYS': 30,        # Сколько хранить записи в базе
+}
+
+# Выбор профиля кодирования при ускорении видео
+ENCODER_CONFIG = {
+    'PROFILE': os.getenv("ENCODER_PROFILE", "auto"),  # auto, quality, balanced или fast
+    'QUALITY_MAX_WORK': 120,   # Максимум «секунд 1080p» для medium
+    'BALANCED_MAX_WORK': 900,  # Максимум «секунд 1080p» для veryfast
+    'TARGET_SIZE_MB': int(os.getenv("ENCODER_TARGET_SIZE_MB", "2000")),  # Лимит отправки через Pyrogram
+    'HD_MIN_KBPS': 2500,       # Ниже этого битрейта видео уменьшается до 720p
+    'UNCAPPED_KBPS': 8000,     # Выше этого битрейта maxrate не ограничивается
+    'TIMEOUT_MIN': 600,              # Минимальный таймаут кодирования (сек)
+    'TIMEOUT_REALTIME_FACTOR': 10,   # Таймаут - во сколько раз дольше длительности результата
+    'TIMEOUT_MAX': 4 * 3600,
+    # Длинные видео кодируются параллельно по сегментам между ключевыми кадрами. Выключено
+    # по умолчанию: выигрыш есть только при бюджете хотя бы на два кодирования одновременно,
+    # его нужно проверить bench_segmented_encode.py на своем сервере
+    'SEGMENTED': os.getenv("ENCODER_SEGMENTED", "false").lower() == "true",
+    'SEGMENTED_MIN_DURATION': int(os.getenv("ENCODER_SEGMENTED_MIN_DURATION", "600")),  # 0 - всегда
+    'SEGMENT_DURATION': 60,          # Целевая длина сегмента (сек)
+    'MAX_BATCH_COEFFICIENTS': 5,     # Сколько коэффициентов можно запросить за раз
+}
+
 TTS_CONFIG = {
-    'MAX_TEXT_LENGTH': 1000,  # Максимальная длина текста
+    'BASE_URL': os.getenv("ELEVENLABS_BASE_URL", "https://api.elevenlabs.io/v1"),
+    'MAX_TEXT_LENGTH': int(os.getenv("TTS_MAX_TEXT_LENGTH", "4096")),  # Максимальная длина текста (лимит сообщения Telegram)
+    'CHUNK_CHARS': 1000,      # Длина одного фрагмента синтеза
+    'MAX_CONCURRENT_REQUESTS': int(os.getenv("TTS_CONCURRENCY", "3")),
+    'OUTPUT_FORMAT': 'mp3_44100_128',  # Единый формат фрагментов для склейки без перекодирования
     'MAX_RETRIES': 3,         # Максимальное количество попыток
     'RETRY_DELAY': 2,         # Начальная задержка между попытками
     'REQUEST_TIMEOUT': 60,    # Таймаут запроса
     'RATE_LIMIT_DELAY': 5,    # Задержка при превышении лимита
+    'MODEL_ID': 'eleven_multilingual_v2',
+    'CACHE_DIR': 'tts_cache',  # Вне downloads: периодическая очистка его не трогает
+    'CACHE_MAX_BYTES': int(os.getenv("TTS_CACHE_MAX_MB", "500")) * 1024 * 1024,
 }
 
 
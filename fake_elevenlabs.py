@@ -0,0 +1,137 @@
+"""
+Локальная замена ElevenLabs API для офлайн тестов и бенчмарков.
+
+Запуск:
+    python fake_elevenlabs.py --port 8765 --latency 5 --error-rate 0.1
+
+Бот направляется на заглушку переменной окружения:
+    ELEVENLABS_BASE_URL=http://127.0.0.1:8765/v1
+"""
+import argparse
+import asyncio
+import random
+import time
+from typing import Dict, Tuple
+
+from aiohttp import web
+
+MB = 1024 * 1024
+
+
+class FakeElevenLabs:
+    """Заглушка ElevenLabs с настраиваемой задержкой и долей ошибок"""
+
+    def __init__(self, latency: float = 2.0, latency_per_mb: float = 0.5, error_rate: float = 0.0):
+        self.latency = latency
+        self.latency_per_mb = latency_per_mb
+        self.error_rate = error_rate
+        self.stats: Dict[str, float] = {
+            'stt_requests': 0,
+            'stt_bytes': 0,
+            'tts_requests': 0,
+            'tts_chars': 0,
+            'errors': 0,
+        }
+
+    async def _simulate(self, received_bytes: int) -> bool:
+        """Задержка ответа; False - запрос должен завершиться ошибкой"""
+        await asyncio.sleep(self.latency + self.latency_per_mb * received_bytes / MB)
+        if random.random() < self.error_rate:
+            self.stats['errors'] += 1
+            return False
+        return True
+
+    async def speech_to_text(self, request: web.Request) -> web.Response:
+        """POST /v1/speech-to-text: multipart с полем file"""
+        started = time.monotonic()
+        reader = await request.multipart()
+        received = 0
+        fields = {}
+        async for part in reader:
+            if part.name == 'file':
+                while True:
+                    chunk = await part.read_chunk()
+                    if not chunk:
+                        break
+                    received += len(chunk)
+            else:
+                fields[part.name] = await part.text()
+
+        self.stats['stt_requests'] += 1
+        self.stats['stt_bytes'] += received
+
+        if not await self._simulate(received):
+            return web.json_response({'detail': 'fake error'}, status=500)
+
+        # Синтетический текст: по слову на каждые 4 KB загруженного аудио
+        words_count = max(1, received // 4096)
+        words = [
+            {'text': f"слово{i}", 'start': i * 0.5, 'end': i * 0.5 + 0.4, 'type': 'word'}
+            for i in range(words_count)
+        ]
+        return web.json_response({
+            'language_code': fields.get('language_code'),
+            'text': ' '.join(word['text'] for word in words),
+            'words': words,
+            'fake_elapsed': time.monotonic() - started,
+        })
+
+    @staticmethod
+    def _fake_mp3(text: str) -> bytes:
+        """Синтетический MP3: тег ID3v2 и по кадру на каждые 10 символов"""
+        id3 = b'ID3\x04\x00\x00\x00\x00\x00\x0a' + b'\x00' * 10
+        frame = b'\xff\xfb\x90\x64' + b'\x00' * 413
+        return id3 + frame * max(1, len(text) // 10)
+
+    async def text_to_speech(self, request: web.Request) -> web.StreamResponse:
+        """POST /v1/text-to-speech/{voice_id}[/stream]: JSON с полем text"""
+        data = await request.json()
+        text = data.get('text', '')
+        self.stats['tts_requests'] += 1
+        self.stats['tts_chars'] += len(text)
+
+        audio = self._fake_mp3(text)
+        if not await self._simulate(0):
+            return web.json_response({'detail': 'fake error'}, status=500)
+
+        if not request.path.endswith('/stream'):
+            return web.Response(body=audio, content_type='audio/mpeg')
+
+        # Потоковый ответ: отдаем аудио частями с небольшими паузами
+        response = web.StreamResponse(headers={'Content-Type': 'audio/mpeg'})
+        await response.prepare(request)
+        for offset in range(0, len(audio), 16 * 1024):
+            await response.write(audio[offset:offset + 16 * 1024])
+            await asyncio.sleep(0.01)
+        await response.write_eof()
+        return response
+
+    def create_app(self) -> web.Application:
+        app = web.Application(client_max_size=2 * 1024 * MB)
+        app.router.add_post('/v1/speech-to-text', self.speech_to_text)
+        app.router.add_post('/v1/text-to-speech/{voice_id}', self.text_to_speech)
+        app.router.add_post('/v1/text-to-speech/{voice_id}/stream', self.text_to_speech)
+        return app
+
+
+async def start_fake_server(host: str = "127.0.0.1", port: int = 8765,
+                            **kwargs) -> Tuple[web.AppRunner, FakeElevenLabs]:
+    """Запуск заглушки внутри текущего event loop (для бенчмарков)"""
+    fake = FakeElevenLabs(**kwargs)
+    runner = web.AppRunner(fake.create_app())
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner, fake
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Заглушка ElevenLabs API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=2.0, help="Базовая задержка ответа, сек")
+    parser.add_argument("--latency-per-mb", type=float, default=0.5, help="Дополнительная задержка на MB, сек")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Доля запросов с ошибкой 500")
+    args = parser.parse_args()
+
+    fake = FakeElevenLabs(args.latency, args.latency_per_mb, args.error_rate)
+    web.run_app(fake.create_app(), host=args.host, port=args.port)
@@ -0,0 +1,279 @@
+import math
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiogram import types
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
+
+from config.config import setup_logging, ADMIN_IDS, DATABASE_CONFIG, TRACE_CONFIG
+from services.database import Database, PLATFORM_PATTERNS
+from services.loop_watchdog import LoopWatchdog
+
+logger = setup_logging(__name__)
+
+STATUS_CODES = {'s': 'success', 'e': 'error'}
+TRACE_STATUS_EMOJI = {'success': '✅', 'error': '❌', 'cancelled': '⛔', 'abandoned': '💤'}
+PERF_MAX_STAGES = 25
+PLATFORMS = {platform for platform, _ in PLATFORM_PATTERNS} | {'unknown'}
+
+
+class AdminHandler:
+    """
+    Команды администратора: /urlbase (история с постраничным просмотром), /stats
+    и /perf (перцентили этапов задач по трассам и блокировки event loop).
+
+    Страницы листаются по ключу (timestamp, id), курсор и фильтры передаются в
+    callback_data вида urlb:<o|n>:<timestamp>:<id>:<фильтры>, где o - к старым,
+    n - к новым, фильтры - u<user_id>.s<s|e>.p<платформа> через точку или «-».
+    """
+
+    def __init__(self, db: Database, watchdog: Optional[LoopWatchdog] = None):
+        self.db = db
+        self.watchdog = watchdog
+        self.page_size = DATABASE_CONFIG['HISTORY_PAGE_SIZE']
+
+    @staticmethod
+    def is_admin(user_id: int, allow_unset: bool = False) -> bool:
+        """
+        Без ADMIN_IDS доступен только /urlbase (allow_unset), как и до появления списка;
+        /stats и /perf показывают ID пользователей и места в коде и закрыты для всех
+        """
+        if not ADMIN_IDS:
+            return allow_unset
+        return user_id in ADMIN_IDS
+
+    @staticmethod
+    def percentile(sorted_values: List[float], fraction: float) -> float:
+        """Перцентиль по ближайшему рангу из отсортированного списка"""
+        index = max(0, min(len(sorted_values), math.ceil(fraction * len(sorted_values))) - 1)
+        return sorted_values[index]
+
+    @staticmethod
+    def parse_filters(args: List[str]) -> Dict[str, Any]:
+        """/urlbase [user <id>] [status success|error] [platform <имя>] - в любом порядке"""
+        filters = {}
+        for key, value in zip(args[::2], args[1::2]):
+            key, value = key.lower(), value.lower()
+            if key == 'user' and value.lstrip('-').isdigit():
+                filters['user_id'] = int(value)
+            elif key == 'status' and value in STATUS_CODES.values():
+                filters['status'] = value
+            elif key == 'platform' and value in PLATFORMS:
+                filters['platform'] = value
+            else:
+                raise ValueError(f"{key} {value}")
+        return filters
+
+    @staticmethod
+    def encode_filters(filters: Dict[str, Any]) -> str:
+        parts = []
+        if 'user_id' in filters:
+            parts.append(f"u{filters['user_id']}")
+        if 'status' in filters:
+            parts.append(f"s{filters['status'][0]}")
+        if 'platform' in filters:
+            parts.append(f"p{filters['platform']}")
+        return '.'.join(parts) or '-'
+
+    @staticmethod
+    def decode_filters(encoded: str) -> Dict[str, Any]:
+        filters = {}
+        for part in encoded.split('.'):
+            if part.startswith('u'):
+                filters['user_id'] = int(part[1:])
+            elif part.startswith('s'):
+                filters['status'] = STATUS_CODES[part[1:]]
+            elif part.startswith('p'):
+                filters['platform'] = part[1:]
+        return filters
+
+    def _render(self, rows: List[tuple], filters: Dict[str, Any]) -> str:
+        parts = ["📊 История обработки URL"]
+        if filters:
+            parts.append(" (" + ", ".join(f"{key}={value}" for key, value in filters.items()) + ")")
+        parts.append(":\n\n")
+
+        for _, user_id, username, url, timestamp, status, error, platform in rows:
+            status_emoji = "✅" if status == "success" else "❌"
+            parts.append(f"{status_emoji} @{username or user_id} · {platform or 'unknown'}\n")
+            parts.append(f"🔗 {url[:300]}\n")
+            parts.append(f"📅 {datetime.fromtimestamp(timestamp):%Y-%m-%d %H:%M:%S}\n")
+            if error:
+                parts.append(f"⚠️ Ошибка: {error[:200]}\n")
+            parts.append("➖➖➖➖➖➖➖➖\n")
+        return "".join(parts)[:4096]
+
+    def _keyboard(self, rows: List[tuple], filters: Dict[str, Any],
+                  has_newer: bool, has_older: bool) -> Optional[InlineKeyboardMarkup]:
+        encoded = self.encode_filters(filters)
+        buttons = []
+        if has_newer:
+            first_id, first_ts = rows[0][0], rows[0][4]
+            buttons.append(InlineKeyboardButton(text="⬅️ Новее", callback_data=f"urlb:n:{first_ts}:{first_id}:{encoded}"))
+        if has_older:
+            last_id, last_ts = rows[-1][0], rows[-1][4]
+            buttons.append(InlineKeyboardButton(text="Старее ➡️", callback_data=f"urlb:o:{last_ts}:{last_id}:{encoded}"))
+        return InlineKeyboardMarkup(inline_keyboard=[buttons]) if buttons else None
+
+    async def _page(self, filters: Dict[str, Any], cursor: Optional[Tuple[int, int]],
+                    newer: bool) -> Tuple[List[tuple], bool, bool]:
+        """Строки страницы и наличие соседних страниц (лишняя строка вместо COUNT)"""
+        rows = await self.db.browse_history(filters, cursor, newer, self.page_size + 1)
+        more = len(rows) > self.page_size
+        if newer:
+            rows = rows[-self.page_size:]
+            return rows, more, True
+        rows = rows[:self.page_size]
+        return rows, cursor is not None, more
+
+    async def handle_urlbase(self, message: types.Message):
+        """Обработка команды /urlbase"""
+        if not self.is_admin(message.from_user.id, allow_unset=True):
+            return
+        try:
+            try:
+                filters = self.parse_filters(message.text.split()[1:])
+            except ValueError:
+                await message.reply(
+                    "❌ Формат: /urlbase [user <id>] [status success|error] "
+                    f"[platform {'|'.join(sorted(PLATFORMS))}]"
+                )
+                return
+
+            rows, has_newer, has_older = await self._page(filters, None, False)
+            if not rows:
+                await message.reply("📭 История запросов пуста")
+                return
+
+            await message.reply(
+                self._render(rows, filters),
+                reply_markup=self._keyboard(rows, filters, has_newer, has_older),
+                disable_web_page_preview=True
+            )
+
+        except Exception as e:
+            error_msg = f"❌ Ошибка при получении истории: {str(e)}"
+            logger.error(error_msg)
+            await message.reply(error_msg)
+
+    async def handle_urlbase_page(self, callback_query: types.CallbackQuery):
+        """Переход на соседнюю страницу /urlbase"""
+        if not self.is_admin(callback_query.from_user.id, allow_unset=True):
+            await callback_query.answer()
+            return
+        try:
+            _, direction, timestamp, row_id, encoded = callback_query.data.split(':', 4)
+            filters = self.decode_filters(encoded) if encoded != '-' else {}
+            newer = direction == 'n'
+
+            rows, has_newer, has_older = await self._page(filters, (int(timestamp), int(row_id)), newer)
+            if not rows:
+                await callback_query.answer("Больше записей нет")
+                return
+
+            await callback_query.answer()
+            await callback_query.message.edit_text(
+                self._render(rows, filters),
+                reply_markup=self._keyboard(rows, filters, has_newer, has_older),
+                disable_web_page_preview=True
+            )
+
+        except TelegramBadRequest as e:
+            logger.debug(f"Страница истории не изменилась: {e}")
+        except Exception as e:
+            logger.error(f"Ошибка при листании истории: {e}")
+            await callback_query.answer("❌ Ошибка при получении истории")
+
+    async def handle_stats(self, message: types.Message):
+        """Обработка команды /stats: сводка за сутки и неделю из url_stats_hourly"""
+        if not self.is_admin(message.from_user.id):
+            return
+        try:
+            await self.db.refresh_rollups()
+            now = int(time.time())
+            parts = ["📈 Статистика запросов\n"]
+            for title, seconds in (("24 часа", 86400), ("7 дней", 7 * 86400)):
+                rows = await self.db.get_stats(now - seconds)
+                total = sum(count for _, _, count in rows)
+                parts.append(f"\n🗓 За {title}: {total}\n")
+
+                by_platform: Dict[str, Dict[str, int]] = {}
+                for platform, status, count in rows:
+                    by_platform.setdefault(platform, {})[status] = count
+                for platform, statuses in sorted(by_platform.items(), key=lambda item: -sum(item[1].values())):
+                    parts.append(
+                        f"• {platform}: ✅ {statuses.get('success', 0)}  ❌ {statuses.get('error', 0)}\n"
+                    )
+            await message.reply("".join(parts))
+
+        except Exception as e:
+            error_msg = f"❌ Ошибка при получении статистики: {str(e)}"
+            logger.error(error_msg)
+            await message.reply(error_msg)
+
+    def _render_perf(self, hours: int, durations: List[tuple], slowest: List[tuple],
+                     spans: Dict[str, List[tuple]]) -> str:
+        by_stage: Dict[Tuple[str, str], List[float]] = {}
+        for name, platform, duration in durations:
+            by_stage.setdefault((name, platform or 'unknown'), []).append(duration)
+
+        parts = [f"⏱ Этапы задач за {hours} ч (выборка трасс)\n"]
+        if by_stage:
+            parts.append("этап · платформа: p50 / p95 / p99 (n)\n")
+        stages = sorted(by_stage.items(), key=lambda item: -sum(item[1]))[:PERF_MAX_STAGES]
+        for (name, platform), values in stages:
+            values.sort()
+            parts.append(
+                f"• {name} · {platform}: {self.percentile(values, 0.5):.1f} / "
+                f"{self.percentile(values, 0.95):.1f} / {self.percentile(values, 0.99):.1f} с ({len(values)})\n"
+            )
+        if not by_stage:
+            parts.append("Нет выборочных трасс за этот период\n")
+
+        if slowest:
+            parts.append("\n🐢 Самые долгие задачи:\n")
+        for trace_id, kind, platform, user_id, started_at, duration, status in slowest:
+            parts.append(
+                f"\n{TRACE_STATUS_EMOJI.get(status, '•')} {kind} · {platform} · {user_id} · "
+                f"{datetime.fromtimestamp(started_at):%m-%d %H:%M} · {duration:.1f} с\n"
+            )
+            for name, offset, span_duration, depth, span_status in spans.get(trace_id, []):
+                mark = " ❌" if span_status == 'error' else ""
+                parts.append(f"{'  ' * (depth + 1)}{name} +{offset:.1f} с: {span_duration:.1f} с{mark}\n")
+
+        blocking = self.watchdog.top_sites(5) if self.watchdog else []
+        if blocking:
+            parts.append("\n🧱 Блокировки event loop с запуска:\n")
+        for site, stats in blocking:
+            parts.append(
+                f"• {site}: {stats['count']} раз, всего {stats['total']:.1f} с, худшее {stats['worst']:.2f} с\n"
+            )
+        return "".join(parts)[:4096]
+
+    async def handle_perf(self, message: types.Message):
+        """Обработка команды /perf [часы]: перцентили этапов и самые долгие задачи"""
+        if not self.is_admin(message.from_user.id):
+            return
+        try:
+            args = message.text.split()[1:]
+            if args and not (args[0].isdigit() and int(args[0]) > 0):
+                await message.reply("❌ Формат: /perf [часы]")
+                return
+            hours = int(args[0]) if args else TRACE_CONFIG['PERF_WINDOW_HOURS']
+            since = int(time.time()) - hours * 3600
+
+            await self.db.flush()
+            durations = await self.db.get_span_durations(since)
+            slowest = await self.db.get_slowest_traces(since, TRACE_CONFIG['PERF_SLOWEST'])
+            spans: Dict[str, List[tuple]] = {}
+            for trace_id, *span in await self.db.get_trace_spans([row[0] for row in slowest]):
+                spans.setdefault(trace_id, []).append(tuple(span))
+
+            await message.reply(self._render_perf(hours, durations, slowest, spans))
+
+        except Exception as e:
+            error_msg = f"❌ Ошибка при получении трасс: {str(e)}"
+            logger.error(error_msg)
+            await message.reply(error_msg)
@@ -7,7 +7,6 @@ import asyncio
 import aiofiles
 from typing import Optional, List
 import yt_dlp
-from moviepy.editor import VideoFileClip
 from pyrogram import Client
 import os
 from os import path
@@ -17,7 +16,7 @@ import re
 from aiogram import Bot, types
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
-from aiogram.exceptions import TelegramRetryAfter
+from aiogram.exceptions import TelegramRetryAfter, TelegramBadRequest
 from config.config import BOT_TOKEN
 
 
@@ -35,6 +34,11 @@ from services.connection_manager import ConnectionManager
 from services.video_streaming import VideoStreamingService
 from services.chunk_uploader import ChunkUploader
 from services.video_speed import VideoSpeedService
+from services.message_editor import ThrottledMessageEditor
+from services.media_scheduler import MediaScheduler, YtDlpSchedulerHook
+from services.media_probe import MediaProbe
+from services.monitoring import MonitoringService, track_download
+from services.tracing import Tracer, span, record_span
 
 
 from pyrogram import Client
@@ -47,7 +51,7 @@ from typing import Dict, Set, Any
 import gc
 
 from config.config import setup_logging
-from config.config import ELEVENLABS_VOICES, API_ID, API_HASH
+from config.config import ELEVENLABS_VOICES, API_ID, API_HASH, TTS_CONFIG, ENCODER_CONFIG
 # Настройка логирования
 logger = setup_logging(__name__)
 
@@ -61,10 +65,15 @@ class VideoHandler:
         self.connection_manager = ConnectionManager("telegram_client")
         self.chunk_uploader = ChunkUploader()
         self.db = Database()
+        self.tracer = Tracer()
+        self.tracer.set_database(self.db)
         self.audio_handler = AudioHandler()
         
         self.downloads_dir = "downloads"  # Для скачанных видео
         self.video_speed_service = VideoSpeedService(self.downloads_dir)
+        self.media_scheduler = MediaScheduler()
+        self.monitoring = MonitoringService()
+        self.media_probe = MediaProbe()
         
         self.file_registry = {}
         self.bot = None  # Будет установлен позже
@@ -120,6 +129,9 @@ class VideoHandler:
         if self.connector:
             await self.connector.close()
             self.connector = None
+        await self.transcriber.close()
+        await self.tts_service.close()
+        self.db.close()
 
     def add_active_user(self, user_id: int) -> bool:
         """Добавление пользователя в активные с проверкой таймаута"""
@@ -924,6 +936,7 @@ class VideoHandler:
             raise
 
         # Вспомогательный метод для скачивания через yt-dlp
+    @track_download('yt-dlp')
     async def _download_with_ytdlp(self, url: str, output_path: str) -> bool:
         """Скачивание видео через yt-dlp"""
         headers = {
@@ -975,11 +988,18 @@ class VideoHandler:
             'sleep_interval_requests': 1,
         }
         
+        # Слияние и конвертация ffmpeg ждут очереди общего планировщика
         loop = asyncio.get_event_loop()
-        await loop.run_in_executor(
-            None,
-            lambda: yt_dlp.YoutubeDL(ydl_opts).download([url])
-        )
+        scheduler_hook = YtDlpSchedulerHook(self.media_scheduler, loop)
+        ydl_opts['postprocessor_hooks'] = [scheduler_hook]
+        ydl_opts['postprocessor_args'] = {'default': ['-threads', str(self.media_scheduler.encode_threads)]}
+        try:
+            await loop.run_in_executor(
+                None,
+                lambda: yt_dlp.YoutubeDL(ydl_opts).download([url])
+            )
+        finally:
+            scheduler_hook.release_all()
         
         # Проверяем, существует ли файл и не пустой ли он
         if os.path.exists(output_path) and os.path.getsize(output_path) > 0:
@@ -1029,20 +1049,25 @@ class VideoHandler:
         
         video_path = None
         status_message = None
+        service_type, url_to_process = 'unknown', message.text
+        trace = self.tracer.start('url', user_id)
         
         try:
             # Сначала сохраняем исходное сообщение в состояние
             await state.update_data(
-                original_message=message,
+                original_chat_id=message.chat.id,
+                original_message_id=message.message_id,
                 request_type='url'
             )
             
             # Определяем тип сервиса и извлекаем чистый URL
             service_type, url_to_process = self.get_service_type(message.text)
+            trace.platform = service_type
             status_message = await message.reply("⏳ Начинаю загрузку видео...")
             
             # Загружаем видео с использованием очищенного URL
-            video_path = await self.download_video(url_to_process, service_type)
+            with span("download"):
+                video_path = await self.download_video(url_to_process, service_type)
             
             # После успешной загрузки обновляем состояние
             await state.update_data(
@@ -1058,7 +1083,8 @@ class VideoHandler:
                         InlineKeyboardButton(text="🎯 Распознать", callback_data="action_recognize")
                     ],
                     [
-                        InlineKeyboardButton(text="⚡ Ускорить", callback_data="action_speedup")
+                        InlineKeyboardButton(text="⚡ Ускорить", callback_data="action_speedup"),
+                        InlineKeyboardButton(text="🎵 Аудио", callback_data="action_audio")
                     ]
                 ]
             )
@@ -1075,12 +1101,22 @@ class VideoHandler:
                 user_id=message.from_user.id,
                 username=message.from_user.username,
                 url=url_to_process,
-                status="success"
+                status="success",
+                platform=service_type
             )
 
         except Exception as e:
             error_msg = f"❌ Ошибка при обработке видео: {str(e)}"
             logger.error(error_msg)
+            self.db.log_url(
+                user_id=message.from_user.id,
+                username=message.from_user.username,
+                url=url_to_process,
+                status="error",
+                error_message=str(e)[:500],
+                platform=service_type
+            )
+            self.tracer.finish(user_id, 'error')
             
             if status_message:
                 await status_message.edit_text(error_msg)
@@ -1097,9 +1133,13 @@ class VideoHandler:
             # КРИТИЧЕСКОЕ ИСПРАВЛЕНИЕ: Всегда удаляем пользователя из активных
             self.remove_active_user(user_id)
 
-    async def _process_chinese_transcription(self, message: types.Message, state: FSMContext, status_message: types.Message):
+    async def _reply(self, chat_id: int, reply_to_message_id: Optional[int], text: str) -> types.Message:
+        """Ответ на исходное сообщение по ID из состояния (сами сообщения в FSM не храним)"""
+        return await self.bot.send_message(chat_id, text, reply_to_message_id=reply_to_message_id)
+
+    async def _process_chinese_transcription(self, chat_id: int, reply_to_message_id: int, user_id: int,
+                                             state: FSMContext, status_message: types.Message):
         """Обработка китайской транскрипции"""
-        user_id = message.from_user.id
         max_retries = 3
         retry_delay = 5
         
@@ -1111,8 +1151,16 @@ class VideoHandler:
             # Добавляем цикл повторных попыток
             for attempt in range(max_retries):
                 try:
-                    await status_message.edit_text(f"🎯 Распознаю речь на китайском... Попытка {attempt + 1}/{max_retries}")
-                    text = await self.transcriber.transcribe(audio_path, 'zh')
+                    header = f"🎯 Распознаю речь на китайском... Попытка {attempt + 1}/{max_retries}"
+                    await status_message.edit_text(header)
+                    # Частичные результаты показываем в том же статусном сообщении; редактор
+                    # останавливается и при ошибке, чтобы его отложенное обновление не затерло
+                    # статус следующей попытки
+                    editor = ThrottledMessageEditor(status_message, header=f"{header}\n\n")
+                    try:
+                        text = await self.transcriber.transcribe(audio_path, 'zh', on_partial=editor.update)
+                    finally:
+                        await editor.stop()
                     
                     if text:  # Если успешно получили текст, прерываем цикл
                         break
@@ -1141,27 +1189,31 @@ class VideoHandler:
                 
                 try:
                     # Отправляем видео с текстом
-                    await self.app.send_video(
-                        chat_id=message.chat.id,
-                        video=video_path,
-                        caption=f"{header}{text[:max_caption_length]}" if len(text) <= max_caption_length else f"{header}(текст будет отправлен отдельно)"
-                    )
+                    with self.monitoring.track_upload('pyrogram', video_path):
+                        await self.app.send_video(
+                            chat_id=chat_id,
+                            video=video_path,
+                            caption=f"{header}{text[:max_caption_length]}" if len(text) <= max_caption_length else f"{header}(текст будет отправлен отдельно)",
+                            **await self._video_attributes(video_path)
+                        )
 
                     # Если текст слишком длинный, отправляем его отдельно
                     if len(text) > max_caption_length:
                         for i in range(0, len(text), 4000):
                             chunk = text[i:i + 4000]
                             await asyncio.sleep(2)
-                            await message.reply(chunk)
+                            await self._reply(chat_id, reply_to_message_id, chunk)
 
                 except Exception as e:
                     raise Exception(f"Ошибка при отправке результата: {str(e)}")
             else:
-                await message.reply("❌ Не удалось распознать текст")
+                self.tracer.fail(user_id)
+                await self._reply(chat_id, reply_to_message_id, "❌ Не удалось распознать текст")
 
         except Exception as e:
             error_msg = f"❌ Ошибка при обработке китайского языка: {str(e)}"
             logger.error(error_msg)
+            self.tracer.fail(user_id)
             await status_message.edit_text(error_msg)
             
         finally:
@@ -1195,17 +1247,20 @@ class VideoHandler:
             
         try:
             await state.update_data(
-                original_message=message,
+                original_chat_id=message.chat.id,
+                original_message_id=message.message_id,
                 request_type='upload'
             )
             
             # Информируем о размере файла
             file_size_mb = message.video.file_size / (1024 * 1024)
+            self.tracer.start('video', user_id, 'telegram')
             status_message = await message.reply(
                 f"⏳ Начинаю обработку видео размером {file_size_mb:.1f} MB..."
             )
             
             try:
+                fetch_started = time.monotonic()
                 # Получаем информацию о файле из API
                 file = await self.bot.get_file(message.video.file_id)
                 logger.info(f"File object: {file}")
@@ -1246,6 +1301,7 @@ class VideoHandler:
                 actual_size = os.path.getsize(video_path)
                 if actual_size == 0:
                     raise ValueError("Загруженный файл пуст")
+                record_span("telegram_download", fetch_started, time.monotonic() - fetch_started)
                     
                 # Сохраняем путь к видео
                 await state.update_data(video_path=video_path)
@@ -1258,7 +1314,8 @@ class VideoHandler:
                             InlineKeyboardButton(text="🎯 Распознать", callback_data="action_recognize")
                         ],
                         [
-                            InlineKeyboardButton(text="⚡ Ускорить", callback_data="action_speedup")
+                            InlineKeyboardButton(text="⚡ Ускорить", callback_data="action_speedup"),
+                            InlineKeyboardButton(text="🎵 Аудио", callback_data="action_audio")
                         ]
                     ]
                 )
@@ -1280,6 +1337,7 @@ class VideoHandler:
         except Exception as e:
             error_msg = f"❌ Ошибка при обработке видео: {str(e)}"
             logger.error(error_msg)
+            self.tracer.finish(user_id, 'error')
             
             if status_message:
                 await status_message.edit_text(error_msg)
@@ -1406,6 +1464,7 @@ class VideoHandler:
             except TelegramRetryAfter as e:
                 current_retry += 1
                 retry_after = e.retry_after
+                self.monitoring.log_flood_wait('reply', retry_after)
                 await self.handle_flood_control(message, retry_after)
                 if current_retry == max_retries:
                     raise
@@ -1416,6 +1475,14 @@ class VideoHandler:
         file_id = None
         message_with_buttons = callback_query.message
         user_id = callback_query.from_user.id
+        editor = None
+        wav_path = None
+        
+        # Уточнение точной моделью идет в фоне и заменяет отправленный черновик
+        refine_task = None
+        draft_ready = asyncio.Event()
+        draft_holder = {}
+        trace = None
         
         try:
             if user_id in self.active_users:
@@ -1423,40 +1490,74 @@ class VideoHandler:
                 return
                     
             self.active_users.add(user_id)
+            trace = self.tracer.resume(user_id)
             await callback_query.answer()
                         
             data = await state.get_data()
             video_path = data.get('video_path')
             audio_path = data.get('audio_path')
             wav_path = data.get('wav_path')
-            original_message = data.get('original_message')
+            original_chat_id = data.get('original_chat_id')
+            original_message_id = data.get('original_message_id')
             request_type = data.get('request_type', 'url')
 
             # Регистрируем файл для очистки
             if video_path:
                 file_id = await self._register_file(video_path)
                 
-            if not all([original_message]) or not any([video_path, wav_path]):
+            if not all([original_chat_id]) or not any([video_path, wav_path]):
+                self.tracer.fail(user_id)
                 await message_with_buttons.edit_text("❌ Произошла ошибка: файлы не найдены") 
                 return
 
             lang = callback_query.data.split('_')[1]
             await message_with_buttons.edit_text(f"🎯 Распознаю речь на {lang}...")
+            
+            # Частичные результаты распознавания показываем по мере готовности
+            editor = ThrottledMessageEditor(
+                message_with_buttons,
+                header=f"🎯 Распознаю речь на {lang}...\n\n"
+            )
+
+            async def on_refined(refined_text: Optional[str]):
+                try:
+                    await draft_ready.wait()
+                    if refined_text and draft_holder.get('message'):
+                        await self._replace_transcript_draft(draft_holder['message'], lang, refined_text)
+                finally:
+                    if wav_path and os.path.exists(wav_path):
+                        os.remove(wav_path)
 
             text = None
             max_attempts = 3
-            for attempt in range(max_attempts):
-                try:
-                    text = await self.transcriber.transcribe(wav_path, lang)
-                    if text:
-                        break
-                    await asyncio.sleep(2)
-                except Exception as e:
-                    logger.error(f"Попытка {attempt + 1} распознавания не удалась: {e}")
-                    if attempt < max_attempts - 1:
+            with span("transcribe"):
+                for attempt in range(max_attempts):
+                    try:
+                        text, refine_task = await self.transcriber.transcribe_tiered(
+                            wav_path, lang, on_refined, on_partial=editor.update
+                        )
+                        if text:
+                            break
                         await asyncio.sleep(2)
+                    except Exception as e:
+                        logger.error(f"Попытка {attempt + 1} распознавания не удалась: {e}")
+                        if attempt < max_attempts - 1:
+                            await asyncio.sleep(2)
+            
+            await editor.finish("✅ Распознавание завершено, отправляю результат..." if text else None)
 
-            if text:
+            if text and refine_task:
+                # Черновик от быстрой модели; точный текст заменит его позже
+                if request_type == 'url' and video_path:
+                    with self.monitoring.track_upload('pyrogram', video_path):
+                        await self.app.send_video(
+                            chat_id=original_chat_id,
+                            video=video_path,
+                            caption=f"🎯 Распознанный текст ({lang}) отправлен отдельно",
+                            **await self._video_attributes(video_path)
+                        )
+                draft_holder['message'] = await self._send_transcript_draft(original_chat_id, lang, text)
+            elif text:
                 header = f"🎯 Распознанный текст ({lang}):\n\n"
                 if request_type == 'url' and video_path:
                     service_type = data.get('service_type', 'unknown')
@@ -1470,24 +1571,28 @@ class VideoHandler:
                         video_data = await video_file.read()
                         
                     if len(text) <= (1024 - len(header)):
-                        await self.app.send_video(
-                            chat_id=original_message.chat.id,
-                            video=video_path,
-                            caption=f"{header}{text}"
-                        )
+                        with self.monitoring.track_upload('pyrogram', video_path):
+                            await self.app.send_video(
+                                chat_id=original_chat_id,
+                                video=video_path,
+                                caption=f"{header}{text}",
+                                **await self._video_attributes(video_path)
+                            )
                     else:
                         # Используем тот же путь к файлу для второго случая
-                        await self.app.send_video(
-                            chat_id=original_message.chat.id,
-                            video=video_path,
-                            caption=f"{header}(текст будет отправлен отдельно)"
-                        )
+                        with self.monitoring.track_upload('pyrogram', video_path):
+                            await self.app.send_video(
+                                chat_id=original_chat_id,
+                                video=video_path,
+                                caption=f"{header}(текст будет отправлен отдельно)",
+                                **await self._video_attributes(video_path)
+                            )
                         # Отправляем текст отдельно
                         for i in range(0, len(text), 4000):
                             chunk = text[i:i + 4000]
                             await asyncio.sleep(2)
                             await self.app.send_message(
-                                chat_id=original_message.chat.id,
+                                chat_id=original_chat_id,
                                 text=chunk
                             )
                     
@@ -1499,21 +1604,31 @@ class VideoHandler:
                     for i in range(0, len(text), 4000):
                         chunk = text[i:i + 4000]
                         await asyncio.sleep(2)
-                        await original_message.reply(f"{header if i == 0 else ''}{chunk}")
+                        await self._reply(original_chat_id, original_message_id, f"{header if i == 0 else ''}{chunk}")
             else:
-                await original_message.reply("❌ Не удалось распознать текст")
+                self.tracer.fail(user_id)
+                await self._reply(original_chat_id, original_message_id, "❌ Не удалось распознать текст")
 
         except Exception as e:
             error_msg = f"❌ Ошибка: {str(e)}"
             logger.error(error_msg)
+            self.tracer.fail(user_id)
+            if editor:
+                await editor.stop()
             if message_with_buttons:
                 await message_with_buttons.edit_text(error_msg)
         finally:
+            if trace is not None:
+                self.tracer.finish(user_id)
+
+            # Фоновое уточнение само удалит wav после завершения
+            draft_ready.set()
+            
             # Очищаем все файлы независимо от результата
             if file_id:
                 await self.cleanup_files(file_id)
                 
-            if wav_path and os.path.exists(wav_path):
+            if not refine_task and wav_path and os.path.exists(wav_path):
                 try:
                     os.remove(wav_path)
                 except Exception as e:
@@ -1527,6 +1642,79 @@ class VideoHandler:
             
             self.active_users.discard(user_id)
 
+    async def _send_transcript_draft(self, chat_id: int, lang: str, text: str) -> types.Message:
+        """Отправка черновика транскрипции: сообщением, а длинного текста - документом"""
+        header = f"📝 Черновик ({lang}), уточняю распознавание...\n\n"
+        if len(header) + len(text) <= 4000:
+            return await self.bot.send_message(chat_id, f"{header}{text}")
+        return await self.bot.send_document(
+            chat_id,
+            types.BufferedInputFile(text.encode('utf-8'), filename=f"transcript_{lang}_draft.txt"),
+            caption=header.strip()
+        )
+
+    async def _replace_transcript_draft(self, draft_message: types.Message, lang: str, text: str):
+        """Замена черновика точным текстом в том же сообщении или документе"""
+        header = f"🎯 Распознанный текст ({lang}):\n\n"
+        try:
+            if draft_message.document is None and len(header) + len(text) <= 4000:
+                await draft_message.edit_text(f"{header}{text}")
+                return
+            
+            document = types.BufferedInputFile(text.encode('utf-8'), filename=f"transcript_{lang}.txt")
+            if draft_message.document is not None:
+                await draft_message.edit_media(
+                    types.InputMediaDocument(media=document, caption=header.strip())
+                )
+            else:
+                # Текстовое сообщение нельзя превратить в документ - отправляем новый и удаляем черновик
+                await self.bot.send_document(draft_message.chat.id, document, caption=header.strip())
+                await draft_message.delete()
+        except Exception as e:
+            logger.error(f"Ошибка при замене черновика транскрипции: {e}")
+
+    async def _send_audio_file(self, chat_id: int, audio_path: str, filename: str, caption: str) -> bool:
+        """Отправка аудио через Pyrogram (большие файлы) с запасным путем через бота"""
+        info = await self.media_probe.probe(audio_path)
+        duration = int(info['duration']) if info else 0
+        try:
+            with self.monitoring.track_upload('pyrogram', audio_path):
+                await self.app.send_audio(
+                    chat_id=chat_id,
+                    audio=audio_path,
+                    caption=caption,
+                    duration=duration,
+                    file_name=filename
+                )
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка при отправке аудио через Pyrogram: {e}")
+
+        try:
+            with self.monitoring.track_upload('bot_api', audio_path):
+                async with aiofiles.open(audio_path, 'rb') as audio_file:
+                    await self.bot.send_audio(
+                        chat_id=chat_id,
+                        audio=types.BufferedInputFile(await audio_file.read(), filename=filename),
+                        caption=caption,
+                        duration=duration or None
+                    )
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка при отправке аудио: {e}")
+            return False
+
+    async def _video_attributes(self, video_path: str) -> dict:
+        """Длительность и размеры кадра для Telegram из общего кэша ffprobe"""
+        info = await self.media_probe.probe(video_path)
+        if not info or not info['has_video']:
+            return {}
+        return {
+            'duration': int(info['duration']),
+            'width': info['width'],
+            'height': info['height'],
+        }
+
     async def send_video_safe(self, chat_id: int, video_path: str, caption: str = None):
         """Безопасная отправка видео с проверкой состояния клиента"""
         try:
@@ -1541,12 +1729,14 @@ class VideoHandler:
             logger.info(f"Отправка видео размером: {file_size/1024/1024:.2f} MB")
             
             # Отправляем видео
-            await self.app.send_video(
-                chat_id=chat_id,
-                video=video_path,
-                caption=caption,
-                progress=self._upload_progress
-            )
+            with self.monitoring.track_upload('pyrogram', video_path):
+                await self.app.send_video(
+                    chat_id=chat_id,
+                    video=video_path,
+                    caption=caption,
+                    progress=self._upload_progress,
+                    **await self._video_attributes(video_path)
+                )
             logger.info(f"Видео успешно отправлено: {video_path}")
             return True
             
@@ -1579,21 +1769,24 @@ class VideoHandler:
             form.add_field('chat_id', str(chat_id))
             if caption:
                 form.add_field('caption', caption)
+            for name, value in (await self._video_attributes(video_path)).items():
+                form.add_field(name, str(value))
 
             # Устанавливаем таймаут (10 минут на всю операцию)
             timeout = aiohttp.ClientTimeout(total=600)
 
             # Отправляем запрос с чанковой передачей
-            async with self.session.post(
-                f"/bot{BOT_TOKEN}/sendVideo",
-                data=form,
-                chunked=True,  # Включаем чанковую передачу
-                timeout=timeout
-            ) as response:
-                response.raise_for_status()
-                result = await response.json()
-                logger.info(f"Видео успешно отправлено: {video_path}")
-                return result
+            with self.monitoring.track_upload('local_server', video_path):
+                async with self.session.post(
+                    f"/bot{BOT_TOKEN}/sendVideo",
+                    data=form,
+                    chunked=True,  # Включаем чанковую передачу
+                    timeout=timeout
+                ) as response:
+                    response.raise_for_status()
+                    result = await response.json()
+            logger.info(f"Видео успешно отправлено: {video_path}")
+            return result
 
         except asyncio.TimeoutError:
             logger.error(f"Превышен таймаут при отправке видео: {video_path}")
@@ -1626,8 +1819,9 @@ class VideoHandler:
                 return
                 
             # Проверяем длину текста
-            if len(text) > 1000:
-                await message.reply("⚠️ Текст слишком длинный. Максимум 1000 символов.")
+            max_length = TTS_CONFIG['MAX_TEXT_LENGTH']
+            if len(text) > max_length:
+                await message.reply(f"⚠️ Текст слишком длинный. Максимум {max_length} символов.")
                 return
                 
             # Сохраняем текст в состояние
@@ -1681,20 +1875,36 @@ class VideoHandler:
             voice_config = ELEVENLABS_VOICES[voice_key]
             voice_name = voice_config["name"]
             
+            caption = f"🎤 Голос: {voice_name}\n📝 Текст: {text[:100]}{'...' if len(text) > 100 else ''}"
+
+            # Повтор уже доставленной озвучки отправляем по file_id: без API и без загрузки
+            cache_key = self.tts_service.cache_key(text, voice_config)
+            cached = self.tts_service.cache.get(cache_key)
+            if cached and cached['file_id']:
+                try:
+                    await callback_query.message.answer_audio(audio=cached['file_id'], caption=caption)
+                    await message.delete()
+                    return
+                except TelegramBadRequest as e:
+                    logger.warning(f"file_id озвучки больше не действителен: {e}")
+                    self.tts_service.cache.forget_file_id(cache_key)
+
             await message.edit_text(f"🎵 Генерирую аудио с голосом «{voice_name}»...")
             
-            # Получаем аудио и имя файла
-            audio_data, filename = await self.tts_service.text_to_speech(text, voice_config)
+            # Получаем путь к аудио и имя файла
+            audio_path, filename = await self.tts_service.text_to_speech(text, voice_config)
             
-            if audio_data and filename:
-                # Отправляем аудио с новым форматом
-                await callback_query.message.answer_audio(
-                    audio=types.BufferedInputFile(
-                        audio_data,
+            if audio_path and filename:
+                # Отправляем аудио с диска, не читая его в память
+                sent = await callback_query.message.answer_audio(
+                    audio=types.FSInputFile(
+                        audio_path,
                         filename=filename
                     ),
-                    caption=f"🎤 Голос: {voice_name}\n📝 Текст: {text[:100]}{'...' if len(text) > 100 else ''}"
+                    caption=caption
                 )
+                if sent.audio:
+                    self.tts_service.cache.set_file_id(cache_key, sent.audio.file_id)
                 await message.delete()
             else:
                 await message.edit_text("❌ Не удалось сгенерировать аудио")
@@ -1711,12 +1921,16 @@ class VideoHandler:
         message_with_buttons = callback_query.message
         user_id = callback_query.from_user.id
         file_id = None
+        # Трасса закрывается здесь, если задача не ждет следующего ответа пользователя
+        trace = None
+        awaiting_input = False
         
         try:
             if not self.add_active_user(user_id):
                 await callback_query.answer("⏳ Дождитесь окончания обработки")
                 return
                             
+            trace = self.tracer.resume(user_id)
             await callback_query.answer()
             
             if not self.app:
@@ -1724,21 +1938,24 @@ class VideoHandler:
             
             data = await state.get_data()
             video_path = data.get('video_path')
-            original_message = data.get('original_message')
+            original_chat_id = data.get('original_chat_id')
+            original_message_id = data.get('original_message_id')
             service_type = data.get('service_type', 'unknown')
             
-            if not all([video_path, original_message]):
+            if not all([video_path, original_chat_id]):
+                self.tracer.fail(user_id)
                 await message_with_buttons.edit_text("❌ Произошла ошибка: файлы не найдены")
                 return
             
-            # ИСПРАВЛЕНИЕ: Регистрируем файл ТОЛЬКО для download, не для speedup
-            if callback_query.data.split('_')[1] == 'download':
+            # ИСПРАВЛЕНИЕ: Регистрируем файл ТОЛЬКО для download и audio, не для speedup
+            if callback_query.data.split('_')[1] in ('download', 'audio'):
                 file_id = await self._register_file(video_path)
             
             action = callback_query.data.split('_')[1]
             
             if not os.path.exists(video_path):
                 logger.error(f"Файл не найден: {video_path}")
+                self.tracer.fail(user_id)
                 await message_with_buttons.edit_text("❌ Файл не найден")
                 return
             
@@ -1756,9 +1973,11 @@ class VideoHandler:
                     "1 = 1.01x (почти незаметно)\n"
                     "5 = 1.05x (умеренное ускорение)\n"
                     "10 = 1.10x (заметное ускорение)\n\n"
-                    "Просто отправьте число от 1 до 10"
+                    "Просто отправьте число от 1 до 10\n"
+                    f"Или несколько через пробел (до {ENCODER_CONFIG['MAX_BATCH_COEFFICIENTS']}), например: 3 5 10"
                 )
                 await state.set_state(VideoProcessing.WAITING_FOR_SPEED_COEFFICIENT)
+                awaiting_input = True
                 
                 logger.info(f"✅ Состояние установлено: {await state.get_state()}")
                 logger.info("=" * 60)
@@ -1780,7 +1999,7 @@ class VideoHandler:
                     
                     video_caption = f"✅ Видео успешно загружено\n📁 Имя файла: {filename}"
                     await self.send_video(
-                        chat_id=original_message.chat.id,
+                        chat_id=original_chat_id,
                         video_path=video_path,
                         caption=video_caption
                     )
@@ -1794,6 +2013,28 @@ class VideoHandler:
                     await message_with_buttons.edit_text(f"❌ Ошибка при отправке видео: {str(e)[:100]}")
                     raise
                         
+            elif action == 'audio':
+                await message_with_buttons.edit_text("🎵 Извлекаю аудиодорожку...")
+                
+                audio_path = await self.audio_handler.extract_audio_track(video_path)
+                if not audio_path:
+                    self.tracer.fail(user_id)
+                    await message_with_buttons.edit_text("❌ В видео нет звука или его не удалось извлечь")
+                    return
+                
+                try:
+                    filename = os.path.splitext(self.generate_video_filename(service_type))[0] + \
+                        os.path.splitext(audio_path)[1]
+                    if await self._send_audio_file(original_chat_id, audio_path, filename,
+                                                   "✅ Аудио из видео"):
+                        await message_with_buttons.delete()
+                    else:
+                        self.tracer.fail(user_id)
+                        await message_with_buttons.edit_text("❌ Ошибка при отправке аудио")
+                finally:
+                    if os.path.exists(audio_path):
+                        os.remove(audio_path)
+                        
             elif action == 'recognize':
                 wav_path = os.path.join(self.downloads_dir, f"{os.path.splitext(os.path.basename(video_path))[0]}.wav")
             
@@ -1803,6 +2044,7 @@ class VideoHandler:
                 
                 if not success:
                     logger.error(f"Не удалось извлечь аудио из {video_path} в {wav_path}")
+                    self.tracer.fail(user_id)
                     await message_with_buttons.edit_text("❌ Ошибка при извлечении аудио")
                     return
                 
@@ -1812,7 +2054,9 @@ class VideoHandler:
                 )
                                     
                 if service_type == 'kuaishou':
-                    await self._process_chinese_transcription(original_message, state, message_with_buttons)
+                    await self._process_chinese_transcription(
+                        original_chat_id, original_message_id, user_id, state, message_with_buttons
+                    )
                 else:
                     keyboard = InlineKeyboardMarkup(
                         inline_keyboard=[
@@ -1828,21 +2072,25 @@ class VideoHandler:
                         "🌍 Выберите язык видео:",
                         reply_markup=keyboard
                     )
+                    awaiting_input = True
                                 
         except Exception as e:
             error_msg = f"❌ Ошибка: {str(e)}"
             logger.error(error_msg)
+            self.tracer.fail(user_id)
             if message_with_buttons:
                 await message_with_buttons.edit_text(error_msg)
                         
         finally:
+            if trace is not None and not awaiting_input:
+                self.tracer.finish(user_id)
             # ИСПРАВЛЕНИЕ: Удаляем пользователя из активных ТОЛЬКО для download и recognize
             action = callback_query.data.split('_')[1]
             if action != 'speedup':
                 self.remove_active_user(user_id)
                 
-                # Очищаем файлы только для download
-                if action == 'download' and file_id:
+                # Очищаем файлы только для download и audio
+                if action in ('download', 'audio') and file_id:
                     await self.cleanup_files(file_id)
 
     async def handle_speed_coefficient_input(self, message: types.Message, state: FSMContext):
@@ -1854,131 +2102,152 @@ class VideoHandler:
         logger.info(f"📝 Текст сообщения: '{message.text}'")
         logger.info("=" * 60)
         
+        # Ошибку ввода пользователь исправит следующим сообщением - трасса остается открытой
+        trace = None
+        
         try:
             # НЕ ПРОВЕРЯЕМ активность - пользователь уже активен после нажатия кнопки
             
-            # Проверяем что это число
+            # Одно число или несколько через пробел/запятую
             try:
-                coefficient = int(message.text.strip())
-                logger.info(f"✅ Коэффициент распознан: {coefficient}")
+                coefficients = self._parse_speed_coefficients(message.text)
+                logger.info(f"✅ Коэффициенты распознаны: {coefficients}")
             except ValueError:
                 logger.warning(f"❌ Не удалось распознать число: {message.text}")
                 await message.reply(
                     "❌ Пожалуйста, отправьте число от 1 до 10\n"
-                    "Например: 5"
+                    "Например: 5 или 3 5 10"
                 )
                 return
             
-            if not 1 <= coefficient <= 10:
-                logger.warning(f"❌ Коэффициент вне диапазона: {coefficient}")
+            if not all(1 <= coefficient <= 10 for coefficient in coefficients):
+                logger.warning(f"❌ Коэффициент вне диапазона: {coefficients}")
                 await message.reply(
                     "❌ Число должно быть от 1 до 10\n"
                     "Попробуйте еще раз"
                 )
                 return
+
+            max_batch = ENCODER_CONFIG['MAX_BATCH_COEFFICIENTS']
+            if len(coefficients) > max_batch:
+                await message.reply(f"❌ Не больше {max_batch} коэффициентов за раз")
+                return
             
             data = await state.get_data()
             video_path = data.get('video_path')
             service_type = data.get('service_type', 'unknown')
+            trace = self.tracer.resume(user_id)
             
             logger.info(f"📁 Путь к видео из состояния: {video_path}")
             logger.info(f"🎬 Тип сервиса: {service_type}")
             
             if not video_path:
                 logger.error("❌ video_path отсутствует в состоянии!")
+                self.tracer.fail(user_id)
                 await message.reply("❌ Видео файл не найден в состоянии")
                 self.remove_active_user(user_id)
                 return
                 
             if not os.path.exists(video_path):
                 logger.error(f"❌ Файл не существует: {video_path}")
+                self.tracer.fail(user_id)
                 await message.reply("❌ Видео файл не найден на диске")
                 self.remove_active_user(user_id)
                 return
             
-            # Показываем статус
+            # Показываем статус с кнопкой отмены
+            job_id = f"{user_id}_{uuid.uuid4().hex[:8]}"
+            cancel_keyboard = InlineKeyboardMarkup(inline_keyboard=[[
+                InlineKeyboardButton(text="❌ Отменить", callback_data=f"speedcancel_{job_id}")
+            ]])
+            coefficients_text = ", ".join(f"1.{coefficient:02d}x" for coefficient in coefficients)
+            status_header = f"⚡ Ускоряю видео с коэффициентом {coefficients_text}...\n"
             status_message = await message.reply(
-                f"⚡ Ускоряю видео с коэффициентом 1.{coefficient:02d}x...\n"
-                f"Это может занять некоторое время..."
+                f"{status_header}Это может занять некоторое время...",
+                reply_markup=cancel_keyboard
+            )
+            progress_editor = ThrottledMessageEditor(
+                status_message, header=status_header, reply_markup=cancel_keyboard
             )
+
+            def on_progress(percent: float, eta: Optional[float]):
+                eta_text = f"\n⏱ Осталось примерно {self._format_eta(eta)}" if eta is not None else ""
+                progress_editor.update(f"⏳ Готово {percent:.0f}%{eta_text}")
             
             logger.info(f"🚀 Запускаем ускорение видео...")
             
-            # Ускоряем видео
-            processed_path = await self.video_speed_service.speed_up_video(
-                input_path=video_path,
-                speed_coefficient=coefficient,
-                keep_original=True
-            )
+            def on_queue_position(position: int):
+                progress_editor.update(
+                    f"🕒 Ожидание очереди: перед вами {position - 1}" if position > 1
+                    else "🕒 Вы следующий в очереди"
+                )
+
+            # Ускоряем видео; несколько коэффициентов - одним декодированием
+            try:
+                if len(coefficients) == 1:
+                    processed_path = await self.video_speed_service.speed_up_video(
+                        input_path=video_path,
+                        speed_coefficient=coefficients[0],
+                        keep_original=True,
+                        progress_callback=on_progress,
+                        job_id=job_id,
+                        on_queue_position=on_queue_position
+                    )
+                    processed = {coefficients[0]: processed_path} if processed_path else {}
+                else:
+                    processed = await self.video_speed_service.speed_up_video_batch(
+                        input_path=video_path,
+                        speed_coefficients=coefficients,
+                        keep_original=True,
+                        progress_callback=on_progress,
+                        job_id=job_id,
+                        on_queue_position=on_queue_position
+                    )
+            finally:
+                await progress_editor.stop()
             
-            logger.info(f"📤 Результат обработки: {processed_path}")
+            logger.info(f"📤 Результат обработки: {processed}")
+
+            if self.video_speed_service.pop_cancelled(job_id):
+                self.tracer.finish(user_id, 'cancelled')
+                await status_message.edit_text(
+                    "⛔ Ускорение отменено\n"
+                    "Можно отправить другой коэффициент от 1 до 10"
+                )
+                self.remove_active_user(user_id)
+                return
             
-            if not processed_path or not os.path.exists(processed_path):
+            processed = {c: p for c, p in processed.items() if p and os.path.exists(p)}
+            if not processed:
                 logger.error("❌ Обработанный файл не создан")
+                self.tracer.fail(user_id)
                 await status_message.edit_text("❌ Не удалось обработать видео")
                 self.remove_active_user(user_id)
                 return
             
-            # Проверяем размер
-            processed_size = os.path.getsize(processed_path)
-            processed_size_mb = processed_size / (1024 * 1024)
-            logger.info(f"✅ Обработанное видео: {processed_path} ({processed_size_mb:.2f} MB)")
-            
-            # Отправляем результат
+            # Отправляем результаты
             await status_message.edit_text("📤 Отправляю обработанное видео...")
             
             if not self.app:
                 await self.init_client()
             
-            filename = self.generate_video_filename(
-                service_type=service_type,
-                action=f'speed{coefficient}x'
-            )
-            
-            video_caption = (
-                f"✅ Видео ускорено в 1.{coefficient:02d}x\n"
-                f"📁 Имя файла: {filename}\n"
-                f"📦 Размер: {processed_size_mb:.1f} MB"
-            )
+            sent_all = True
+            for coefficient, processed_path in processed.items():
+                if not await self._send_speed_result(message, status_message, processed_path, coefficient, service_type):
+                    sent_all = False
             
-            try:
-                await self.app.send_video(
-                    chat_id=message.chat.id,
-                    video=processed_path,
-                    caption=video_caption
-                )
-                
-                logger.info(f"✅ Обработанное видео успешно отправлено")
+            if sent_all:
                 await status_message.delete()
-                
-            except Exception as send_error:
-                logger.error(f"❌ Ошибка при отправке через Pyrogram: {send_error}")
-                
-                try:
-                    await status_message.edit_text("📤 Пробую альтернативный способ отправки...")
-                    
-                    async with aiofiles.open(processed_path, 'rb') as video_file:
-                        await self.bot.send_video(
-                            chat_id=message.chat.id,
-                            video=types.BufferedInputFile(
-                                await video_file.read(),
-                                filename=filename
-                            ),
-                            caption=video_caption
-                        )
-                    
-                    await status_message.delete()
-                    logger.info(f"✅ Видео отправлено через fallback метод")
-                    
-                except Exception as fallback_error:
-                    logger.error(f"❌ Fallback также не сработал: {fallback_error}")
-                    await status_message.edit_text(f"❌ Не удалось отправить видео")
+            else:
+                self.tracer.fail(user_id)
+                await status_message.edit_text(f"❌ Не удалось отправить видео")
             
             # Очищаем файлы
             try:
-                if os.path.exists(processed_path):
-                    os.remove(processed_path)
-                    logger.info(f"🗑 Удален обработанный файл: {processed_path}")
+                for processed_path in processed.values():
+                    if os.path.exists(processed_path):
+                        os.remove(processed_path)
+                        logger.info(f"🗑 Удален обработанный файл: {processed_path}")
                 
                 if os.path.exists(video_path):
                     os.remove(video_path)
@@ -1993,11 +2262,97 @@ class VideoHandler:
         except Exception as e:
             error_msg = f"❌ Ошибка при ускорении видео: {str(e)}"
             logger.error(error_msg, exc_info=True)
+            self.tracer.fail(user_id)
             await message.reply(error_msg)
             
         finally:
+            if trace is not None:
+                self.tracer.finish(user_id)
             self.remove_active_user(user_id)
 
+    @staticmethod
+    def _parse_speed_coefficients(text: str) -> List[int]:
+        """'5', '3 5 10' или '3,5,10' -> отсортированные коэффициенты без повторов"""
+        tokens = [token for token in re.split(r'[\s,;]+', (text or '').strip()) if token]
+        if not tokens:
+            raise ValueError("пустой ввод")
+        return sorted({int(token) for token in tokens})
+
+    async def _send_speed_result(self, message: types.Message, status_message: types.Message,
+                                 processed_path: str, coefficient: int, service_type: str) -> bool:
+        """Отправка ускоренного видео через Pyrogram с запасным путем через бота"""
+        processed_size_mb = os.path.getsize(processed_path) / (1024 * 1024)
+        logger.info(f"✅ Обработанное видео: {processed_path} ({processed_size_mb:.2f} MB)")
+
+        filename = self.generate_video_filename(
+            service_type=service_type,
+            action=f'speed{coefficient}x'
+        )
+        
+        video_caption = (
+            f"✅ Видео ускорено в 1.{coefficient:02d}x\n"
+            f"📁 Имя файла: {filename}\n"
+            f"📦 Размер: {processed_size_mb:.1f} MB"
+        )
+        
+        try:
+            with self.monitoring.track_upload('pyrogram', processed_path):
+                await self.app.send_video(
+                    chat_id=message.chat.id,
+                    video=processed_path,
+                    caption=video_caption,
+                    **await self._video_attributes(processed_path)
+                )
+            logger.info(f"✅ Обработанное видео успешно отправлено")
+            return True
+            
+        except Exception as send_error:
+            logger.error(f"❌ Ошибка при отправке через Pyrogram: {send_error}")
+            
+        try:
+            await status_message.edit_text("📤 Пробую альтернативный способ отправки...")
+            
+            with self.monitoring.track_upload('bot_api', processed_path):
+                async with aiofiles.open(processed_path, 'rb') as video_file:
+                    await self.bot.send_video(
+                        chat_id=message.chat.id,
+                        video=types.BufferedInputFile(
+                            await video_file.read(),
+                            filename=filename
+                        ),
+                        caption=video_caption
+                    )
+            
+            logger.info(f"✅ Видео отправлено через fallback метод")
+            return True
+            
+        except Exception as fallback_error:
+            logger.error(f"❌ Fallback также не сработал: {fallback_error}")
+            return False
+
+    async def handle_speed_cancel(self, callback_query: types.CallbackQuery):
+        """Отмена ускорения видео по кнопке"""
+        job_id = callback_query.data[len('speedcancel_'):]
+        owner_id = job_id.split('_', 1)[0]
+
+        if str(callback_query.from_user.id) != owner_id:
+            await callback_query.answer("Отменить может только автор запроса")
+            return
+
+        if self.video_speed_service.cancel(job_id):
+            await callback_query.answer("⛔ Отменяю...")
+        else:
+            await callback_query.answer("Обработка уже завершена")
+
+    @staticmethod
+    def _format_eta(seconds: float) -> str:
+        seconds = int(max(seconds, 0))
+        if seconds >= 3600:
+            return f"{seconds // 3600} ч {seconds % 3600 // 60} мин"
+        if seconds >= 60:
+            return f"{seconds // 60} мин {seconds % 60} сек"
+        return f"{seconds} сек"
+
     async def _upload_progress(self, current, total, message):
         """Обновление прогресса отправки"""
         try:
@@ -2024,13 +2379,17 @@ class VideoHandler:
             
         self.active_users.add(user_id)
         await callback_query.answer()
+        self.tracer.resume(user_id)
+        awaiting_input = False
         
         try:
             data = await state.get_data()
             audio_path = data.get('audio_path')
-            original_message = data.get('original_message')
+            original_chat_id = data.get('original_chat_id')
+            original_message_id = data.get('original_message_id')
             
-            if not all([audio_path, original_message]):
+            if not all([audio_path, original_chat_id]):
+                self.tracer.fail(user_id)
                 await message_with_buttons.edit_text("❌ Файлы не найдены")
                 return
                 
@@ -2047,20 +2406,23 @@ class VideoHandler:
                 
                 if processed_path and os.path.exists(processed_path):
                     try:
-                        async with aiofiles.open(processed_path, 'rb') as audio_file:
-                            await self.bot.send_audio(
-                                chat_id=original_message.chat.id,
-                                audio=types.BufferedInputFile(
-                                    await audio_file.read(),
-                                    filename=processed_filename
-                                ),
-                                caption="✅ Паузы удалены"
-                            )
+                        with self.monitoring.track_upload('bot_api', processed_path):
+                            async with aiofiles.open(processed_path, 'rb') as audio_file:
+                                await self.bot.send_audio(
+                                    chat_id=original_chat_id,
+                                    audio=types.BufferedInputFile(
+                                        await audio_file.read(),
+                                        filename=processed_filename
+                                    ),
+                                    caption="✅ Паузы удалены"
+                                )
                         await message_with_buttons.delete()
                     except Exception as e:
                         logger.error(f"Ошибка при отправке обработанного аудио: {e}")
+                        self.tracer.fail(user_id)
                         await message_with_buttons.edit_text("❌ Ошибка при отправке обработанного аудио")
                 else:
+                    self.tracer.fail(user_id)
                     await message_with_buttons.edit_text("❌ Не удалось обработать аудио")
                     
             elif action == 'recognize':
@@ -2085,13 +2447,17 @@ class VideoHandler:
                     "🌍 Выберите язык аудио:",
                     reply_markup=keyboard
                 )
+                awaiting_input = True
                 
         except Exception as e:
             error_msg = f"❌ Ошибка при обработке аудио: {str(e)}"
             logger.error(error_msg)
+            self.tracer.fail(user_id)
             await message_with_buttons.edit_text(error_msg)
             
         finally:
+            if not awaiting_input:
+                self.tracer.finish(user_id)
             try:
                 if 'processed_path' in locals() and os.path.exists(processed_path):
                     os.remove(processed_path)
@@ -2114,15 +2480,18 @@ class VideoHandler:
         
         try:
             await state.update_data(
-                original_message=message,
+                original_chat_id=message.chat.id,
+                original_message_id=message.message_id,
                 request_type='audio'
             )
             
+            self.tracer.start('audio', user_id, 'telegram')
             status_message = await message.reply(
                 f"⏳ Начинаю обработку аудио..."
             )
 
             try:
+                fetch_started = time.monotonic()
                 # Получаем информацию о файле
                 file = await self.bot.get_file(message.audio.file_id)
                 logger.info(f"Получен файл: {file.file_path}")
@@ -2144,6 +2513,7 @@ class VideoHandler:
                 
                 if not os.path.exists(audio_path):
                     raise FileNotFoundError("Файл не был загружен")
+                record_span("telegram_download", fetch_started, time.monotonic() - fetch_started)
                 
                 await state.update_data(audio_path=audio_path)
                 
@@ -2174,6 +2544,7 @@ class VideoHandler:
         except Exception as e:
             error_msg = f"❌ Ошибка при обработке аудио: {str(e)}"
             logger.error(error_msg)
+            self.tracer.finish(user_id, 'error')
             
             if status_message:
                 await status_message.edit_text(error_msg)
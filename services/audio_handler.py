@@ -4,15 +4,84 @@ import os
 import logging
 from typing import Optional
 import asyncio
-from config.config import setup_logging
+from config.config import setup_logging, AUDIO_CONFIG
+from services.silence_remover import SilenceRemover
+from services.media_probe import MediaProbe
+from services.media_scheduler import MediaScheduler, KIND_AUDIO, KIND_REMUX, PRIORITY_INTERACTIVE
 
 logger = setup_logging(__name__)
 
 class AudioHandler:
+    # Контейнер для копирования дорожки без перекодирования: кодек -> (расширение, muxer)
+    COPY_CONTAINERS = {
+        'aac': ('.m4a', 'ipod'),
+        'alac': ('.m4a', 'ipod'),
+        'mp3': ('.mp3', 'mp3'),
+        'opus': ('.ogg', 'ogg'),
+        'vorbis': ('.ogg', 'ogg'),
+        'flac': ('.flac', 'flac'),
+    }
+
     def __init__(self):
         self.downloads_dir = "downloads"
+        self.config = AUDIO_CONFIG
+        self.scheduler = MediaScheduler()
+        self.probe = MediaProbe()
         os.makedirs(self.downloads_dir, exist_ok=True)
 
+    async def extract_audio_track(self, video_path: str) -> Optional[str]:
+        """
+        Аудиодорожка видео без декодирования (-c:a copy).
+
+        Контейнер выбирается по кодеку; редкие кодеки, которые Telegram не
+        проигрывает, перекодируются в AAC.
+
+        Returns:
+            Optional[str]: Путь к аудио или None, если звука нет или ffmpeg упал
+        """
+        info = await self.probe.probe(video_path)
+        if not info or not info['has_audio']:
+            logger.warning(f"В файле нет аудиодорожки: {video_path}")
+            return None
+
+        codec = info['audio_codec']
+        if codec in self.COPY_CONTAINERS:
+            extension, muxer = self.COPY_CONTAINERS[codec]
+            codec_args = ['-c:a', 'copy']
+        else:
+            extension, muxer = '.m4a', 'ipod'
+            codec_args = ['-c:a', 'aac', '-b:a', '192k']
+            logger.info(f"Кодек {codec} нельзя скопировать в m4a/ogg, перекодирую в AAC")
+
+        name = os.path.splitext(os.path.basename(video_path))[0]
+        output_path = os.path.join(self.downloads_dir, f"{name}_audio{extension}")
+        cmd = [
+            'ffmpeg', '-v', 'error',
+            '-i', video_path,
+            '-map', '0:a:0', '-vn', '-sn', '-dn',
+            *codec_args,
+            '-f', muxer,
+            '-y', output_path
+        ]
+
+        async with self.scheduler.slot(KIND_REMUX, PRIORITY_INTERACTIVE, label="audio copy"):
+            process = await asyncio.create_subprocess_exec(
+                *cmd,
+                stdout=asyncio.subprocess.DEVNULL,
+                stderr=asyncio.subprocess.PIPE
+            )
+            _, stderr = await process.communicate()
+
+        if process.returncode != 0 or not os.path.exists(output_path):
+            error_msg = stderr.decode('utf-8', errors='ignore') if stderr else "Неизвестная ошибка"
+            logger.error(f"Ошибка ffmpeg при извлечении дорожки: {error_msg}")
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            return None
+
+        logger.info(f"Аудиодорожка {codec} извлечена: {output_path}")
+        return output_path
+
     async def process_audio(self, file_path: str) -> Optional[str]:
         """Обработка аудио файла с удалением пауз"""
         try:
@@ -21,14 +90,19 @@ class AudioHandler:
                 f"processed_{os.path.basename(file_path)}"
             )
 
-            # Запускаем удаление пауз в отдельном потоке
-            loop = asyncio.get_event_loop()
-            await loop.run_in_executor(
-                None,
-                self._remove_silence,
-                file_path,
-                output_path
-            )
+            async with self.scheduler.slot(KIND_AUDIO, PRIORITY_INTERACTIVE, label="silence"):
+                if self._use_streaming(file_path):
+                    # Длинные записи не декодируем в память целиком
+                    await self._remove_silence_streaming(file_path, output_path)
+                else:
+                    # Запускаем удаление пауз в отдельном потоке
+                    loop = asyncio.get_event_loop()
+                    await loop.run_in_executor(
+                        None,
+                        self._remove_silence,
+                        file_path,
+                        output_path
+                    )
 
             if os.path.exists(output_path):
                 return output_path
@@ -38,23 +112,112 @@ class AudioHandler:
             logger.error(f"Ошибка при обработке аудио: {e}")
             return None
 
+    def _use_streaming(self, file_path: str) -> bool:
+        """Потоковый режим для файлов больше порога (pydub режим оставляем как есть)"""
+        if self.config['SILENCE_ENGINE'] == 'pydub':
+            return False
+        try:
+            return os.path.getsize(file_path) >= self.config['STREAMING_THRESHOLD']
+        except OSError:
+            return False
+
+    def _silenceremove_filter(self, min_silence_len: int, silence_thresh: int) -> str:
+        """
+        Параметры split_on_silence в терминах фильтра silenceremove:
+        паузы от min_silence_len мс с уровнем RMS ниже silence_thresh дБ вырезаются,
+        по краям фрагментов остается KEEP_SILENCE мс тишины
+        """
+        min_len = min_silence_len / 1000
+        keep = self.config['KEEP_SILENCE'] / 1000
+        return (
+            f"silenceremove="
+            f"start_periods=1:start_duration=0:start_threshold={silence_thresh}dB:start_silence={keep}:"
+            f"stop_periods=-1:stop_duration={min_len}:stop_threshold={silence_thresh}dB:stop_silence={keep}:"
+            f"detection=rms:window={min_len}"
+        )
+
+    async def _remove_silence_streaming(
+        self,
+        input_path: str,
+        output_path: str,
+        min_silence_len: Optional[int] = None,
+        silence_thresh: Optional[int] = None
+    ):
+        """Удаление пауз потоком ffmpeg: память не зависит от длины записи, сразу в mp3"""
+        min_silence_len = min_silence_len or self.config['MIN_SILENCE_LEN']
+        silence_thresh = silence_thresh or self.config['SILENCE_THRESH']
+
+        cmd = [
+            'ffmpeg', '-v', 'error',
+            '-i', input_path,
+            '-vn',
+            '-af', self._silenceremove_filter(min_silence_len, silence_thresh),
+            '-c:a', 'libmp3lame',
+            '-b:a', self.config['MP3_BITRATE'],
+            '-f', 'mp3',
+            '-y', output_path
+        ]
+
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.DEVNULL,
+            stderr=asyncio.subprocess.PIPE
+        )
+        _, stderr = await process.communicate()
+
+        if process.returncode != 0:
+            error_msg = stderr.decode('utf-8', errors='ignore') if stderr else "Неизвестная ошибка"
+            if os.path.exists(output_path):
+                os.remove(output_path)
+            logger.error(f"Ошибка ffmpeg при удалении пауз: {error_msg}")
+            raise RuntimeError(f"ffmpeg завершился с кодом {process.returncode}")
+
+        logger.info(f"Паузы удалены потоково: {input_path} -> {output_path}")
+
     def _remove_silence(
+        self,
+        input_path: str,
+        output_path: str,
+        min_silence_len: Optional[int] = None,
+        silence_thresh: Optional[int] = None
+    ):
+        """Удаление пауз из аудио"""
+        min_silence_len = min_silence_len or self.config['MIN_SILENCE_LEN']
+        silence_thresh = silence_thresh or self.config['SILENCE_THRESH']
+
+        if self.config['SILENCE_ENGINE'] == 'pydub':
+            return self._remove_silence_pydub(input_path, output_path, min_silence_len, silence_thresh)
+
+        try:
+            remover = SilenceRemover.from_file(input_path)
+            cleaned_audio = remover.remove_silence(
+                min_silence_len=min_silence_len,
+                silence_thresh=silence_thresh,
+                keep_silence=self.config['KEEP_SILENCE']
+            )
+            cleaned_audio.export(output_path, format="mp3")
+
+        except Exception as e:
+            logger.error(f"Ошибка при удалении пауз: {e}")
+            raise
+
+    def _remove_silence_pydub(
         self,
         input_path: str,
         output_path: str,
         min_silence_len: int = 50,
         silence_thresh: int = -50
     ):
-        """Удаление пауз из аудио"""
+        """Удаление пауз через pydub (медленный эталон для сравнения)"""
         try:
-            audio = AudioSegment.from_file(input_path)
+            audio = MediaProbe().load_audio(input_path)
             
             # Разделение на сегменты без тишины
             segments = split_on_silence(
                 audio,
                 min_silence_len=min_silence_len,
                 silence_thresh=silence_thresh,
-                keep_silence=50
+                keep_silence=self.config['KEEP_SILENCE']
             )
             
             # Соединение сегментов
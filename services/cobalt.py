@@ -10,6 +10,8 @@ import logging
 import asyncio
 import requests
 from config.config import setup_logging
+from services.monitoring import track_download
+from services.tracing import span
 
 logger = setup_logging(__name__)
 
@@ -44,14 +46,15 @@ class CobaltDownloader:
         """Асинхронное решение капчи"""
         try:
             loop = asyncio.get_event_loop()
-            result = await loop.run_in_executor(
-                None,
-                lambda: self.solver.turnstile(
-                    sitekey='0x4AAAAAAAhUvTuTxLs2HYH4',
-                    url='https://cobalt.tools/',
-                    action='submit'
+            with span("cobalt:captcha"):
+                result = await loop.run_in_executor(
+                    None,
+                    lambda: self.solver.turnstile(
+                        sitekey='0x4AAAAAAAhUvTuTxLs2HYH4',
+                        url='https://cobalt.tools/',
+                        action='submit'
+                    )
                 )
-            )
             logger.info(f"Капча успешно решена: {result['code'][:20]}...")
             return result['code']
         except Exception as e:
@@ -204,11 +207,13 @@ class CobaltDownloader:
                 os.remove(temp_path)
             return False
 
+    @track_download('cobalt')
     async def download_video(self, video_url: str) -> str:
         """Асинхронное скачивание видео"""
         try:
             logger.info(f"Получение информации о видео: {video_url}")
-            result = await self.process_video(video_url)
+            with span("cobalt:api"):
+                result = await self.process_video(video_url)
             
             if not result:
                 raise Exception("Пустой ответ от API")
@@ -225,10 +230,11 @@ class CobaltDownloader:
 
             # Используем синхронное скачивание через requests
             loop = asyncio.get_event_loop()
-            success = await loop.run_in_executor(None, 
-                                               self.download_video_sync,
-                                               download_url, 
-                                               output_path)
+            with span("cobalt:fetch"):
+                success = await loop.run_in_executor(None, 
+                                                   self.download_video_sync,
+                                                   download_url, 
+                                                   output_path)
             
             if not success:
                 raise Exception("Не удалось скачать файл")
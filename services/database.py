@@ -1,84 +1,526 @@
+import asyncio
+import queue
 import sqlite3
-from datetime import datetime
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+from config.config import setup_logging, DB_FILE, DATABASE_CONFIG, TRACE_CONFIG
+
+logger = setup_logging(__name__)
+
+# Маркер остановки потока записи
+_STOP = object()
+
+# PRAGMA user_version: 1 - целочисленные timestamp и индексы url_logs,
+# 2 - платформа и почасовые сводки, 3 - трассы задач
+SCHEMA_VERSION = 3
+
+# Платформа по подстроке URL, в том же порядке, что VideoHandler.get_service_type
+PLATFORM_PATTERNS = [
+    ('rednote', ('xhslink.com', 'xiaohongshu.com')),
+    ('pinterest', ('pinterest.com', 'pin.it')),
+    ('youtube', ('youtube.com', 'youtu.be')),
+    ('instagram', ('instagram.com', 'instagr.am')),
+    ('kuaishou', ('kuaishou.com',)),
+]
+
+HISTORY_COLUMNS = 'id, user_id, username, url, timestamp, status, error_message, platform'
+
+
+def detect_platform(url: str) -> str:
+    url_lower = (url or '').lower()
+    for platform, patterns in PLATFORM_PATTERNS:
+        if any(pattern in url_lower for pattern in patterns):
+            return platform
+    return 'unknown'
+
+
+def _platform_case_sql() -> str:
+    """detect_platform в виде CASE для заполнения старых записей"""
+    branches = []
+    for platform, patterns in PLATFORM_PATTERNS:
+        condition = ' OR '.join(f"url LIKE '%{pattern}%'" for pattern in patterns)
+        branches.append(f"WHEN {condition} THEN '{platform}'")
+    return f"CASE {' '.join(branches)} ELSE 'unknown' END"
+
 
 class Database:
-    def __init__(self, db_file="bot_database.db"):
+    """
+    Журнал запросов в SQLite без блокировки event loop.
+
+    Запись идет через очередь в отдельный поток с одним долгоживущим
+    соединением (WAL, synchronous=NORMAL): записи собираются в пачки и
+    фиксируются одной транзакцией. Чтение выполняется в своем потоке через
+    async-методы; WAL позволяет читать параллельно с записью. Данные из очереди
+    становятся видны чтению после фиксации пачки (см. flush).
+    """
+
+    def __init__(self, db_file: str = DB_FILE, config: dict = DATABASE_CONFIG):
         self.db_file = db_file
+        self.config = config
+        self._queue: "queue.Queue" = queue.Queue()
+        self._reader = ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-reader")
+        self._read_conn: Optional[sqlite3.Connection] = None
+        self._conn = self._connect()
         self.init_db()
+        self._writer = threading.Thread(target=self._writer_loop, name="db-writer", daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_file, check_same_thread=False)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.execute(f"PRAGMA busy_timeout={self.config['BUSY_TIMEOUT_MS']}")
+        return conn
 
     def init_db(self):
         """Инициализация БД с нужной структурой"""
-        conn = sqlite3.connect(self.db_file)
-        c = conn.cursor()
+        c = self._conn.cursor()
         c.execute('''
             CREATE TABLE IF NOT EXISTS url_logs (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 user_id INTEGER,
                 username TEXT,
                 url TEXT,
-                timestamp DATETIME,
+                timestamp INTEGER,
                 status TEXT,
                 error_message TEXT
             )
         ''')
-        conn.commit()
-        conn.close()
+        self._conn.commit()
+        self._migrate()
+
+    def _migrate(self):
+        """Миграции по PRAGMA user_version"""
+        version = self._conn.execute('PRAGMA user_version').fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+
+        if version < 1:
+            started = time.monotonic()
+            with self._conn:
+                # Старые записи - локальное время строкой (datetime.now()), переводим в unix time
+                self._conn.execute('''
+                    UPDATE url_logs SET timestamp = CAST(strftime('%s', timestamp, 'utc') AS INTEGER)
+                    WHERE typeof(timestamp) = 'text'
+                ''')
+                # ORDER BY timestamp DESC LIMIT читается с конца индекса без сортировки
+                self._conn.execute('CREATE INDEX IF NOT EXISTS idx_url_logs_timestamp ON url_logs(timestamp)')
+                self._conn.execute(
+                    'CREATE INDEX IF NOT EXISTS idx_url_logs_user_timestamp ON url_logs(user_id, timestamp)'
+                )
+                self._conn.execute('PRAGMA user_version = 1')
+            logger.info(f"Миграция url_logs до версии 1 за {time.monotonic() - started:.1f} с")
+
+        if version < 2:
+            started = time.monotonic()
+            with self._conn:
+                columns = [row[1] for row in self._conn.execute('PRAGMA table_info(url_logs)')]
+                if 'platform' not in columns:
+                    self._conn.execute('ALTER TABLE url_logs ADD COLUMN platform TEXT')
+                self._conn.execute(f'UPDATE url_logs SET platform = {_platform_case_sql()} WHERE platform IS NULL')
+                self._conn.execute(
+                    'CREATE INDEX IF NOT EXISTS idx_url_logs_status_timestamp ON url_logs(status, timestamp)'
+                )
+                self._conn.execute(
+                    'CREATE INDEX IF NOT EXISTS idx_url_logs_platform_timestamp ON url_logs(platform, timestamp)'
+                )
+                # Счетчики по часу, платформе и статусу; переживают очистку url_logs
+                self._conn.execute('''
+                    CREATE TABLE IF NOT EXISTS url_stats_hourly (
+                        hour INTEGER,
+                        platform TEXT,
+                        status TEXT,
+                        count INTEGER DEFAULT 0,
+                        PRIMARY KEY (hour, platform, status)
+                    ) WITHOUT ROWID
+                ''')
+                self._conn.execute('''
+                    CREATE TABLE IF NOT EXISTS rollup_state (
+                        name TEXT PRIMARY KEY,
+                        last_id INTEGER
+                    )
+                ''')
+                self._conn.execute('PRAGMA user_version = 2')
+            logger.info(f"Миграция url_logs до версии 2 за {time.monotonic() - started:.1f} с")
+
+        if version < 3:
+            with self._conn:
+                self._conn.execute('''
+                    CREATE TABLE IF NOT EXISTS job_traces (
+                        trace_id TEXT PRIMARY KEY,
+                        kind TEXT,
+                        platform TEXT,
+                        user_id INTEGER,
+                        started_at INTEGER,
+                        duration REAL,
+                        status TEXT,
+                        sampled INTEGER
+                    )
+                ''')
+                self._conn.execute('CREATE INDEX IF NOT EXISTS idx_job_traces_started_at ON job_traces(started_at)')
+                # Спаны повторяют started_at и sampled трассы, чтобы перцентили считались без JOIN
+                self._conn.execute('''
+                    CREATE TABLE IF NOT EXISTS job_spans (
+                        trace_id TEXT,
+                        name TEXT,
+                        platform TEXT,
+                        started_at INTEGER,
+                        start_offset REAL,
+                        duration REAL,
+                        depth INTEGER,
+                        status TEXT,
+                        sampled INTEGER
+                    )
+                ''')
+                self._conn.execute('CREATE INDEX IF NOT EXISTS idx_job_spans_trace_id ON job_spans(trace_id)')
+                self._conn.execute(
+                    'CREATE INDEX IF NOT EXISTS idx_job_spans_sampled_started_at ON job_spans(sampled, started_at)'
+                )
+                self._conn.execute('PRAGMA user_version = 3')
 
     def __enter__(self):
-        self.conn = sqlite3.connect(self.db_file)
         return self
-        
+
     def __exit__(self, exc_type, exc_val, exc_tb):
-        if hasattr(self, 'conn'):
-            self.conn.close()
-            
-    async def cleanup_old_records(self, days=7):
-        with sqlite3.connect(self.db_file) as conn:
-            c = conn.cursor()
-            c.execute('''
-                DELETE FROM url_logs  # было requests, исправлено на url_logs
-                WHERE timestamp < datetime('now', '-? days')
-            ''', (days,))
-            conn.commit()
-
-
-
-    def log_url(self, user_id: int, username: str, url: str, status: str, error_message: str = None):
-        """Логирование URL с результатом обработки"""
-        conn = sqlite3.connect(self.db_file)
-        c = conn.cursor()
-        c.execute('''
-            INSERT INTO url_logs (user_id, username, url, timestamp, status, error_message)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (user_id, username, url, datetime.now(), status, error_message))
-        conn.commit()
-        conn.close()
+        self.close()
+
+    # Запись
+
+    def _writer_loop(self):
+        """
+        Пачка - все, что пришло за FLUSH_INTERVAL после первой записи, но не больше
+        BATCH_SIZE; если кто-то ждет фиксации (flush), пачка пишется сразу.
+        """
+        batch_size = self.config['BATCH_SIZE']
+        interval = self.config['FLUSH_INTERVAL']
+        stopping = False
+
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            deadline = time.monotonic() + interval
+            while len(batch) < batch_size and batch[-1][2] is None:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            try:
+                self._write_batch(batch)
+            except Exception as e:
+                logger.error(f"Ошибка потока записи БД: {e}")
+                for _, _, done in batch:
+                    if done is not None and not done.done():
+                        done.set_exception(e)
+
+        self._conn.close()
+
+    def _apply(self, sql: Union[str, Callable, None], params: Sequence[Any]) -> Any:
+        if sql is None:
+            return 0
+        if callable(sql):
+            return sql(self._conn)
+        return self._conn.execute(sql, params).rowcount
+
+    def _write_batch(self, batch: List[Tuple[Union[str, Callable, None], Sequence[Any], Optional[Future]]]):
+        results: List[Any] = [0] * len(batch)
+        try:
+            with self._conn:
+                for i, (sql, params, _) in enumerate(batch):
+                    results[i] = self._apply(sql, params)
+        except Exception as e:
+            # Одна плохая запись не должна терять всю пачку: повторяем по одной,
+            # ошибка записи уходит в ее Future, поток записи продолжает работу
+            logger.error(f"Ошибка групповой записи ({len(batch)} записей): {e}")
+            for i, (sql, params, _) in enumerate(batch):
+                try:
+                    with self._conn:
+                        results[i] = self._apply(sql, params)
+                except Exception as item_error:
+                    logger.error(f"Ошибка записи в БД: {item_error}")
+                    results[i] = item_error
+
+        for (_, _, done), result in zip(batch, results):
+            if done is None or done.done():
+                continue
+            if isinstance(result, Exception):
+                done.set_exception(result)
+            else:
+                done.set_result(result)
+
+    def _enqueue(self, sql: Union[str, Callable, None], params: Sequence[Any] = (),
+                 done: Optional[Future] = None):
+        if not self._writer.is_alive():
+            if done is not None:
+                done.set_exception(RuntimeError("Поток записи БД остановлен"))
+            else:
+                logger.error("Поток записи БД остановлен, запись потеряна")
+            return
+        self._queue.put((sql, params, done))
+
+    async def execute(self, sql: Union[str, Callable[[sqlite3.Connection], Any]], params: Sequence[Any] = ()) -> Any:
+        """
+        Запись через поток записи с ожиданием фиксации; возвращает rowcount.
+        Вместо SQL можно передать функцию от соединения - она выполнится в той же транзакции.
+        """
+        done = Future()
+        self._enqueue(sql, params, done)
+        return await asyncio.wrap_future(done)
+
+    def pending_writes(self) -> int:
+        """Записей в очереди потока записи"""
+        return self._queue.qsize()
 
-    def get_user_history(self, user_id: int, limit: int = 10) -> list:
+    async def flush(self):
+        """Дождаться фиксации всего, что уже поставлено в очередь"""
+        done = Future()
+        self._enqueue(None, (), done)
+        await asyncio.wrap_future(done)
+
+    def close(self):
+        """Остановка потока записи с фиксацией оставшейся очереди"""
+        if self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join()
+        # Все, что осталось в очереди после остановки, уже не будет записано
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP and item[2] is not None and not item[2].done():
+                item[2].set_exception(RuntimeError("Поток записи БД остановлен"))
+        self._reader.shutdown(wait=True)
+        if self._read_conn is not None:
+            self._read_conn.close()
+            self._read_conn = None
+
+    # Чтение
+
+    def _read_sync(self, sql: str, params: Sequence[Any]) -> list:
+        if self._read_conn is None:
+            self._read_conn = self._connect()
+        return self._read_conn.execute(sql, params).fetchall()
+
+    async def fetch_all(self, sql: str, params: Sequence[Any] = ()) -> list:
+        return await asyncio.get_running_loop().run_in_executor(self._reader, self._read_sync, sql, params)
+
+    async def cleanup_old_records(self, days: Optional[int] = None) -> int:
+        """
+        Удаление записей старше days дней пачками по RETENTION_BATCH строк.
+
+        Каждая пачка - отдельная короткая транзакция в потоке записи, поэтому
+        log_url между пачками не ждет. Returns: сколько строк удалено.
+        """
+        days = days or self.config['RETENTION_DAYS']
+        batch = self.config['RETENTION_BATCH']
+        cutoff = int(time.time()) - days * 86400
+        total = 0
+        while True:
+            deleted = await self.execute('''
+                DELETE FROM url_logs WHERE id IN (
+                    SELECT id FROM url_logs WHERE timestamp < ? ORDER BY timestamp LIMIT ?
+                )
+            ''', (cutoff, batch))
+            total += deleted
+            if deleted < batch:
+                break
+            await asyncio.sleep(self.config['RETENTION_PAUSE'])
+        if total:
+            logger.info(f"Удалено {total} записей url_logs старше {days} дн.")
+        return total
+
+    async def cleanup_old_traces(self, days: int = TRACE_CONFIG['RETENTION_DAYS']) -> int:
+        """Удаление трасс старше days дней"""
+        cutoff = int(time.time()) - days * 86400
+
+        def _delete(conn: sqlite3.Connection) -> int:
+            conn.execute('DELETE FROM job_spans WHERE started_at < ?', (cutoff,))
+            return conn.execute('DELETE FROM job_traces WHERE started_at < ?', (cutoff,)).rowcount
+        return await self.execute(_delete)
+
+    async def retention_loop(self):
+        """Фоновая очистка url_logs и трасс"""
+        while True:
+            try:
+                await self.cleanup_old_records()
+                await self.cleanup_old_traces()
+            except Exception as e:
+                logger.error(f"Ошибка очистки url_logs: {e}")
+            await asyncio.sleep(self.config['RETENTION_INTERVAL'])
+
+    def log_url(self, user_id: int, username: str, url: str, status: str, error_message: str = None,
+                platform: str = None):
+        """Логирование URL с результатом обработки (не блокирует: запись уходит в очередь)"""
+        self._enqueue('''
+            INSERT INTO url_logs (user_id, username, url, timestamp, status, error_message, platform)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (user_id, username, url, int(time.time()), status, error_message, platform or detect_platform(url)))
+
+    async def get_user_history(self, user_id: int, limit: int = 10) -> list:
         """Получение истории запросов пользователя"""
-        conn = sqlite3.connect(self.db_file)
-        c = conn.cursor()
-        c.execute('''
-            SELECT url, status, error_message, timestamp 
-            FROM url_logs 
-            WHERE user_id = ? 
-            ORDER BY timestamp DESC 
+        return await self.fetch_all('''
+            SELECT url, status, error_message, timestamp
+            FROM url_logs
+            WHERE user_id = ?
+            ORDER BY timestamp DESC
             LIMIT ?
         ''', (user_id, limit))
-        result = c.fetchall()
-        conn.close()
-        return result
 
-    def get_all_history(self, limit: int = 30) -> list:
+    async def get_all_history(self, limit: int = 30) -> list:
         """Получение общей истории запросов"""
-        conn = sqlite3.connect(self.db_file)
-        c = conn.cursor()
-        c.execute('''
-            SELECT username, url, status, error_message, timestamp 
-            FROM url_logs 
-            ORDER BY timestamp DESC 
+        return await self.fetch_all('''
+            SELECT username, url, status, error_message, timestamp
+            FROM url_logs
+            ORDER BY timestamp DESC
             LIMIT ?
         ''', (limit,))
-        result = c.fetchall()
-        conn.close()
-        return result
\ No newline at end of file
+
+    async def browse_history(self, filters: Optional[Dict[str, Any]] = None,
+                             cursor: Optional[Tuple[int, int]] = None, newer: bool = False,
+                             limit: int = 10) -> List[tuple]:
+        """
+        Страница истории по ключу (timestamp, id) без OFFSET.
+
+        Args:
+            filters: user_id, status, platform - любые из них
+            cursor: (timestamp, id) крайней записи предыдущей страницы
+            newer: листать к новым записям (назад), иначе к старым
+        Returns:
+            До limit строк HISTORY_COLUMNS от новых к старым
+        """
+        conditions, params = [], []
+        for column in ('user_id', 'status', 'platform'):
+            value = (filters or {}).get(column)
+            if value is not None:
+                conditions.append(f"{column} = ?")
+                params.append(value)
+        if cursor:
+            conditions.append(f"(timestamp, id) {'>' if newer else '<'} (?, ?)")
+            params.extend(cursor)
+
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        order = "ASC" if newer else "DESC"
+        rows = await self.fetch_all(f'''
+            SELECT {HISTORY_COLUMNS} FROM url_logs
+            {where}
+            ORDER BY timestamp {order}, id {order}
+            LIMIT ?
+        ''', (*params, limit))
+        return rows[::-1] if newer else rows
+
+    # Сводки
+
+    def _rollup_step(self, conn: sqlite3.Connection) -> int:
+        """Добавляет в url_stats_hourly очередную порцию новых строк url_logs"""
+        row = conn.execute("SELECT last_id FROM rollup_state WHERE name = 'url_stats_hourly'").fetchone()
+        last_id = row[0] if row else 0
+        max_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM url_logs').fetchone()[0]
+        upper = min(max_id, last_id + self.config['ROLLUP_BATCH'])
+        if upper <= last_id:
+            return 0
+
+        conn.execute('''
+            INSERT INTO url_stats_hourly (hour, platform, status, count)
+            SELECT timestamp / 3600 * 3600, COALESCE(platform, 'unknown'), COALESCE(status, 'unknown'), COUNT(*)
+            FROM url_logs
+            WHERE id > ? AND id <= ?
+            GROUP BY 1, 2, 3
+            ON CONFLICT(hour, platform, status) DO UPDATE SET count = count + excluded.count
+        ''', (last_id, upper))
+        conn.execute('''
+            INSERT INTO rollup_state (name, last_id) VALUES ('url_stats_hourly', ?)
+            ON CONFLICT(name) DO UPDATE SET last_id = excluded.last_id
+        ''', (upper,))
+        return upper - last_id
+
+    async def refresh_rollups(self) -> int:
+        """Догоняет сводки пачками по ROLLUP_BATCH id; каждая пачка - своя транзакция"""
+        total = 0
+        while True:
+            processed = await self.execute(self._rollup_step)
+            total += processed
+            if processed < self.config['ROLLUP_BATCH']:
+                return total
+
+    async def rollup_loop(self):
+        """Фоновое обновление сводок"""
+        while True:
+            try:
+                await self.refresh_rollups()
+            except Exception as e:
+                logger.error(f"Ошибка обновления сводок url_logs: {e}")
+            await asyncio.sleep(self.config['ROLLUP_INTERVAL'])
+
+    async def get_stats(self, since: int) -> List[tuple]:
+        """(platform, status, count) с начала часа since; размер не зависит от url_logs"""
+        return await self.fetch_all('''
+            SELECT platform, status, SUM(count) FROM url_stats_hourly
+            WHERE hour >= ?
+            GROUP BY platform, status
+            ORDER BY SUM(count) DESC
+        ''', (since // 3600 * 3600,))
+
+    # Трассы задач
+
+    def save_trace(self, trace) -> None:
+        """Трасса и ее спаны одной записью в очередь (не блокирует)"""
+        started_at = int(trace.started_at)
+        spans = [
+            (trace.trace_id, span.name, trace.platform, started_at, span.offset, span.duration,
+             span.depth, span.status, int(trace.sampled))
+            for span in trace.spans
+        ]
+        row = (trace.trace_id, trace.kind, trace.platform, trace.user_id, started_at,
+               trace.duration, trace.status, int(trace.sampled))
+
+        def _insert(conn: sqlite3.Connection):
+            conn.execute('''
+                INSERT OR REPLACE INTO job_traces
+                (trace_id, kind, platform, user_id, started_at, duration, status, sampled)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+            ''', row)
+            conn.executemany('''
+                INSERT INTO job_spans
+                (trace_id, name, platform, started_at, start_offset, duration, depth, status, sampled)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', spans)
+        self._enqueue(_insert)
+
+    async def get_span_durations(self, since: int) -> List[tuple]:
+        """(name, platform, duration) выборочных трасс с момента since"""
+        return await self.fetch_all('''
+            SELECT name, platform, duration FROM job_spans
+            WHERE sampled = 1 AND started_at >= ?
+        ''', (since,))
+
+    async def get_slowest_traces(self, since: int, limit: int = 5) -> List[tuple]:
+        """(trace_id, kind, platform, user_id, started_at, duration, status) - самые долгие задачи"""
+        return await self.fetch_all('''
+            SELECT trace_id, kind, platform, user_id, started_at, duration, status FROM job_traces
+            WHERE started_at >= ?
+            ORDER BY duration DESC
+            LIMIT ?
+        ''', (since, limit))
+
+    async def get_trace_spans(self, trace_ids: Sequence[str]) -> List[tuple]:
+        """(trace_id, name, start_offset, duration, depth, status) в порядке начала"""
+        if not trace_ids:
+            return []
+        placeholders = ', '.join('?' for _ in trace_ids)
+        return await self.fetch_all(f'''
+            SELECT trace_id, name, start_offset, duration, depth, status FROM job_spans
+            WHERE trace_id IN ({placeholders})
+            ORDER BY trace_id, start_offset
+        ''', tuple(trace_ids))
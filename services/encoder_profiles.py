@@ -0,0 +1,173 @@
+import asyncio
+import os
+import sqlite3
+import time
+from dataclasses import dataclass, replace
+from typing import Dict, List, Optional
+
+from config.config import setup_logging, DB_FILE, ENCODER_CONFIG
+
+logger = setup_logging(__name__)
+
+
+@dataclass(frozen=True)
+class EncoderProfile:
+    """Набор параметров кодирования ffmpeg"""
+    name: str
+    preset: str
+    crf: int
+    audio_bitrate: str
+    threads: int = 0                  # 0 - ffmpeg выбирает сам
+    max_height: Optional[int] = None  # Уменьшение разрешения
+    maxrate_kbps: Optional[int] = None  # Ограничение битрейта под целевой размер
+
+    def video_args(self) -> List[str]:
+        args = ['-c:v', 'libx264', '-preset', self.preset, '-crf', str(self.crf)]
+        if self.maxrate_kbps:
+            args += ['-maxrate', f"{self.maxrate_kbps}k", '-bufsize', f"{self.maxrate_kbps * 2}k"]
+        if self.threads:
+            args += ['-threads', str(self.threads)]
+        return args
+
+    def audio_args(self) -> List[str]:
+        return ['-c:a', 'aac', '-b:a', self.audio_bitrate]
+
+    def scale_filter(self) -> Optional[str]:
+        """Фильтр уменьшения высоты с сохранением пропорций (ширина кратна 2)"""
+        if not self.max_height:
+            return None
+        return f"scale=-2:'min({self.max_height},ih)'"
+
+
+PROFILES: Dict[str, EncoderProfile] = {
+    'quality': EncoderProfile('quality', 'medium', 23, '192k'),
+    'balanced': EncoderProfile('balanced', 'veryfast', 23, '160k'),
+    'fast': EncoderProfile('fast', 'ultrafast', 26, '128k'),
+}
+
+
+class EncoderProfileSelector:
+    """
+    Выбор профиля кодирования по объему работы и текущей нагрузке.
+
+    Объем работы - длительность в «секундах 1080p» (длительность × пиксели / 1920×1080).
+    Короткие ролики на свободной машине кодируются качественно, длинные или
+    при очереди - быстрыми пресетами. Каждое кодирование записывается в
+    encode_stats, чтобы пороги можно было подобрать по реальной скорости.
+    """
+
+    def __init__(self, db_file: str = DB_FILE, config: dict = ENCODER_CONFIG):
+        self.db_file = db_file
+        self.config = config
+        self.cpu_count = os.cpu_count() or 1
+        self.init_db()
+
+    def init_db(self):
+        conn = sqlite3.connect(self.db_file)
+        c = conn.cursor()
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS encode_stats (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                created_at INTEGER,
+                profile TEXT,
+                preset TEXT,
+                crf INTEGER,
+                threads INTEGER,
+                max_height INTEGER,
+                duration REAL,
+                width INTEGER,
+                height INTEGER,
+                active_jobs INTEGER,
+                load REAL,
+                elapsed REAL,
+                speed REAL,
+                output_size INTEGER
+            )
+        ''')
+        conn.commit()
+        conn.close()
+
+    def current_load(self) -> float:
+        """Средняя загрузка за минуту на ядро (0 если недоступно)"""
+        try:
+            return os.getloadavg()[0] / self.cpu_count
+        except (AttributeError, OSError):
+            return 0.0
+
+    def choose(self, info: Optional[dict], active_jobs: int = 0, speed: float = 1.0,
+               outputs: int = 1) -> EncoderProfile:
+        """
+        Args:
+            info: Результат get_video_info (duration, width, height)
+            active_jobs: Количество кодирований, уже идущих параллельно
+            speed: Коэффициент ускорения: результат длится duration / speed
+            outputs: Сколько результатов кодируется из одного декодирования
+        """
+        forced = self.config['PROFILE']
+        if forced in PROFILES:
+            return PROFILES[forced]
+
+        info = info or {}
+        duration = info.get('duration') or 0
+        width = info.get('width') or 1920
+        height = info.get('height') or 1080
+        work = duration * outputs * (width * height) / (1920 * 1080)
+        load = self.current_load()
+
+        if work <= self.config['QUALITY_MAX_WORK'] and active_jobs == 0 and load < 0.5:
+            profile = PROFILES['quality']
+        elif work <= self.config['BALANCED_MAX_WORK'] and active_jobs < 2 and load < 1.0:
+            profile = PROFILES['balanced']
+        else:
+            profile = PROFILES['fast']
+
+        # Ядра делим между параллельными задачами; одна задача - на усмотрение ffmpeg
+        if active_jobs:
+            profile = replace(profile, threads=max(1, self.cpu_count // (active_jobs + 1)))
+
+        # Битрейт под целевой размер файла по длительности результата: видео получает остаток после аудио
+        target_mb = self.config['TARGET_SIZE_MB']
+        output_duration = duration / max(speed, 1.0)
+        if target_mb and output_duration > 0:
+            total_kbps = int(target_mb * 8 * 1024 / output_duration * 0.95)
+            audio_kbps = int(profile.audio_bitrate.rstrip('k'))
+            video_kbps = max(total_kbps - audio_kbps, 300)
+            if video_kbps < self.config['HD_MIN_KBPS'] and height > 720:
+                profile = replace(profile, max_height=720)
+            if video_kbps < self.config['UNCAPPED_KBPS']:
+                profile = replace(profile, maxrate_kbps=video_kbps)
+
+        logger.info(
+            f"Профиль кодирования {profile.name}: preset={profile.preset}, crf={profile.crf}, "
+            f"threads={profile.threads}, работа={work:.0f}, задач={active_jobs}, нагрузка={load:.2f}"
+        )
+        return profile
+
+    async def record(self, profile: EncoderProfile, info: Optional[dict], active_jobs: int,
+                     elapsed: float, output_size: int):
+        """Запись профиля и достигнутой скорости (секунд видео за секунду) в пуле потоков"""
+        info = info or {}
+        duration = info.get('duration') or 0
+        speed = duration / elapsed if elapsed > 0 else 0
+        row = (int(time.time()), profile.name, profile.preset, profile.crf, profile.threads,
+               profile.max_height, duration, info.get('width'), info.get('height'), active_jobs,
+               self.current_load(), elapsed, speed, output_size)
+        if await asyncio.get_running_loop().run_in_executor(None, self._write_stats, row):
+            logger.info(f"Кодирование {profile.name}: {elapsed:.1f} с, скорость x{speed:.2f}")
+
+    def _write_stats(self, row: tuple) -> bool:
+        try:
+            conn = sqlite3.connect(self.db_file)
+            try:
+                conn.execute('''
+                    INSERT INTO encode_stats (created_at, profile, preset, crf, threads, max_height, duration,
+                                              width, height, active_jobs, load, elapsed, speed, output_size)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', row)
+                conn.commit()
+            finally:
+                conn.close()
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка записи статистики кодирования: {e}")
+            return False
@@ -9,6 +9,7 @@ from typing import Optional, Dict, Tuple, Any
 from datetime import datetime
 from config.config import setup_logging
 from services.base_downloader import BaseDownloader
+from services.monitoring import track_download
 
 logger = setup_logging(__name__)
 
@@ -330,6 +331,7 @@ class InstagramDownloader(BaseDownloader):
             'is_live': False
         }
     
+    @track_download('instagram')
     async def download_video(self, url: str, output_path: str = None) -> Optional[str]:
         """Главный метод загрузки"""
         if not output_path:
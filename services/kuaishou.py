@@ -10,7 +10,7 @@ from typing import Optional, Dict, List
 from urllib3.util import Retry
 from requests.adapters import HTTPAdapter
 from fake_useragent import UserAgent
-from services.monitoring import MonitoringService
+from services.monitoring import MonitoringService, track_download
 import asyncio
 import re
 from dotenv import load_dotenv
@@ -236,6 +236,7 @@ class KuaishouDownloader:
         self.monitoring.log_api_call('kuaishou', 'get_video_info', False, "Все попытки не удались")
         return None
 
+    @track_download('kuaishou')
     async def download_video(self, url: str, output_path: str) -> Optional[str]:
         """Скачивание видео с сохранением URL в переменную"""
         self.current_video_url = None  # Сбрасываем URL перед началом новой загрузки
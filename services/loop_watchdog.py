@@ -0,0 +1,151 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+from config.config import setup_logging, WATCHDOG_CONFIG
+from services.monitoring import LAG_BUCKETS
+from services.metrics import MetricsRegistry
+
+logger = setup_logging(__name__)
+
+# Корень проекта: место вызова ищется среди кадров нашего кода, а не библиотек
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+class LoopWatchdog:
+    """
+    Поиск блокирующих вызовов в корутинах.
+
+    Event loop каждые BEAT_INTERVAL отмечает пульс; отдельный поток следит за
+    ним и, если пульса нет дольше THRESHOLD, снимает стек потока event loop
+    (sys._current_frames) каждые SAMPLE_INTERVAL до конца зависания. Место
+    вызова - самый глубокий кадр кода проекта; по каждому месту копятся число
+    зависаний, суммарное и худшее время - в метриках и в логе.
+    """
+
+    def __init__(self, config: dict = WATCHDOG_CONFIG):
+        self.config = config
+        self.sites: Dict[str, Dict] = {}
+        self._last_beat = time.monotonic()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._beat_handle: Optional[asyncio.TimerHandle] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+
+        registry = MetricsRegistry()
+        self.stalls = registry.counter('event_loop_stalls_total', 'Зависания event loop по месту вызова')
+        self.stall_seconds = registry.counter(
+            'event_loop_stall_seconds_total', 'Суммарное время зависаний по месту вызова')
+        self.stall_worst = registry.gauge('event_loop_stall_worst_seconds', 'Худшее зависание по месту вызова')
+        self.stall_duration = registry.histogram(
+            'event_loop_stall_duration_seconds', 'Длительность зависаний event loop', LAG_BUCKETS)
+
+    def start(self, loop: Optional[asyncio.AbstractEventLoop] = None):
+        """Вызывается из потока event loop"""
+        if not self.config['ENABLED'] or self._thread is not None:
+            return
+        self._loop = loop or asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._stop.clear()
+        self._beat()
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        logger.info(f"Сторож event loop запущен: порог {self.config['THRESHOLD']} с")
+
+    def stop(self):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        if self._beat_handle is not None:
+            self._beat_handle.cancel()
+            self._beat_handle = None
+
+    def _beat(self):
+        self._last_beat = time.monotonic()
+        self._beat_handle = self._loop.call_later(self.config['BEAT_INTERVAL'], self._beat)
+
+    # Поток сторожа: только снимки стека, учет передается в event loop
+
+    def _watch(self):
+        threshold = self.config['THRESHOLD']
+        samples: Counter = Counter()
+        stacks: Dict[str, List[str]] = {}
+        worst_lag = 0.0
+
+        while not self._stop.wait(self.config['SAMPLE_INTERVAL']):
+            lag = time.monotonic() - self._last_beat
+            if lag >= threshold:
+                site, stack = self._sample()
+                samples[site] += 1
+                stacks.setdefault(site, stack)
+                worst_lag = max(worst_lag, lag)
+            elif samples:
+                # Метрики и sites обновляются только в потоке event loop: реестр обходит
+                # свои словари при снимке без блокировок. Зависание уже закончилось,
+                # поэтому loop выполнит учет сразу
+                try:
+                    self._loop.call_soon_threadsafe(self._record_safe, worst_lag, samples, stacks)
+                except RuntimeError:
+                    # Event loop уже закрыт
+                    return
+                samples, stacks, worst_lag = Counter(), {}, 0.0
+
+    def _sample(self) -> Tuple[str, List[str]]:
+        frame = sys._current_frames().get(self._loop_thread_id)
+        if frame is None:
+            return 'unknown', []
+        summary = traceback.extract_stack(frame)[-self.config['STACK_DEPTH']:]
+        stack = [f"{entry.filename}:{entry.lineno} {entry.name}" for entry in summary]
+
+        # Самый глубокий кадр проекта (не site-packages) - место, которое надо исправить
+        site = None
+        for index in range(len(summary) - 1, -1, -1):
+            entry = summary[index]
+            path = os.path.abspath(entry.filename)
+            if path.startswith(PROJECT_ROOT) and 'site-packages' not in path:
+                callee = f" -> {summary[index + 1].name}" if index + 1 < len(summary) else ""
+                site = f"{os.path.relpath(path, PROJECT_ROOT)}:{entry.lineno} {entry.name}{callee}"
+                break
+        if site is None and summary:
+            site = f"{os.path.basename(summary[-1].filename)}:{summary[-1].lineno} {summary[-1].name}"
+        return site or 'unknown', stack
+
+    def _record_safe(self, duration: float, samples: Counter, stacks: Dict[str, List[str]]):
+        try:
+            self._record(duration, samples, stacks)
+        except Exception as e:
+            logger.error(f"Ошибка учета зависания event loop: {e}")
+
+    def _record(self, duration: float, samples: Counter, stacks: Dict[str, List[str]]):
+        """Зависание закончилось: место - то, что чаще всего попадалось в снимках"""
+        site = samples.most_common(1)[0][0]
+        if site not in self.sites and len(self.sites) >= self.config['MAX_SITES']:
+            site = 'other'
+
+        stats = self.sites.setdefault(site, {'count': 0, 'total': 0.0, 'worst': 0.0})
+        stats['count'] += 1
+        stats['total'] += duration
+        stats['worst'] = max(stats['worst'], duration)
+
+        self.stalls.inc(site=site)
+        self.stall_seconds.inc(duration, site=site)
+        self.stall_worst.set(stats['worst'], site=site)
+        self.stall_duration.observe(duration)
+
+        logger.warning(
+            f"Event loop заблокирован на {duration:.2f} с: {site} "
+            f"(раз: {stats['count']}, худшее: {stats['worst']:.2f} с)\n"
+            + "\n".join(f"  {line}" for line in stacks.get(site, []))
+        )
+
+    def top_sites(self, limit: int = 10) -> List[Tuple[str, Dict]]:
+        """Места вызова по суммарному времени зависаний - что исправлять первым"""
+        return sorted(self.sites.items(), key=lambda item: -item[1]['total'])[:limit]
@@ -0,0 +1,275 @@
+import asyncio
+import json
+import os
+import sqlite3
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+
+from pydub import AudioSegment
+from pydub.audio_segment import fix_wav_headers
+
+from config.config import setup_logging, DB_FILE, MEDIA_PROBE_CONFIG
+
+logger = setup_logging(__name__)
+
+PROBE_CMD = ['ffprobe', '-v', 'quiet', '-print_format', 'json', '-show_format', '-show_streams']
+
+# Глубина по формату отсчетов (без суффикса planar), как в pydub.utils.mediainfo_json
+SAMPLE_FMT_BITS = {'u8': 8, 's16': 16, 's32': 32, 's64': 64, 'flt': 32, 'dbl': 64}
+
+
+class MediaProbe:
+    """
+    Единый кэш результатов ffprobe для всех этапов обработки.
+
+    Ключ - (устройство, inode, размер, mtime): переименование файла не сбрасывает
+    кэш, перезапись - сбрасывает. Записи держатся в памяти (LRU) и в таблице
+    media_probe, чтобы пережить перезапуск для файлов, которые остаются на диске.
+    Вызывается и из event loop (probe), и из рабочих потоков (probe_sync);
+    probe обращается к базе через отдельный поток.
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(MediaProbe, cls).__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        self.config = MEDIA_PROBE_CONFIG
+        self.db_file = DB_FILE
+        self._memory: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="media-probe")
+        self.hits = 0
+        self.misses = 0
+        self.init_db()
+
+    def init_db(self):
+        conn = sqlite3.connect(self.db_file)
+        c = conn.cursor()
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS media_probe (
+                file_key TEXT PRIMARY KEY,
+                path TEXT,
+                info TEXT,
+                created_at INTEGER
+            )
+        ''')
+        c.execute('DELETE FROM media_probe WHERE created_at < ?',
+                  (int(time.time()) - self.config['PERSIST_DAYS'] * 86400,))
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def file_key(path: str) -> Optional[str]:
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return f"{st.st_dev}:{st.st_ino}:{st.st_size}:{st.st_mtime_ns}"
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _lookup(self, key: str) -> Optional[Dict]:
+        info = self._lookup_memory(key)
+        if info is not None:
+            return info
+        return self._lookup_persisted(key)
+
+    def _lookup_memory(self, key: str) -> Optional[Dict]:
+        with self._lock:
+            info = self._memory.get(key)
+            if info is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+            return info
+
+    def _lookup_persisted(self, key: str) -> Optional[Dict]:
+        try:
+            conn = sqlite3.connect(self.db_file)
+            try:
+                row = conn.execute('SELECT info FROM media_probe WHERE file_key = ?', (key,)).fetchone()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Ошибка чтения кэша ffprobe: {e}")
+            row = None
+        if not row:
+            return None
+
+        info = json.loads(row[0])
+        self._remember(key, info)
+        with self._lock:
+            self.hits += 1
+        return info
+
+    def _remember(self, key: str, info: Dict):
+        with self._lock:
+            self._memory[key] = info
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.config['MEMORY_ENTRIES']:
+                self._memory.popitem(last=False)
+
+    def _store(self, key: str, path: str, info: Dict):
+        self._remember(key, info)
+        with self._lock:
+            self.misses += 1
+        try:
+            conn = sqlite3.connect(self.db_file)
+            try:
+                conn.execute(
+                    'INSERT OR REPLACE INTO media_probe (file_key, path, info, created_at) VALUES (?, ?, ?, ?)',
+                    (key, path, json.dumps(info), int(time.time()))
+                )
+                conn.commit()
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            logger.warning(f"Ошибка записи кэша ffprobe: {e}")
+
+    @staticmethod
+    def _parse(raw: dict) -> Dict:
+        """Сводка по потокам плюс исходный вывод ffprobe"""
+        fmt = raw.get('format', {})
+        streams = raw.get('streams', [])
+        video = next((s for s in streams if s.get('codec_type') == 'video'), {})
+        audio = next((s for s in streams if s.get('codec_type') == 'audio'), {})
+        size = int(fmt.get('size') or 0)
+        return {
+            'duration': float(fmt.get('duration') or 0),
+            'size_mb': size / (1024 * 1024),
+            'format': fmt.get('format_name', 'unknown'),
+            'bit_rate': int(fmt.get('bit_rate') or 0),
+            'width': int(video.get('width') or 0),
+            'height': int(video.get('height') or 0),
+            'video_codec': video.get('codec_name'),
+            'audio_codec': audio.get('codec_name'),
+            'sample_rate': int(audio.get('sample_rate') or 0),
+            'channels': int(audio.get('channels') or 0),
+            'has_video': bool(video),
+            'has_audio': bool(audio),
+            'streams': streams,
+        }
+
+    async def probe(self, path: str) -> Optional[Dict]:
+        """Информация о файле; одновременные запросы одного файла ждут один ffprobe"""
+        key = self.file_key(path)
+        if key is None:
+            return None
+        info = self._lookup_memory(key)
+        if info is not None:
+            return info
+
+        if key in self._inflight:
+            return await asyncio.shield(self._inflight[key])
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            info = await self._run(self._lookup_persisted, key)
+            if info is None:
+                info = await self._run_ffprobe(path)
+                if info is not None:
+                    await self._run(self._store, key, path, info)
+            future.set_result(info)
+            return info
+        except BaseException as e:
+            future.set_result(None)
+            if isinstance(e, Exception):
+                logger.error(f"Ошибка получения информации о файле {path}: {e}")
+                return None
+            raise
+        finally:
+            self._inflight.pop(key, None)
+
+    async def _run_ffprobe(self, path: str) -> Optional[Dict]:
+        process = await asyncio.create_subprocess_exec(
+            *PROBE_CMD, path,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        stdout, _ = await process.communicate()
+        if process.returncode != 0:
+            return None
+        return self._parse(json.loads(stdout.decode('utf-8')))
+
+    def probe_sync(self, path: str) -> Optional[Dict]:
+        """То же для рабочих потоков (pydub, декодирование в executor)"""
+        key = self.file_key(path)
+        if key is None:
+            return None
+        info = self._lookup(key)
+        if info is not None:
+            return info
+        try:
+            result = subprocess.run([*PROBE_CMD, path], capture_output=True)
+            if result.returncode != 0:
+                return None
+            info = self._parse(json.loads(result.stdout.decode('utf-8')))
+        except Exception as e:
+            logger.error(f"Ошибка получения информации о файле {path}: {e}")
+            return None
+        self._store(key, path, info)
+        return info
+
+    # Расширения, которые AudioSegment.from_file читает сам, без ffmpeg
+    PYDUB_NATIVE_EXTENSIONS = ('.wav', '.raw', '.pcm')
+
+    @staticmethod
+    def _pcm_codec(info: Dict) -> str:
+        """
+        Тот же выбор формата PCM, что делает AudioSegment.from_file по ffprobe.
+
+        pydub запускает ffprobe с -v info и, если bits_per_sample равен 0 (opus, vorbis,
+        flac, PCM float), берет глубину из формата отсчетов: s32 - 32, flt/fltp - 32,
+        dbl - 64. Здесь то же выводится из sample_fmt. Если формат неизвестен, pydub
+        падает, а здесь берется 16 бит.
+        """
+        audio = next(s for s in info['streams'] if s.get('codec_type') == 'audio')
+        sample_fmt = audio.get('sample_fmt') or ''
+        if sample_fmt == 'fltp' and audio.get('codec_name') in ('mp3', 'mp4', 'aac', 'webm', 'ogg'):
+            bits_per_sample = 16
+        else:
+            bits_per_sample = audio.get('bits_per_sample') or SAMPLE_FMT_BITS.get(sample_fmt.rstrip('p')) or 16
+        return 'pcm_u8' if bits_per_sample == 8 else f'pcm_s{bits_per_sample}le'
+
+    def load_audio(self, path: str) -> AudioSegment:
+        """
+        Замена AudioSegment.from_file без повторного ffprobe внутри pydub.
+
+        Команда декодирования совпадает с pydub, результат - тоже. Файлы .wav/.raw/.pcm
+        pydub выбирает по расширению и читает сам (WAV с не-PCM кодеком - через ffmpeg
+        с собственным ffprobe), поэтому они уходят в from_file без изменений.
+        """
+        if path.lower().endswith(self.PYDUB_NATIVE_EXTENSIONS):
+            return AudioSegment.from_file(path)
+
+        info = self.probe_sync(path)
+        if not info or not info['has_audio']:
+            return AudioSegment.from_file(path)
+
+        cmd = ['ffmpeg', '-y', '-i', path, '-acodec', self._pcm_codec(info), '-vn', '-f', 'wav', '-']
+        result = subprocess.run(cmd, capture_output=True)
+        if result.returncode != 0 or not result.stdout:
+            raise RuntimeError(
+                f"Не удалось декодировать {path}: {result.stderr.decode('utf-8', errors='ignore')[-500:]}"
+            )
+        data = bytearray(result.stdout)
+        fix_wav_headers(data)
+        return AudioSegment(bytes(data))
+
+    def stats(self) -> Dict:
+        return {
+            'entries': len(self._memory),
+            'hits': self.hits,
+            'misses': self.misses,
+        }
@@ -0,0 +1,232 @@
+import asyncio
+import itertools
+import os
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from config.config import setup_logging, MEDIA_SCHEDULER_CONFIG
+from services.monitoring import MonitoringService
+from services.tracing import span, record_span
+
+logger = setup_logging(__name__)
+
+# Классы приоритета: меньше - раньше
+PRIORITY_INTERACTIVE = 0  # Пользователь ждет короткий результат (аудио, короткие ролики)
+PRIORITY_NORMAL = 1
+PRIORITY_BULK = 2         # Длинные рендеры
+
+# Виды задач: encode занимает несколько потоков, остальные - один
+KIND_ENCODE = 'encode'
+KIND_AUDIO = 'audio'
+KIND_REMUX = 'remux'
+
+
+@dataclass(order=True)
+class MediaJob:
+    """Задача в очереди планировщика; базовый порядок - приоритет, длительность, время постановки"""
+    sort_key: Tuple[int, float, int]
+    kind: str = field(compare=False)
+    cost: int = field(compare=False)
+    label: str = field(default="", compare=False)
+    future: Optional[asyncio.Future] = field(default=None, compare=False, repr=False)
+    on_position: Optional[Callable[[int], None]] = field(default=None, compare=False, repr=False)
+    position: int = field(default=0, compare=False)
+    threads: int = field(default=1, compare=False)
+    queued_at: float = field(default_factory=time.monotonic, compare=False)
+    started_at: float = field(default=0.0, compare=False)
+
+
+class MediaScheduler:
+    """
+    Общий планировщик медиа подпроцессов (ffmpeg, pydub, постпроцессоры yt-dlp).
+
+    Бюджет - число ядер. Кодирование занимает THREADS_PER_ENCODE потоков и
+    получает столько же в -threads, легкие задачи - один поток. Задачи
+    допускаются строго по очереди приоритетов, пока хватает бюджета; одна
+    задача запускается всегда, даже если ее стоимость больше бюджета.
+
+    Старение: каждые AGING_SECONDS ожидания задача поднимается на один класс
+    приоритета, а поднявшись выше интерактивного, идет в порядке постановки
+    впереди всех. Поток коротких задач не может бесконечно задерживать длинную.
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(MediaScheduler, cls).__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        self.config = MEDIA_SCHEDULER_CONFIG
+        self.budget = self.config['CPU_BUDGET'] or os.cpu_count() or 1
+        self.encode_threads = min(self.budget, self.config['THREADS_PER_ENCODE'] or max(2, self.budget // 2))
+        self._queue: List[MediaJob] = []
+        self._running: Dict[int, MediaJob] = {}
+        self._used = 0
+        self._seq = itertools.count()
+        self.monitoring = MonitoringService()
+        self.monitoring.watch_queue('media_scheduler', self.queued_count)
+        logger.info(f"Планировщик медиа: бюджет {self.budget} потоков, {self.encode_threads} на кодирование")
+
+    def priority_for_duration(self, duration: float) -> int:
+        """Короткие ролики - вперед, длинные рендеры - в конец"""
+        if duration and duration <= self.config['SHORT_CLIP_SECONDS']:
+            return PRIORITY_INTERACTIVE
+        if duration and duration >= self.config['LONG_RENDER_SECONDS']:
+            return PRIORITY_BULK
+        return PRIORITY_NORMAL
+
+    def _cost(self, kind: str) -> int:
+        return self.encode_threads if kind == KIND_ENCODE else 1
+
+    def running_count(self, kind: Optional[str] = None) -> int:
+        return sum(1 for job in self._running.values() if kind is None or job.kind == kind)
+
+    def queued_count(self, kind: Optional[str] = None) -> int:
+        return sum(1 for job in self._queue if kind is None or job.kind == kind)
+
+    def stats(self) -> Dict:
+        return {
+            'budget': self.budget,
+            'used': self._used,
+            'running': len(self._running),
+            'queued': len(self._queue),
+        }
+
+    async def acquire(self, kind: str = KIND_ENCODE, priority: int = PRIORITY_NORMAL,
+                      duration: float = 0, label: str = "",
+                      on_position: Optional[Callable[[int], None]] = None, weight: int = 1) -> MediaJob:
+        """
+        Ожидание своей очереди; on_position получает позицию в очереди (1 - следующая).
+        weight - сколько задач такого вида выполняет один процесс (несколько выходов ffmpeg).
+        """
+        job = MediaJob(
+            sort_key=(priority, duration or 0, next(self._seq)),
+            kind=kind,
+            cost=min(self.budget, self._cost(kind) * max(1, weight)),
+            label=label,
+            future=asyncio.get_running_loop().create_future(),
+            on_position=on_position
+        )
+        self._queue.append(job)
+        self._dispatch()
+
+        try:
+            await job.future
+        except asyncio.CancelledError:
+            if job.future.done() and not job.future.cancelled():
+                # Допущена одновременно с отменой - возвращаем бюджет
+                self.release(job)
+            elif job in self._queue:
+                self._queue.remove(job)
+                self._notify_positions()
+            raise
+
+        waited = job.started_at - job.queued_at
+        if waited > 1:
+            logger.info(f"Задача {label or kind} ждала в очереди {waited:.1f} с")
+        return job
+
+    def release(self, job: MediaJob):
+        if self._running.pop(id(job), None) is None:
+            return
+        self._used -= job.cost
+        self.monitoring.log_busy('ffmpeg', job.kind, time.monotonic() - job.started_at)
+        self._dispatch()
+
+    def _effective_key(self, job: MediaJob, now: float) -> Tuple[int, float, int]:
+        """Порядок с учетом старения: класс снижается за каждые AGING_SECONDS ожидания"""
+        priority, duration, seq = job.sort_key
+        steps = int((now - job.queued_at) // self.config['AGING_SECONDS'])
+        aged = max(priority - steps, PRIORITY_INTERACTIVE - 1)
+        # Поднявшиеся выше интерактивного идут по времени постановки, без учета длительности
+        return aged, duration if aged >= PRIORITY_INTERACTIVE else 0, seq
+
+    def _ordered(self) -> List[MediaJob]:
+        now = time.monotonic()
+        return sorted(self._queue, key=lambda job: self._effective_key(job, now))
+
+    def _dispatch(self):
+        """Запуск задач из головы очереди, пока хватает бюджета"""
+        while self._queue:
+            head = self._ordered()[0]
+            if self._running and self._used + head.cost > self.budget:
+                break
+            self._queue.remove(head)
+            head.threads = head.cost
+            head.started_at = time.monotonic()
+            self._running[id(head)] = head
+            self._used += head.cost
+            if not head.future.done():
+                head.future.set_result(head)
+        self._notify_positions()
+
+    def _notify_positions(self):
+        for position, job in enumerate(self._ordered(), 1):
+            if job.on_position and job.position != position:
+                job.position = position
+                try:
+                    job.on_position(position)
+                except Exception as e:
+                    logger.debug(f"Ошибка уведомления о позиции в очереди: {e}")
+
+    @asynccontextmanager
+    async def slot(self, kind: str = KIND_ENCODE, priority: int = PRIORITY_NORMAL, duration: float = 0,
+                   label: str = "", on_position: Optional[Callable[[int], None]] = None,
+                   weight: int = 1) -> AsyncIterator[MediaJob]:
+        """async with scheduler.slot(...) as job: ... job.threads - сколько потоков можно занять"""
+        job = await self.acquire(kind, priority, duration, label, on_position, weight)
+        try:
+            if job.started_at - job.queued_at >= 0.01:
+                record_span(f"queue:{kind}", job.queued_at, job.started_at - job.queued_at)
+            with span(f"ffmpeg:{kind}"):
+                yield job
+        finally:
+            self.release(job)
+
+    def acquire_blocking(self, loop: asyncio.AbstractEventLoop, kind: str, priority: int = PRIORITY_NORMAL,
+                         label: str = "") -> MediaJob:
+        """Ожидание очереди из рабочего потока (хуки yt-dlp)"""
+        return asyncio.run_coroutine_threadsafe(
+            self.acquire(kind, priority, 0, label), loop
+        ).result()
+
+    def release_threadsafe(self, loop: asyncio.AbstractEventLoop, job: MediaJob):
+        loop.call_soon_threadsafe(self.release, job)
+
+
+class YtDlpSchedulerHook:
+    """
+    postprocessor_hooks для yt-dlp: слияние и конвертация ждут очереди планировщика.
+
+    Хук вызывается в потоке загрузки; после download() нужно вызвать release_all()
+    на случай, если постпроцессор упал и не прислал статус finished.
+    """
+
+    # Постпроцессоры с перекодированием; остальные только перепаковывают
+    ENCODING_POSTPROCESSORS = {'VideoConvertor'}
+
+    def __init__(self, scheduler: MediaScheduler, loop: asyncio.AbstractEventLoop,
+                 priority: int = PRIORITY_NORMAL):
+        self.scheduler = scheduler
+        self.loop = loop
+        self.priority = priority
+        self.jobs: Dict[str, MediaJob] = {}
+
+    def __call__(self, d: dict):
+        name = d.get('postprocessor', '')
+        status = d.get('status')
+        if status == 'started' and name not in self.jobs:
+            kind = KIND_ENCODE if name in self.ENCODING_POSTPROCESSORS else KIND_REMUX
+            self.jobs[name] = self.scheduler.acquire_blocking(self.loop, kind, self.priority, f"yt-dlp {name}")
+        elif status in ('finished', 'error') and name in self.jobs:
+            self.scheduler.release_threadsafe(self.loop, self.jobs.pop(name))
+
+    def release_all(self):
+        for job in self.jobs.values():
+            self.scheduler.release_threadsafe(self.loop, job)
+        self.jobs.clear()
@@ -0,0 +1,95 @@
+import asyncio
+import time
+from typing import Optional
+
+from aiogram import types
+from aiogram.exceptions import TelegramRetryAfter, TelegramBadRequest
+from config.config import setup_logging
+from services.monitoring import MonitoringService
+
+logger = setup_logging(__name__)
+
+
+class ThrottledMessageEditor:
+    """
+    Обновление одного статусного сообщения не чаще заданного интервала.
+
+    update() можно вызывать сколь угодно часто: в сообщение попадает только
+    последний текст, а промежуточные версии схлопываются, поэтому лимиты
+    Telegram на редактирование не превышаются.
+    """
+
+    def __init__(self, message: types.Message, header: str = "", min_interval: float = 3.0,
+                 max_length: int = 4000, reply_markup: Optional[types.InlineKeyboardMarkup] = None):
+        self.message = message
+        self.reply_markup = reply_markup  # Клавиатура сохраняется при промежуточных обновлениях
+        self.header = header
+        self.min_interval = min_interval
+        self.max_length = max_length
+        self._pending: Optional[str] = None
+        self._last_sent: Optional[str] = None
+        self._last_edit = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._stopped = False
+
+    def _render(self, text: str) -> str:
+        """Заголовок и хвост текста в пределах лимита длины сообщения"""
+        body_limit = self.max_length - len(self.header)
+        if len(text) > body_limit:
+            text = "…" + text[-(body_limit - 1):]
+        return f"{self.header}{text}"
+
+    def update(self, text: str):
+        """Запланировать показ нового текста"""
+        if self._stopped or not text:
+            return
+        self._pending = self._render(text)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        """Отправка накопленного текста с соблюдением интервала"""
+        while self._pending is not None and not self._stopped:
+            wait = self.min_interval - (time.monotonic() - self._last_edit)
+            if wait > 0:
+                await asyncio.sleep(wait)
+                continue
+
+            text, self._pending = self._pending, None
+            await self._edit(text)
+
+    async def _edit(self, text: str):
+        if text == self._last_sent:
+            return
+        try:
+            reply_markup = None if self._stopped else self.reply_markup
+            await self.message.edit_text(text, reply_markup=reply_markup)
+            self._last_sent = text
+        except TelegramRetryAfter as e:
+            MonitoringService().log_flood_wait('edit_status', e.retry_after)
+            logger.warning(f"Флуд-контроль при обновлении статуса: ожидание {e.retry_after} сек")
+            self._pending = self._pending or text
+            await asyncio.sleep(e.retry_after)
+        except TelegramBadRequest as e:
+            # "message is not modified" и удаленное сообщение не считаем ошибкой
+            logger.debug(f"Статус не обновлен: {e}")
+        except Exception as e:
+            logger.error(f"Ошибка обновления статуса: {e}")
+        finally:
+            self._last_edit = time.monotonic()
+
+    async def finish(self, text: Optional[str] = None):
+        """Финальное обновление: дожидаемся очереди и показываем итоговый текст"""
+        self._stopped = True
+        if self._task and not self._task.done():
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        if text:
+            await self._edit(text[:self.max_length])
+
+    async def stop(self):
+        """Остановка без финального обновления"""
+        await self.finish(None)
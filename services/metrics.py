@@ -0,0 +1,327 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from bisect import bisect_left
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+from config.config import setup_logging, METRICS_CONFIG
+
+logger = setup_logging(__name__)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# Границы корзин по умолчанию (секунды): от быстрых запросов до долгих загрузок
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((name, str(value)) for name, value in labels.items()))
+
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    pairs = []
+    for name, value in key:
+        value = value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        pairs.append(f'{name}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    """Монотонный счетчик с метками"""
+    kind = 'counter'
+
+    def __init__(self, name: str, help_text: str = ""):
+        self.name = name
+        self.help = help_text
+        self.values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(_label_key(labels), 0)
+
+    def snapshot(self) -> list:
+        return [[dict(key), value] for key, value in self.values.items()]
+
+    def restore(self, data: list):
+        for labels, value in data:
+            self.values[_label_key(labels)] = value
+
+
+class Gauge(Counter):
+    """Текущее значение (очередь, активные задачи)"""
+    kind = 'gauge'
+
+    def set(self, value: float, **labels):
+        self.values[_label_key(labels)] = value
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+
+class _Window:
+    """Поминутные count/sum/max за последний час в кольце из 60 ячеек"""
+    __slots__ = ('minutes', 'count', 'total', 'maximum')
+
+    def __init__(self):
+        self.minutes = [-1] * 60
+        self.count = [0] * 60
+        self.total = [0.0] * 60
+        self.maximum = [0.0] * 60
+
+    def add(self, value: float, minute: int):
+        slot = minute % 60
+        if self.minutes[slot] != minute:
+            self.minutes[slot] = minute
+            self.count[slot] = 0
+            self.total[slot] = 0.0
+            self.maximum[slot] = 0.0
+        self.count[slot] += 1
+        self.total[slot] += value
+        self.maximum[slot] = max(self.maximum[slot], value)
+
+    def summary(self, minute: int) -> Tuple[int, float, float]:
+        count, total, maximum = 0, 0.0, 0.0
+        for slot in range(60):
+            if minute - self.minutes[slot] < 60:
+                count += self.count[slot]
+                total += self.total[slot]
+                maximum = max(maximum, self.maximum[slot])
+        return count, total, maximum
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами и окном за последний час"""
+    kind = 'histogram'
+
+    def __init__(self, name: str, help_text: str = "", buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        # Метки -> [счетчики по корзинам + корзина +Inf, сумма, количество]
+        self.values: Dict[LabelKey, list] = {}
+        self.windows: Dict[LabelKey, _Window] = {}
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        entry = self.values.get(key)
+        if entry is None:
+            entry = self.values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            self.windows[key] = _Window()
+        entry[0][bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+        entry[2] += 1
+        self.windows[key].add(value, int(time.time() // 60))
+
+    def recent(self, **labels) -> Dict[str, float]:
+        """Среднее и максимум за последний час"""
+        window = self.windows.get(_label_key(labels))
+        if window is None:
+            return {'count': 0, 'avg': 0.0, 'max': 0.0}
+        count, total, maximum = window.summary(int(time.time() // 60))
+        return {'count': count, 'avg': total / count if count else 0.0, 'max': maximum}
+
+    def snapshot(self) -> list:
+        return [[dict(key), entry] for key, entry in self.values.items()]
+
+    def restore(self, data: list):
+        for labels, entry in data:
+            if len(entry[0]) == len(self.buckets) + 1:
+                key = _label_key(labels)
+                self.values[key] = entry
+                self.windows[key] = _Window()
+
+
+class HourlyCounter:
+    """Счетчики по часам за последние N часов в кольцевом буфере"""
+    kind = 'hourly'
+
+    def __init__(self, name: str, hours: int = 48):
+        self.name = name
+        self.hours = hours
+        self.slots: List[Tuple[int, Dict[str, int]]] = [(-1, {}) for _ in range(hours)]
+
+    def inc(self, label: str, amount: int = 1, timestamp: Optional[float] = None):
+        hour = int((timestamp or time.time()) // 3600)
+        slot = hour % self.hours
+        if self.slots[slot][0] != hour:
+            self.slots[slot] = (hour, {})
+        counts = self.slots[slot][1]
+        counts[label] = counts.get(label, 0) + amount
+
+    def get(self, hour: int) -> Dict[str, int]:
+        stamp, counts = self.slots[hour % self.hours]
+        return dict(counts) if stamp == hour else {}
+
+    def snapshot(self) -> list:
+        return [[stamp, counts] for stamp, counts in self.slots if stamp >= 0]
+
+    def restore(self, data: list):
+        for stamp, counts in data:
+            self.slots[stamp % self.hours] = (stamp, dict(counts))
+
+
+class ErrorLog:
+    """Последние ошибки по сервисам (кольцевой буфер)"""
+    kind = 'errors'
+
+    def __init__(self, name: str, maxlen: int = 50):
+        self.name = name
+        self.maxlen = maxlen
+        self.entries: Dict[str, Deque[Tuple[float, str]]] = {}
+
+    def add(self, service: str, error: str):
+        entries = self.entries.get(service)
+        if entries is None:
+            entries = self.entries[service] = deque(maxlen=self.maxlen)
+        entries.append((time.time(), error[:500]))
+
+    def recent(self, service: str, seconds: float = 3600, limit: int = 5) -> List[Tuple[float, str]]:
+        cutoff = time.time() - seconds
+        return [entry for entry in list(self.entries.get(service, ()))[-limit:] if entry[0] > cutoff]
+
+    def snapshot(self) -> dict:
+        return {service: list(entries) for service, entries in self.entries.items()}
+
+    def restore(self, data: dict):
+        for service, entries in data.items():
+            self.entries[service] = deque((tuple(entry) for entry in entries), maxlen=self.maxlen)
+
+
+class MetricsRegistry:
+    """
+    Метрики процесса: счетчики, измерители, гистограммы, почасовые счетчики
+    и журналы ошибок. Обновление - O(1) без ввода-вывода; снимок периодически
+    пишется компактным JSON в фоне и восстанавливается при запуске.
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(MetricsRegistry, cls).__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        self.config = METRICS_CONFIG
+        self.metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+        self._restored: dict = {}
+        self._collectors: List[Callable[[], None]] = []
+        self.load()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self.metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            if metric.name in self._restored:
+                try:
+                    metric.restore(self._restored.pop(metric.name))
+                except Exception as e:
+                    logger.warning(f"Не удалось восстановить метрику {metric.name}: {e}")
+            self.metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str = "") -> Counter:
+        return self._register(Counter(name, help_text))
+
+    def gauge(self, name: str, help_text: str = "") -> Gauge:
+        return self._register(Gauge(name, help_text))
+
+    def histogram(self, name: str, help_text: str = "", buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, buckets))
+
+    def hourly(self, name: str, hours: int = 48) -> HourlyCounter:
+        return self._register(HourlyCounter(name, hours))
+
+    def errors(self, name: str, maxlen: Optional[int] = None) -> ErrorLog:
+        return self._register(ErrorLog(name, maxlen or self.config['ERRORS_PER_SERVICE']))
+
+    def add_collector(self, collector: Callable[[], None]):
+        """Функция, обновляющая измерители (глубины очередей) перед выгрузкой"""
+        self._collectors.append(collector)
+
+    def collect(self):
+        for collector in self._collectors:
+            try:
+                collector()
+            except Exception as e:
+                logger.debug(f"Ошибка сборщика метрик: {e}")
+
+    def render_prometheus(self) -> str:
+        """Текстовый формат Prometheus: счетчики, измерители и гистограммы"""
+        self.collect()
+        lines = []
+        for name, metric in sorted(self.metrics.items()):
+            if metric.kind not in ('counter', 'gauge', 'histogram'):
+                continue
+            if metric.help:
+                lines.append(f"# HELP {name} {metric.help}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for key, value in list(metric.values.items()):
+                if metric.kind != 'histogram':
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+                    continue
+                counts, total, count = value
+                cumulative = 0
+                for bound, bucket_count in zip(metric.buckets + (float('inf'),), counts):
+                    cumulative += bucket_count
+                    le = '+Inf' if bound == float('inf') else _format_value(bound)
+                    lines.append(f"{name}_bucket{_format_labels(key + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(key)} {_format_value(total)}")
+                lines.append(f"{name}_count{_format_labels(key)} {count}")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> dict:
+        return {
+            'saved_at': int(time.time()),
+            'metrics': {
+                name: {'kind': metric.kind, 'data': metric.snapshot()}
+                for name, metric in list(self.metrics.items())
+                if metric.kind != 'gauge'
+            }
+        }
+
+    def load(self):
+        """Снимок с диска; метрики восстанавливаются при регистрации"""
+        path = self.config['SNAPSHOT_FILE']
+        try:
+            if os.path.exists(path):
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self._restored = {name: item['data'] for name, item in data.get('metrics', {}).items()}
+        except Exception as e:
+            logger.error(f"Ошибка загрузки снимка метрик: {e}")
+
+    def _write(self, payload: str):
+        path = self.config['SNAPSHOT_FILE']
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(payload)
+        os.replace(tmp_path, path)
+
+    async def flush(self):
+        """Снимок собирается в event loop (согласованно), пишется в потоке"""
+        payload = json.dumps(self.snapshot(), ensure_ascii=False, separators=(',', ':'))
+        await asyncio.get_running_loop().run_in_executor(None, self._write, payload)
+
+    async def flush_loop(self):
+        while True:
+            await asyncio.sleep(self.config['FLUSH_INTERVAL'])
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error(f"Ошибка сохранения снимка метрик: {e}")
@@ -0,0 +1,62 @@
+import time
+from typing import Optional
+
+from aiohttp import web
+
+from config.config import setup_logging, METRICS_CONFIG
+from services.metrics import MetricsRegistry
+from services.monitoring import MonitoringService
+
+logger = setup_logging(__name__)
+
+
+class MetricsServer:
+    """
+    HTTP сервер внутри процесса бота: /metrics в текстовом формате Prometheus
+    и /healthz для проверки живости. Включается переменной METRICS_PORT.
+    """
+
+    def __init__(self, host: str = METRICS_CONFIG['HTTP_HOST'], port: int = METRICS_CONFIG['HTTP_PORT']):
+        self.host = host
+        self.port = port
+        self.registry = MetricsRegistry()
+        self.monitoring = MonitoringService()
+        self.started_at = time.time()
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.port)
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        return web.Response(
+            text=self.registry.render_prometheus(),
+            content_type='text/plain',
+            charset='utf-8',
+            headers={'X-Content-Type-Options': 'nosniff'}
+        )
+
+    async def handle_healthz(self, request: web.Request) -> web.Response:
+        lag = self.monitoring.loop_lag_last.get()
+        healthy = lag < METRICS_CONFIG['HEALTH_MAX_LAG']
+        return web.json_response({
+            'status': 'ok' if healthy else 'degraded',
+            'uptime': int(time.time() - self.started_at),
+            'event_loop_lag': round(lag, 4),
+        }, status=200 if healthy else 503)
+
+    async def start(self):
+        if not self.enabled:
+            return
+        app = web.Application()
+        app.router.add_get('/metrics', self.handle_metrics)
+        app.router.add_get('/healthz', self.handle_healthz)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+        logger.info(f"Метрики доступны на http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -1,102 +1,177 @@
+import asyncio
+import functools
+from contextlib import contextmanager
+import inspect
+import logging
+import os
 import time
-import json
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
-from collections import defaultdict
-import os
-from config.config import setup_logging
+from typing import Callable, Dict, Optional
+from config.config import setup_logging, METRICS_CONFIG
+from services.metrics import MetricsRegistry
+from services.tracing import span
+
+# Задержка event loop: от незаметной до явной блокировки
+LAG_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+# Скорость отправки в Telegram, МБ/с
+THROUGHPUT_BUCKETS = (0.1, 0.25, 0.5, 1, 2, 5, 10, 20, 50)
 
 logger = setup_logging(__name__)
 
-class MonitoringService:
-    def __init__(self):
-        self.stats_file = "monitoring_stats.json"
-        self.metrics = {
-            'api_calls': defaultdict(int),
-            'api_errors': defaultdict(list),
-            'download_times': [],
-            'success_rate': defaultdict(lambda: {'success': 0, 'failed': 0}),
-            'hourly_stats': defaultdict(lambda: defaultdict(int))
-        }
-        self.load_stats()
 
-    def load_stats(self):
-        """Загрузка статистики из файла"""
-        try:
-            if os.path.exists(self.stats_file):
-                with open(self.stats_file, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    # Преобразуем обычные словари в defaultdict
-                    self.metrics['api_calls'] = defaultdict(int, data.get('api_calls', {}))
-                    self.metrics['api_errors'] = defaultdict(list, data.get('api_errors', {}))
-                    self.metrics['download_times'] = data.get('download_times', [])
-                    self.metrics['success_rate'] = defaultdict(
-                        lambda: {'success': 0, 'failed': 0},
-                        data.get('success_rate', {})
-                    )
-                    self.metrics['hourly_stats'] = defaultdict(
-                        lambda: defaultdict(int),
-                        data.get('hourly_stats', {})
-                    )
-        except Exception as e:
-            logger.error(f"Ошибка загрузки статистики: {e}")
-
-    def save_stats(self):
-        """Сохранение статистики в файл"""
+def flood_wait_seconds(error: BaseException) -> Optional[float]:
+    """Ожидание флуд-контроля из ошибки aiogram (TelegramRetryAfter) или Pyrogram (FloodWait)"""
+    if type(error).__name__ == 'FloodWait':
+        return float(getattr(error, 'value', 0) or 0)
+    retry_after = getattr(error, 'retry_after', None)
+    return float(retry_after) if retry_after is not None else None
+
+
+class PyrogramFloodWaitHandler(logging.Handler):
+    """
+    Короткие FloodWait (до sleep_threshold) Pyrogram выжидает сам внутри
+    Session.invoke и только пишет предупреждение в лог - считаем их по этой записи.
+    """
+
+    LOGGER = 'pyrogram.session.session'
+
+    def emit(self, record: logging.LogRecord):
+        if not str(record.msg).startswith('[%s] Waiting for') or len(record.args or ()) != 3:
+            return
+        _, amount, query_name = record.args
         try:
-            with open(self.stats_file, 'w', encoding='utf-8') as f:
-                # Преобразуем defaultdict в обычные словари для сериализации
-                data = {
-                    'api_calls': dict(self.metrics['api_calls']),
-                    'api_errors': dict(self.metrics['api_errors']),
-                    'download_times': self.metrics['download_times'][-1000:],  # Храним последние 1000 замеров
-                    'success_rate': dict(self.metrics['success_rate']),
-                    'hourly_stats': dict(self.metrics['hourly_stats'])
-                }
-                json.dump(data, f, indent=2, ensure_ascii=False)
-        except Exception as e:
-            logger.error(f"Ошибка сохранения статистики: {e}")
+            MonitoringService().log_flood_wait(f"pyrogram:{query_name}", float(amount))
+        except Exception:
+            self.handleError(record)
+
+
+class MonitoringService:
+    """
+    Статистика вызовов внешних API поверх общего реестра метрик.
+
+    Один экземпляр на процесс: каждое обращение - O(1) обновление в памяти,
+    сохранение на диск выполняет MetricsRegistry.flush_loop.
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(MonitoringService, cls).__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        self.registry = MetricsRegistry()
+        self.api_calls = self.registry.counter('api_calls_total', 'Вызовы внешних API')
+        self.api_errors = self.registry.errors('api_errors')
+        self.download_times = self.registry.histogram('download_duration_seconds', 'Время загрузки видео')
+        self.hourly_stats = self.registry.hourly('api_calls_hourly')
+
+        self.backend_downloads = self.registry.histogram(
+            'backend_download_duration_seconds', 'Время загрузки по бэкендам (cobalt, yt-dlp, ...)')
+        self.downloaded_bytes = self.registry.counter('downloaded_bytes_total', 'Загружено байт по бэкендам')
+        self.uploads = self.registry.histogram('upload_duration_seconds', 'Время отправки файлов в Telegram')
+        self.uploaded_bytes = self.registry.counter('uploaded_bytes_total', 'Отправлено байт в Telegram')
+        self.upload_throughput = self.registry.histogram(
+            'upload_throughput_megabytes_per_second', 'Скорость отправки в Telegram', THROUGHPUT_BUCKETS)
+        self.busy_seconds = self.registry.counter('busy_seconds_total', 'Занятое время ffmpeg и Vosk')
+        self.flood_waits = self.registry.counter('telegram_flood_waits_total', 'Ответы флуд-контроля Telegram')
+        self.flood_wait_seconds = self.registry.counter(
+            'telegram_flood_wait_seconds_total', 'Суммарное ожидание флуд-контроля')
+        self.queue_depth = self.registry.gauge('queue_depth', 'Глубина очередей')
+        self.loop_lag = self.registry.histogram('event_loop_lag_seconds', 'Задержка event loop', LAG_BUCKETS)
+        self.loop_lag_last = self.registry.gauge('event_loop_lag_last_seconds', 'Последний замер задержки event loop')
+
+        pyrogram_logger = logging.getLogger(PyrogramFloodWaitHandler.LOGGER)
+        if not pyrogram_logger.isEnabledFor(logging.WARNING):
+            pyrogram_logger.setLevel(logging.WARNING)
+        pyrogram_logger.addHandler(PyrogramFloodWaitHandler())
 
     def log_api_call(self, service: str, endpoint: str, success: bool, error_msg: Optional[str] = None):
         """Логирование вызова API"""
-        current_hour = datetime.now().strftime('%Y-%m-%d %H:00')
-        
-        self.metrics['api_calls'][f"{service}_{endpoint}"] += 1
-        self.metrics['hourly_stats'][current_hour][service] += 1
-        
-        if success:
-            self.metrics['success_rate'][service]['success'] += 1
-        else:
-            self.metrics['success_rate'][service]['failed'] += 1
-            if error_msg:
-                self.metrics['api_errors'][service].append({
-                    'time': datetime.now().isoformat(),
-                    'error': error_msg
-                })
-        
-        # Автоматическое сохранение после каждого 10-го вызова
-        if sum(self.metrics['api_calls'].values()) % 10 == 0:
-            self.save_stats()
+        self.api_calls.inc(service=service, endpoint=endpoint, result='success' if success else 'failed')
+        self.hourly_stats.inc(service)
+        if not success and error_msg:
+            self.api_errors.add(service, error_msg)
 
     def log_download_time(self, service: str, duration: float):
         """Логирование времени загрузки"""
-        self.metrics['download_times'].append({
-            'service': service,
-            'time': duration,
-            'timestamp': datetime.now().isoformat()
-        })
+        self.download_times.observe(duration, service=service)
+
+    def log_backend_download(self, backend: str, duration: float, success: bool, size: int = 0):
+        """Попытка загрузки одним бэкендом"""
+        self.backend_downloads.observe(duration, backend=backend, result='success' if success else 'failed')
+        if size:
+            self.downloaded_bytes.inc(size, backend=backend)
+
+    def log_upload(self, path: str, duration: float, size: int):
+        """Отправка файла в Telegram: pyrogram, bot_api или local_server"""
+        self.uploads.observe(duration, path=path)
+        self.uploaded_bytes.inc(size, path=path)
+        if duration > 0:
+            self.upload_throughput.observe(size / duration / (1024 * 1024), path=path)
+
+    @contextmanager
+    def track_upload(self, path: str, file_path: str):
+        """
+        with monitoring.track_upload('pyrogram', video_path): await send(...) - учитывается
+        только успех; флуд-контроль, которым закончилась отправка, попадает в счетчики ожиданий
+        """
+        started = time.monotonic()
+        with span(f"upload:{path}"):
+            try:
+                yield
+            except Exception as e:
+                retry_after = flood_wait_seconds(e)
+                if retry_after is not None:
+                    self.log_flood_wait(f"upload:{path}", retry_after)
+                raise
+        self.log_upload(path, time.monotonic() - started, os.path.getsize(file_path))
+
+    def log_busy(self, tool: str, kind: str, seconds: float):
+        """Занятое время тяжелых задач: ffmpeg по видам слотов, Vosk по уровням моделей"""
+        self.busy_seconds.inc(seconds, tool=tool, kind=kind)
+
+    def log_flood_wait(self, source: str, retry_after: float):
+        self.flood_waits.inc(source=source)
+        self.flood_wait_seconds.inc(retry_after, source=source)
+
+    def watch_queue(self, name: str, size: Callable[[], int]):
+        """Глубина очереди считывается при каждой выгрузке метрик"""
+        self.registry.add_collector(lambda: self.queue_depth.set(size(), queue=name))
+
+    async def loop_lag_loop(self):
+        """Замер задержки event loop: насколько позже срока просыпается sleep"""
+        interval = METRICS_CONFIG['LAG_PROBE_INTERVAL']
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(interval)
+            lag = max(0.0, loop.time() - started - interval)
+            self.loop_lag.observe(lag)
+            self.loop_lag_last.set(lag)
+
+    def _services(self) -> set:
+        return {dict(key)['service'] for key in self.api_calls.values}
+
+    def _calls(self, service: str, result: str) -> int:
+        return int(sum(
+            value for key, value in self.api_calls.values.items()
+            if dict(key)['service'] == service and dict(key)['result'] == result
+        ))
 
     def get_service_health(self, service: str) -> Dict:
         """Получение состояния здоровья сервиса"""
-        stats = self.metrics['success_rate'][service]
-        total = stats['success'] + stats['failed']
-        success_rate = (stats['success'] / total * 100) if total > 0 else 0
-        
+        success = self._calls(service, 'success')
+        total = success + self._calls(service, 'failed')
+        success_rate = (success / total * 100) if total > 0 else 0
+
         recent_errors = [
-            error for error in self.metrics['api_errors'][service][-5:]
-            if datetime.fromisoformat(error['time']) > datetime.now() - timedelta(hours=1)
+            {'time': datetime.fromtimestamp(timestamp).isoformat(), 'error': error}
+            for timestamp, error in self.api_errors.recent(service)
         ]
-        
+
         return {
             'success_rate': success_rate,
             'total_calls': total,
@@ -107,53 +182,63 @@ class MonitoringService:
     def get_hourly_stats(self, hours: int = 24) -> Dict:
         """Получение почасовой статистики"""
         current = datetime.now()
-        stats = {}
-        
-        for i in range(hours):
-            hour = (current - timedelta(hours=i)).strftime('%Y-%m-%d %H:00')
-            stats[hour] = dict(self.metrics['hourly_stats'][hour])
-        
-        return stats
-
-    def get_performance_metrics(self, service: str) -> Dict:
-        """Получение метрик производительности"""
-        recent_downloads = [
-            d for d in self.metrics['download_times']
-            if d['service'] == service and
-            datetime.fromisoformat(d['timestamp']) > datetime.now() - timedelta(hours=1)
-        ]
-        
-        if not recent_downloads:
-            return {'avg_download_time': 0, 'max_download_time': 0}
-        
-        download_times = [d['time'] for d in recent_downloads]
+        current_hour = int(time.time() // 3600)
         return {
-            'avg_download_time': sum(download_times) / len(download_times),
-            'max_download_time': max(download_times)
+            (current - timedelta(hours=i)).strftime('%Y-%m-%d %H:00'): self.hourly_stats.get(current_hour - i)
+            for i in range(hours)
         }
 
+    def get_performance_metrics(self, service: str) -> Dict:
+        """Получение метрик производительности за последний час"""
+        recent = self.download_times.recent(service=service)
+        return {'avg_download_time': recent['avg'], 'max_download_time': recent['max']}
+
     def generate_report(self) -> str:
         """Генерация отчета о состоянии системы"""
-        services = set([key.split('_')[0] for key in self.metrics['api_calls'].keys()])
-        
-        report = "📊 Отчет о состоянии системы\n\n"
-        
-        for service in services:
+        parts = ["📊 Отчет о состоянии системы\n\n"]
+
+        for service in sorted(self._services()):
             health = self.get_service_health(service)
             perf = self.get_performance_metrics(service)
-            
+
             status_emoji = "🟢" if health['status'] == 'healthy' else "🟡" if health['status'] == 'degraded' else "🔴"
-            
-            report += f"{status_emoji} {service.upper()}\n"
-            report += f"├ Успешность: {health['success_rate']:.1f}%\n"
-            report += f"├ Всего запросов: {health['total_calls']}\n"
-            report += f"├ Среднее время загрузки: {perf['avg_download_time']:.2f}s\n"
-            
+
+            parts.append(f"{status_emoji} {service.upper()}\n")
+            parts.append(f"├ Успешность: {health['success_rate']:.1f}%\n")
+            parts.append(f"├ Всего запросов: {health['total_calls']}\n")
+            parts.append(f"├ Среднее время загрузки: {perf['avg_download_time']:.2f}s\n")
+
             if health['recent_errors']:
-                report += "├ Последние ошибки:\n"
+                parts.append("├ Последние ошибки:\n")
                 for error in health['recent_errors'][-3:]:
-                    report += f"│ ❌ {error['error']}\n"
-            
-            report += "└──────────\n\n"
-        
-        return report
\ No newline at end of file
+                    parts.append(f"│ ❌ {error['error']}\n")
+
+            parts.append("└──────────\n\n")
+
+        return "".join(parts)
+
+
+def track_download(backend: str):
+    """
+    Декоратор метода загрузки: время попытки, успех и размер файла.
+
+    Файл - возвращенный путь или аргумент output_path; успех - истинный результат.
+    """
+    def decorator(func):
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.monotonic()
+            result = None
+            try:
+                with span(f"download:{backend}"):
+                    result = await func(*args, **kwargs)
+                return result
+            finally:
+                path = result if isinstance(result, str) else \
+                    signature.bind_partial(*args, **kwargs).arguments.get('output_path')
+                size = os.path.getsize(path) if result and path and os.path.isfile(path) else 0
+                MonitoringService().log_backend_download(backend, time.monotonic() - started, bool(result), size)
+        return wrapper
+    return decorator
@@ -8,6 +8,7 @@ from urllib.parse import urlparse
 from random import choice
 from typing import Optional, Dict, Tuple
 from bs4 import BeautifulSoup
+from services.monitoring import track_download
 
 logging.basicConfig(
     level=logging.INFO,
@@ -377,6 +378,7 @@ class RedNoteDownloader:
         logger.error("❌ Не удалось скачать видео ни с одной из ссылок")
         return False
 
+    @track_download('rednote')
     async def download_video(self, video_url: str, output_path: str) -> bool:
         """Скачивание видео с поддержкой нового формата данных"""
         
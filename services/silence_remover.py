@@ -0,0 +1,181 @@
+from typing import List, Tuple
+
+import numpy as np
+from pydub import AudioSegment
+
+from config.config import setup_logging
+from services.media_probe import MediaProbe
+
+logger = setup_logging(__name__)
+
+# Типы отсчетов PCM по ширине сэмпла (как их трактует audioop)
+SAMPLE_DTYPES = {1: np.int8, 2: np.int16, 4: np.int32}
+
+
+def _ms_to_frames(ms: np.ndarray, frame_rate: int) -> np.ndarray:
+    """Граница в кадрах для миллисекунды - та же формула, что в AudioSegment.frame_count"""
+    return (ms * (frame_rate / 1000.0)).astype(np.int64)
+
+
+class SilenceRemover:
+    """
+    Векторизованное удаление пауз на NumPy.
+
+    Повторяет семантику pydub 0.25.1 (detect_silence, detect_nonsilent,
+    split_on_silence с тем же шагом, порогом и отступами), но вместо цикла
+    по миллисекундным срезам считает энергию окон через кумулятивные суммы,
+    а итоговое аудио собирает за одно выделение памяти и экспортирует один раз.
+    """
+
+    def __init__(self, audio: AudioSegment):
+        if audio.sample_width not in SAMPLE_DTYPES:
+            audio = audio.set_sample_width(4)
+        self.audio = audio
+        self.frame_rate = audio.frame_rate
+        self.channels = audio.channels
+        self.samples = np.frombuffer(audio.raw_data, dtype=SAMPLE_DTYPES[audio.sample_width])
+        self.frames = self.samples.reshape(-1, self.channels)
+        self.length_ms = len(audio)
+
+    @classmethod
+    def from_file(cls, path: str) -> "SilenceRemover":
+        return cls(MediaProbe().load_audio(path))
+
+    def _ms_energy(self, block_ms: int = 10000) -> np.ndarray:
+        """
+        Сумма квадратов отсчетов по каждой миллисекунде (с учетом всех каналов).
+
+        Считается блоками, чтобы не держать в памяти квадраты всего файла;
+        для 8/16 бит суммы целочисленные и точные.
+        """
+        bounds = _ms_to_frames(np.arange(self.length_ms + 1), self.frame_rate)
+        bounds = np.minimum(bounds, len(self.frames))
+        acc_dtype = np.int64 if self.audio.sample_width <= 2 else np.float64
+
+        energy = np.empty(self.length_ms, dtype=acc_dtype)
+        for block_start in range(0, self.length_ms, block_ms):
+            block_end = min(block_start + block_ms, self.length_ms)
+            low, high = bounds[block_start], bounds[block_end]
+
+            squares = np.square(self.frames[low:high].astype(acc_dtype)).sum(axis=1)
+            cumulative = np.concatenate((np.zeros(1, dtype=acc_dtype), np.cumsum(squares)))
+            local = bounds[block_start:block_end + 1] - low
+            energy[block_start:block_end] = cumulative[local[1:]] - cumulative[local[:-1]]
+        return energy
+
+    def detect_silence(self, min_silence_len: int = 1000, silence_thresh: float = -16,
+                       seek_step: int = 1) -> List[List[int]]:
+        """Интервалы тишины в мс - аналог pydub.silence.detect_silence"""
+        seg_len = self.length_ms
+        if seg_len < min_silence_len:
+            return []
+
+        thresh = (10 ** (silence_thresh / 20)) * self.audio.max_possible_amplitude
+
+        last_slice_start = seg_len - min_silence_len
+        starts = np.arange(0, last_slice_start + 1, seek_step)
+        if last_slice_start % seek_step:
+            starts = np.append(starts, last_slice_start)
+
+        # Энергия окна [i, i + min_silence_len) через префиксные суммы по миллисекундам
+        ms_energy = self._ms_energy()
+        ms_cumulative = np.concatenate((np.zeros(1, dtype=ms_energy.dtype), np.cumsum(ms_energy)))
+        window_energy = ms_cumulative[starts + min_silence_len] - ms_cumulative[starts]
+
+        # Число отсчетов берется по запрошенной длине среза: pydub дополняет
+        # недостающие кадры в конце нулями
+        window_frames = (_ms_to_frames(starts + min_silence_len, self.frame_rate)
+                         - _ms_to_frames(starts, self.frame_rate))
+        window_samples = np.maximum(window_frames * self.channels, 1)
+
+        # audioop.rms возвращает целое значение, отбрасывая дробную часть
+        rms = np.floor(np.sqrt(np.maximum(window_energy, 0).astype(np.float64) / window_samples))
+        rms[window_frames == 0] = 0
+        silence_starts = starts[rms <= thresh]
+        if not len(silence_starts):
+            return []
+
+        # Склеиваем подряд идущие окна тишины в интервалы
+        prev = silence_starts[:-1]
+        current = silence_starts[1:]
+        breaks = (current != prev + seek_step) & (current > prev + min_silence_len)
+        break_idx = np.nonzero(breaks)[0]
+
+        range_starts = np.concatenate(([silence_starts[0]], current[break_idx]))
+        range_ends = np.concatenate((prev[break_idx], [silence_starts[-1]])) + min_silence_len
+        return [[int(start), int(end)] for start, end in zip(range_starts, range_ends)]
+
+    def detect_nonsilent(self, min_silence_len: int = 1000, silence_thresh: float = -16,
+                         seek_step: int = 1) -> List[List[int]]:
+        """Интервалы со звуком в мс - аналог pydub.silence.detect_nonsilent"""
+        silent_ranges = self.detect_silence(min_silence_len, silence_thresh, seek_step)
+        len_seg = self.length_ms
+
+        if not silent_ranges:
+            return [[0, len_seg]]
+        if silent_ranges[0][0] == 0 and silent_ranges[0][1] == len_seg:
+            return []
+
+        prev_end_i = 0
+        nonsilent_ranges = []
+        for start_i, end_i in silent_ranges:
+            nonsilent_ranges.append([prev_end_i, start_i])
+            prev_end_i = end_i
+
+        if end_i != len_seg:
+            nonsilent_ranges.append([prev_end_i, len_seg])
+
+        if nonsilent_ranges[0] == [0, 0]:
+            nonsilent_ranges.pop(0)
+
+        return nonsilent_ranges
+
+    def keep_intervals(self, min_silence_len: int = 1000, silence_thresh: float = -16,
+                       keep_silence: int = 100, seek_step: int = 1) -> List[Tuple[int, int]]:
+        """Сохраняемые интервалы в мс - те же границы, что у pydub.silence.split_on_silence"""
+        if isinstance(keep_silence, bool):
+            keep_silence = self.length_ms if keep_silence else 0
+
+        output_ranges = [
+            [start - keep_silence, end + keep_silence]
+            for start, end in self.detect_nonsilent(min_silence_len, silence_thresh, seek_step)
+        ]
+
+        # Перекрывающиеся отступы делим пополам, как в pydub
+        for range_i, range_ii in zip(output_ranges, output_ranges[1:]):
+            last_end = range_i[1]
+            next_start = range_ii[0]
+            if next_start < last_end:
+                range_i[1] = (last_end + next_start) // 2
+                range_ii[0] = range_i[1]
+
+        return [
+            (max(start, 0), min(end, self.length_ms))
+            for start, end in output_ranges
+        ]
+
+    def join(self, intervals: List[Tuple[int, int]]) -> AudioSegment:
+        """Склейка интервалов в одно аудио за одно выделение памяти"""
+        if not intervals:
+            raise ValueError("В аудио не найдено фрагментов со звуком")
+
+        ms_frames = self.frame_rate / 1000.0
+        frame_bounds = [(int(start * ms_frames), int(end * ms_frames)) for start, end in intervals]
+        total_frames = sum(max(end - start, 0) for start, end in frame_bounds)
+
+        # Недостающие кадры в конце остаются нулями, как при срезе AudioSegment
+        joined = np.zeros((total_frames, self.channels), dtype=self.frames.dtype)
+        position = 0
+        for start, end in frame_bounds:
+            length = max(end - start, 0)
+            chunk = self.frames[start:end]
+            joined[position:position + len(chunk)] = chunk
+            position += length
+
+        return self.audio._spawn(joined.tobytes())
+
+    def remove_silence(self, min_silence_len: int = 1000, silence_thresh: float = -16,
+                       keep_silence: int = 100, seek_step: int = 1) -> AudioSegment:
+        """Аналог sum(split_on_silence(...)) без квадратичного копирования"""
+        intervals = self.keep_intervals(min_silence_len, silence_thresh, keep_silence, seek_step)
+        return self.join(intervals)
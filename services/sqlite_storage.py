@@ -0,0 +1,181 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Mapping, Optional
+
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StorageKey, StateType
+
+from config.config import setup_logging, FSM_STORAGE_CONFIG
+
+logger = setup_logging(__name__)
+
+
+class SQLiteStorage(BaseStorage):
+    """
+    FSM хранилище aiogram в SQLite вместо MemoryStorage.
+
+    Данные хранятся JSON: в состояние кладутся только ID и пути, а не объекты
+    Message. Каждая операция - короткая транзакция без кэша в памяти, поэтому
+    один файл базы (WAL) могут делить несколько процессов бота. Сессии без
+    изменений дольше TTL удаляются вместе с файлами из FILE_KEYS.
+    """
+
+    def __init__(self, db_file: str = FSM_STORAGE_CONFIG['DB_FILE'], config: dict = FSM_STORAGE_CONFIG):
+        self.db_file = db_file
+        self.config = config
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="fsm-storage")
+        self._conn: Optional[sqlite3.Connection] = None
+        self._closed = False
+        self._executor.submit(self._init_db).result()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_file, check_same_thread=False)
+            self._conn.execute('PRAGMA journal_mode=WAL')
+            self._conn.execute('PRAGMA synchronous=NORMAL')
+            self._conn.execute(f"PRAGMA busy_timeout={self.config['BUSY_TIMEOUT_MS']}")
+        return self._conn
+
+    def _init_db(self):
+        conn = self._connect()
+        with conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS fsm_storage (
+                    storage_key TEXT PRIMARY KEY,
+                    state TEXT,
+                    data TEXT,
+                    updated_at INTEGER
+                )
+            ''')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_fsm_storage_updated_at ON fsm_storage(updated_at)')
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return ':'.join(str(part) for part in (
+            key.bot_id, key.chat_id, key.user_id, key.thread_id,
+            getattr(key, 'business_connection_id', None), key.destiny
+        ))
+
+    @staticmethod
+    def _state_name(state: StateType) -> Optional[str]:
+        return state.state if isinstance(state, State) else state
+
+    # Синхронная часть выполняется в потоке хранилища
+
+    def _read(self, storage_key: str):
+        return self._connect().execute(
+            'SELECT state, data FROM fsm_storage WHERE storage_key = ?', (storage_key,)
+        ).fetchone()
+
+    def _write_state(self, storage_key: str, state: Optional[str]):
+        conn = self._connect()
+        with conn:
+            conn.execute('''
+                INSERT INTO fsm_storage (storage_key, state, data, updated_at) VALUES (?, ?, '{}', ?)
+                ON CONFLICT(storage_key) DO UPDATE SET state = excluded.state, updated_at = excluded.updated_at
+            ''', (storage_key, state, int(time.time())))
+            conn.execute("DELETE FROM fsm_storage WHERE storage_key = ? AND state IS NULL AND data = '{}'",
+                         (storage_key,))
+
+    def _write_data(self, storage_key: str, data: str):
+        conn = self._connect()
+        with conn:
+            conn.execute('''
+                INSERT INTO fsm_storage (storage_key, state, data, updated_at) VALUES (?, NULL, ?, ?)
+                ON CONFLICT(storage_key) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at
+            ''', (storage_key, data, int(time.time())))
+            conn.execute("DELETE FROM fsm_storage WHERE storage_key = ? AND state IS NULL AND data = '{}'",
+                         (storage_key,))
+
+    def _evict(self, cutoff: int) -> int:
+        conn = self._connect()
+        candidates = conn.execute(
+            'SELECT storage_key FROM fsm_storage WHERE updated_at < ?', (cutoff,)
+        ).fetchall()
+        removed_sessions = 0
+        removed_files = 0
+        for (storage_key,) in candidates:
+            # Сначала удаляем строку под блокировкой записи: сессию могли обновить
+            # после выборки (в том числе другой процесс), тогда ее файлы не трогаем
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute(
+                    'SELECT data FROM fsm_storage WHERE storage_key = ? AND updated_at < ?',
+                    (storage_key, cutoff)
+                ).fetchone()
+                if row:
+                    conn.execute('DELETE FROM fsm_storage WHERE storage_key = ?', (storage_key,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            if not row:
+                continue
+
+            removed_sessions += 1
+            for path in self._session_files(row[0]):
+                try:
+                    if os.path.isfile(path):
+                        os.remove(path)
+                        removed_files += 1
+                except OSError as e:
+                    logger.warning(f"Не удалось удалить файл брошенной сессии {path}: {e}")
+        if removed_sessions:
+            logger.info(f"Удалено {removed_sessions} брошенных FSM сессий и {removed_files} файлов")
+        return removed_sessions
+
+    def _session_files(self, data: str):
+        try:
+            values = json.loads(data or '{}')
+        except ValueError:
+            return []
+        return [values[key] for key in self.config['FILE_KEYS'] if isinstance(values.get(key), str)]
+
+    # Интерфейс BaseStorage
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        await self._run(self._write_state, self._key(key), self._state_name(state))
+
+    async def get_state(self, key: StorageKey) -> Optional[str]:
+        row = await self._run(self._read, self._key(key))
+        return row[0] if row else None
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        # json.dumps без default: объект, который нельзя сохранить, - ошибка вызывающего кода
+        await self._run(self._write_data, self._key(key), json.dumps(dict(data), ensure_ascii=False))
+
+    async def get_data(self, key: StorageKey) -> Dict[str, Any]:
+        row = await self._run(self._read, self._key(key))
+        return json.loads(row[1]) if row and row[1] else {}
+
+    async def evict_expired(self) -> int:
+        """Удаление сессий без изменений дольше TTL вместе с их файлами"""
+        return await self._run(self._evict, int(time.time()) - self.config['TTL'])
+
+    async def eviction_loop(self):
+        """Фоновая очистка брошенных сессий"""
+        while True:
+            try:
+                await self.evict_expired()
+            except Exception as e:
+                logger.error(f"Ошибка очистки FSM хранилища: {e}")
+            await asyncio.sleep(self.config['EVICT_INTERVAL'])
+
+    async def close(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+
+        def _close():
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+        await self._run(_close)
+        self._executor.shutdown(wait=True)
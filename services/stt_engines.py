@@ -0,0 +1,144 @@
+import asyncio
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Optional, Set
+
+from config.config import setup_logging
+from services.monitoring import MonitoringService
+from services.tracing import span
+
+logger = setup_logging(__name__)
+
+
+@dataclass
+class EngineCapabilities:
+    """Возможности движка распознавания"""
+    languages: Set[str] = field(default_factory=set)  # Пустое множество - любой язык
+    timestamps: bool = False                          # Отдает тайминги слов
+    max_duration: Optional[float] = None              # Максимальная длительность аудио (сек)
+    local: bool = True                                # Работает без сети
+
+
+class SpeechToTextEngine(ABC):
+    """Базовый класс движков распознавания речи"""
+
+    name: str = "base"
+
+    @property
+    @abstractmethod
+    def capabilities(self) -> EngineCapabilities:
+        pass
+
+    def supports(self, lang: str, duration: float = 0) -> bool:
+        """Подходит ли движок для языка и длительности аудио"""
+        caps = self.capabilities
+        if caps.languages and lang not in caps.languages:
+            return False
+        if caps.max_duration and duration > caps.max_duration:
+            return False
+        return True
+
+    @abstractmethod
+    async def transcribe(
+        self,
+        wav_path: str,
+        lang: str,
+        on_partial: Optional[Callable[[str], None]] = None,
+        checkpoint_key: Optional[str] = None,
+        cancel_event: Optional[threading.Event] = None
+    ) -> Optional[Dict]:
+        """
+        Распознавание WAV файла (16 кГц, моно)
+
+        Args:
+            wav_path: Путь к WAV файлу
+            lang: Код языка
+            on_partial: Вызывается в event loop с накопленным текстом
+            checkpoint_key: Ключ контрольной точки для продолжения прерванной работы
+            cancel_event: Установка события прерывает распознавание (для хеджирования)
+
+        Returns:
+            Dict: {'text': str, 'words': list} или None при ошибке
+        """
+        pass
+
+
+class VoskEngine(SpeechToTextEngine):
+    """Локальная модель Vosk заданного уровня"""
+
+    def __init__(self, transcriber, tier: str):
+        self.transcriber = transcriber
+        self.tier = tier
+        self.name = transcriber.vosk_engine_name(tier)
+
+    @property
+    def capabilities(self) -> EngineCapabilities:
+        return EngineCapabilities(
+            languages={lang for lang in self.transcriber.model_paths
+                       if self.tier in self.transcriber.available_tiers(lang)},
+            timestamps=True,
+            max_duration=None,
+            local=True
+        )
+
+    async def transcribe(self, wav_path, lang, on_partial=None, checkpoint_key=None, cancel_event=None):
+        # Vosk блокирующий, поэтому работает в пуле потоков, а частичные результаты
+        # передаются обратно в event loop
+        loop = asyncio.get_running_loop()
+        partial_callback = None
+        if on_partial:
+            partial_callback = lambda text: loop.call_soon_threadsafe(on_partial, text)
+        started = time.monotonic()
+        try:
+            with span(f"vosk:{self.tier}"):
+                return await loop.run_in_executor(
+                    None, self.transcriber.transcribe_with_vosk, wav_path, lang, partial_callback,
+                    checkpoint_key, self.tier, cancel_event
+                )
+        finally:
+            MonitoringService().log_busy('vosk', self.tier, time.monotonic() - started)
+
+
+class ElevenLabsEngine(SpeechToTextEngine):
+    """Облачное распознавание ElevenLabs (scribe_v1)"""
+
+    name = "elevenlabs"
+
+    def __init__(self, transcriber):
+        self.transcriber = transcriber
+
+    @property
+    def capabilities(self) -> EngineCapabilities:
+        config = self.transcriber.stt_config
+        return EngineCapabilities(
+            languages=set(),
+            timestamps=True,
+            max_duration=config['MAX_DURATION'] or None,
+            local=False
+        )
+
+    # Период проверки события отмены (сек)
+    CANCEL_POLL_INTERVAL = 0.25
+
+    async def transcribe(self, wav_path, lang, on_partial=None, checkpoint_key=None, cancel_event=None):
+        with span(self.name):
+            request = asyncio.ensure_future(
+                self.transcriber.transcribe_with_elevenlabs(wav_path, lang, checkpoint_key)
+            )
+            if cancel_event is None:
+                return await request
+            # Событие отмены проверяется, пока идет запрос: отмена задачи прерывает
+            # запросы aiohttp, готовые части остаются в контрольной точке
+            try:
+                while not request.done():
+                    if cancel_event.is_set():
+                        logger.info("Распознавание ElevenLabs отменено")
+                        request.cancel()
+                        return None
+                    await asyncio.wait({request}, timeout=self.CANCEL_POLL_INTERVAL)
+                return request.result()
+            finally:
+                if not request.done():
+                    request.cancel()
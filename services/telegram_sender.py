@@ -6,6 +6,7 @@ import aiofiles
 from aiogram import Bot
 from aiogram.exceptions import TelegramRetryAfter, TelegramNetworkError
 from aiogram.types import Message, InputFile
+from services.monitoring import MonitoringService, flood_wait_seconds
 
 logger = logging.getLogger(__name__)
 
@@ -38,6 +39,7 @@ class TelegramSender:
             except TelegramRetryAfter as e:
                 # Специальная обработка флуд-контроля
                 retry_after = max(e.retry_after, delay)
+                MonitoringService().log_flood_wait('send_message', e.retry_after)
                 logger.warning(f"Флуд-контроль: ожидание {retry_after} сек (попытка {attempt+1}/{len(self.retry_delays)})")
                 await asyncio.sleep(retry_after)
             except Exception as e:
@@ -73,6 +75,9 @@ class TelegramSender:
                         try:
                             return await self._send_large_video(chat_id, video, caption, **kwargs)
                         except Exception as e:
+                            retry_after = flood_wait_seconds(e)
+                            if retry_after is not None:
+                                MonitoringService().log_flood_wait('send_video', retry_after)
                             logger.warning(f"Ошибка при отправке через Pyrogram: {e}, пробуем стандартный метод")
                     
                     # Стандартная отправка через aiogram
@@ -89,6 +94,7 @@ class TelegramSender:
                     
             except TelegramRetryAfter as e:
                 retry_after = max(e.retry_after, delay)
+                MonitoringService().log_flood_wait('send_video', e.retry_after)
                 logger.warning(f"Флуд-контроль при отправке видео: ожидание {retry_after} сек")
                 await asyncio.sleep(retry_after)
             except Exception as e:
@@ -0,0 +1,155 @@
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+
+from config.config import setup_logging, TRACE_CONFIG
+
+logger = setup_logging(__name__)
+
+# Трасса текущей задачи и глубина вложенности спанов; asyncio копирует контекст
+# в создаваемые задачи, поэтому спаны из фоновых задач попадают в ту же трассу
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar('current_trace', default=None)
+_span_depth: ContextVar[int] = ContextVar('span_depth', default=0)
+
+
+@dataclass
+class Span:
+    name: str
+    offset: float       # Начало относительно начала трассы (сек)
+    duration: float
+    depth: int
+    status: str = 'success'
+
+
+@dataclass
+class Trace:
+    """Этапы одной задачи пользователя от получения запроса до отправки результата"""
+    kind: str
+    user_id: int
+    platform: str = 'unknown'
+    sampled: bool = False
+    trace_id: str = field(default_factory=lambda: uuid.uuid4().hex[:16])
+    started_at: float = field(default_factory=time.time)
+    started_mono: float = field(default_factory=time.monotonic)
+    spans: List[Span] = field(default_factory=list)
+    status: str = 'success'
+
+    def add_span(self, name: str, started_mono: float, duration: float, depth: int = 0,
+                 status: str = 'success'):
+        if len(self.spans) < TRACE_CONFIG['MAX_SPANS']:
+            self.spans.append(Span(name, started_mono - self.started_mono, duration, depth, status))
+
+    @property
+    def duration(self) -> float:
+        """Время работы бота: сумма спанов верхнего уровня без ожидания ответа пользователя"""
+        return sum(span.duration for span in self.spans if span.depth == 0)
+
+
+@contextmanager
+def span(name: str):
+    """with span('download'): ... - этап текущей трассы; без трассы ничего не делает"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    depth = _span_depth.get()
+    token = _span_depth.set(depth + 1)
+    started = time.monotonic()
+    status = 'success'
+    try:
+        yield
+    except BaseException:
+        status = 'error'
+        raise
+    finally:
+        _span_depth.reset(token)
+        trace.add_span(name, started, time.monotonic() - started, depth, status)
+
+
+def record_span(name: str, started_mono: float, duration: float, status: str = 'success'):
+    """Спан, измеренный вне with (например, ожидание в очереди планировщика)"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add_span(name, started_mono, duration, _span_depth.get(), status)
+
+
+class Tracer:
+    """
+    Открытые трассы пользователей и их сохранение.
+
+    Задача проходит несколько обработчиков (ссылка, выбор действия, язык или
+    коэффициент), поэтому трасса живет между ними по user_id: start() в первом
+    обработчике, resume() в следующих, finish() после отправки результата.
+    Сохраняется доля SAMPLE_RATE трасс (по ним считаются перцентили), а также
+    все медленные и неуспешные - для разбора жалоб.
+    """
+
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super(Tracer, cls).__new__(cls)
+            cls._instance._initialize()
+        return cls._instance
+
+    def _initialize(self):
+        self.config = TRACE_CONFIG
+        self.db = None
+        self._open: Dict[int, Trace] = {}
+        self._last_sweep = time.monotonic()
+
+    def set_database(self, db):
+        self.db = db
+
+    def start(self, kind: str, user_id: int, platform: str = 'unknown') -> Trace:
+        self._sweep()
+        previous = self._open.pop(user_id, None)
+        if previous is not None:
+            previous.status = 'abandoned'
+            self._persist(previous)
+        trace = Trace(kind, user_id, platform, sampled=random.random() < self.config['SAMPLE_RATE'])
+        self._open[user_id] = trace
+        _current_trace.set(trace)
+        return trace
+
+    def resume(self, user_id: int) -> Optional[Trace]:
+        trace = self._open.get(user_id)
+        _current_trace.set(trace)
+        return trace
+
+    def fail(self, user_id: int):
+        trace = self._open.get(user_id)
+        if trace is not None:
+            trace.status = 'error'
+
+    def finish(self, user_id: int, status: Optional[str] = None):
+        trace = self._open.pop(user_id, None)
+        if trace is None:
+            return
+        if status:
+            trace.status = status
+        _current_trace.set(None)
+        self._persist(trace)
+
+    def _sweep(self):
+        """Трассы без продолжения дольше OPEN_TTL закрываются как брошенные"""
+        now = time.monotonic()
+        if now - self._last_sweep < 60:
+            return
+        self._last_sweep = now
+        for user_id, trace in list(self._open.items()):
+            if now - trace.started_mono > self.config['OPEN_TTL']:
+                del self._open[user_id]
+                trace.status = 'abandoned'
+                self._persist(trace)
+
+    def _persist(self, trace: Trace):
+        if self.db is None or not trace.spans:
+            return
+        keep = trace.sampled or trace.status == 'error' or trace.duration >= self.config['SLOW_SECONDS']
+        if keep:
+            self.db.save_trace(trace)
@@ -5,10 +5,20 @@ import os
 from pydub import AudioSegment
 import logging
 import langdetect
-from typing import Dict, Optional, Tuple
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from collections import deque
+import threading
 import aiohttp
 import asyncio
-from config.config import setup_logging, ELEVENLABS_API_KEY, PROXY_TTS
+import math
+import time
+from config.config import setup_logging, ELEVENLABS_API_KEY, PROXY_TTS, ELEVENLABS_STT_CONFIG, STT_HEDGE_CONFIG
+from services.transcript_cache import (
+    AudioFingerprint, TranscriptCache, TranscriptionCheckpoints, compute_audio_fingerprint, fingerprint_wav
+)
+from services.stt_engines import SpeechToTextEngine, VoskEngine, ElevenLabsEngine
+from services.media_scheduler import MediaScheduler, KIND_AUDIO, PRIORITY_INTERACTIVE
+from services.media_probe import MediaProbe
 
 # Инициализируем логгер
 logger = setup_logging(__name__)
@@ -16,13 +26,37 @@ logger = setup_logging(__name__)
 class VideoTranscriber:
     def __init__(self, models_dir: str = "models"):
         self.models_dir = models_dir
+        # Модели по языкам и уровням: быстрая дает черновик, точная - итоговый текст.
+        # Уровни без установленной модели пропускаются
         self.model_paths = {
-            'ru': os.path.join(models_dir, 'vosk-model-ru'),
-            'en': os.path.join(models_dir, 'vosk-model-en-us'),
-            'zh': os.path.join(models_dir, 'vosk-model-cn')
+            'ru': {
+                'fast': os.path.join(models_dir, 'vosk-model-small-ru'),
+                'accurate': os.path.join(models_dir, 'vosk-model-ru')
+            },
+            'en': {
+                'fast': os.path.join(models_dir, 'vosk-model-small-en-us'),
+                'accurate': os.path.join(models_dir, 'vosk-model-en-us')
+            },
+            'zh': {
+                'fast': os.path.join(models_dir, 'vosk-model-small-cn'),
+                'accurate': os.path.join(models_dir, 'vosk-model-cn')
+            }
         }
-        self.loaded_model = None
+        self.loaded_models: Dict[Tuple[str, str], Model] = {}
         self.current_lang = None
+        self._model_lock = threading.Lock()
+        
+        # Замеры времени по уровням для настройки выбора моделей
+        self.tier_timings = deque(maxlen=500)
+        
+        # Кэш транскрипций по отпечатку аудио и отпечатки уже извлеченных WAV
+        self.cache = TranscriptCache()
+        self.fingerprints: Dict[str, AudioFingerprint] = {}
+        
+        # Контрольные точки для продолжения прерванного распознавания
+        self.checkpoints = TranscriptionCheckpoints()
+        self.scheduler = MediaScheduler()
+        self.checkpoint_interval = 10  # Не чаще чем раз в 10 секунд
         
         # Новый параметр: использовать ли ElevenLabs
         self.use_elevenlabs = os.environ.get('USE_ELEVENLABS_TRANSCRIBER', 'false').lower() == 'true'
@@ -46,6 +80,17 @@ class VideoTranscriber:
         else:
             logger.info("Транскрайбер настроен без прокси")
         
+        # Общая сессия, ограничение одновременных запросов и статистика отправки
+        self.stt_config = ELEVENLABS_STT_CONFIG
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._request_semaphore = asyncio.Semaphore(self.stt_config['MAX_CONCURRENT_REQUESTS'])
+        self.upload_stats = {'requests': 0, 'bytes': 0, 'seconds': 0.0}
+        
+        # Движки распознавания и настройки хеджирования
+        self.hedge_config = STT_HEDGE_CONFIG
+        self.elevenlabs_engine = ElevenLabsEngine(self)
+        self.extra_engines: List[SpeechToTextEngine] = []
+        
         logger.info(f"Транскрайбер инициализирован. Использование ElevenLabs: {self.use_elevenlabs}")
 
 
@@ -60,29 +105,49 @@ class VideoTranscriber:
             ]
         )
 
-    def get_model(self, lang: str) -> Optional[Model]:
-        """Получение модели с очисткой предыдущей"""
-        if self.current_lang == lang and self.loaded_model:
-            return self.loaded_model
+    # Уровни моделей от быстрого черновика к точному результату
+    TIER_ORDER = ('fast', 'accurate')
+
+    def available_tiers(self, lang: str) -> List[str]:
+        """Уровни, для которых модель установлена, в порядке от быстрого к точному"""
+        tiers = self.model_paths.get(lang, {})
+        return [tier for tier in self.TIER_ORDER if tiers.get(tier) and os.path.exists(tiers[tier])]
 
-        # Очищаем предыдущую модель если она есть
-        if self.loaded_model:
-            del self.loaded_model
-            self.loaded_model = None
+    @staticmethod
+    def vosk_engine_name(tier: str) -> str:
+        """Имя движка для кэша и контрольных точек; точный уровень сохраняет старое имя"""
+        return 'vosk' if tier == 'accurate' else f'vosk-{tier}'
+
+    def get_model(self, lang: str, tier: Optional[str] = None) -> Optional[Model]:
+        """Получение модели с очисткой моделей других языков"""
+        # Распознавание идет в потоках пула, поэтому смена модели защищена блокировкой
+        with self._model_lock:
+            return self._load_model(lang, tier)
+
+    def _load_model(self, lang: str, tier: Optional[str]) -> Optional[Model]:
+        tiers = self.available_tiers(lang)
+        if not tiers:
+            logging.warning(f"Модель {lang} не найдена в {self.model_paths.get(lang)}")
+            return None
+        if tier not in tiers:
+            tier = tiers[-1]
+        
+        if (lang, tier) in self.loaded_models:
+            return self.loaded_models[(lang, tier)]
+
+        # Очищаем модели другого языка, уровни одного языка держим вместе
+        if self.current_lang != lang:
+            self.loaded_models.clear()
             self.current_lang = None
 
         try:
-            path = self.model_paths.get(lang)
-            if not path or not os.path.exists(path):
-                logging.warning(f"Модель {lang} не найдена в {path}")
-                return None
-
-            self.loaded_model = Model(path)
+            path = self.model_paths[lang][tier]
+            self.loaded_models[(lang, tier)] = Model(path)
             self.current_lang = lang
-            logging.info(f"Модель {lang} успешно загружена")
-            return self.loaded_model
+            logging.info(f"Модель {lang} ({tier}) успешно загружена")
+            return self.loaded_models[(lang, tier)]
         except Exception as e:
-            logging.error(f"Ошибка загрузки модели {lang}: {str(e)}")
+            logging.error(f"Ошибка загрузки модели {lang} ({tier}): {str(e)}")
             return None
 
     async def extract_audio(self, video_path: str, output_path: str) -> bool:
@@ -94,10 +159,14 @@ class VideoTranscriber:
                 logger.error(f"Видео файл не найден: {video_path}")
                 return False
                 
-            audio = AudioSegment.from_file(video_path)
-            audio = audio.set_frame_rate(16000)
-            audio = audio.set_channels(1)
-            audio.export(output_path, format="wav")
+            # Декодирование через общий планировщик и в пуле потоков, чтобы не блокировать event loop
+            async with self.scheduler.slot(KIND_AUDIO, PRIORITY_INTERACTIVE, label="extract_audio"):
+                loop = asyncio.get_running_loop()
+                fingerprint = await loop.run_in_executor(
+                    None, self._decode_to_wav, video_path, output_path
+                )
+            if fingerprint:
+                self.fingerprints[output_path] = fingerprint
             
             if not os.path.exists(output_path):
                 logger.error(f"Аудио файл не был создан: {output_path}")
@@ -110,8 +179,139 @@ class VideoTranscriber:
             logger.error(f"Ошибка при извлечении аудио: {str(e)}")
             return False
 
-    async def transcribe_with_elevenlabs(self, wav_path: str, lang: str) -> Optional[str]:
-        """Транскрибация аудио с помощью ElevenLabs API"""
+    @staticmethod
+    def _decode_to_wav(video_path: str, output_path: str) -> Optional[AudioFingerprint]:
+        """WAV 16 кГц моно; возвращает отпечаток, посчитанный по уже декодированному PCM"""
+        audio = MediaProbe().load_audio(video_path)
+        audio = audio.set_frame_rate(16000)
+        audio = audio.set_channels(1)
+        audio = audio.set_sample_width(2)
+        audio.export(output_path, format="wav")
+        return compute_audio_fingerprint(audio.raw_data, 16000)
+
+    # Параметры кодирования для отправки в ElevenLabs: аргументы ffmpeg, MIME тип, расширение
+    UPLOAD_CODECS = {
+        'opus': (['-c:a', 'libopus', '-application', 'voip', '-f', 'ogg'], 'audio/ogg', '.ogg'),
+        'flac': (['-c:a', 'flac', '-f', 'flac'], 'audio/flac', '.flac'),
+        'wav': (['-c:a', 'pcm_s16le', '-f', 'wav'], 'audio/wav', '.wav'),
+    }
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Общая сессия с пулом соединений для запросов к ElevenLabs"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.stt_config['MAX_CONCURRENT_REQUESTS'],
+                keepalive_timeout=60
+            )
+            session_kwargs = {
+                "headers": {
+                    "xi-api-key": self.api_key,
+                    "Accept": "application/json"
+                },
+                "connector": connector
+            }
+            if self.proxy_url:
+                session_kwargs["proxy"] = self.proxy_url
+                logger.debug("Используется прокси для ElevenLabs транскрибации")
+            else:
+                logger.debug("Прямое подключение к ElevenLabs для транскрибации")
+            self._session = aiohttp.ClientSession(**session_kwargs)
+        return self._session
+
+    async def close(self):
+        """Закрытие общей сессии ElevenLabs"""
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    async def _encoded_audio_stream(self, wav_path: str, start: float, duration: Optional[float], stats: Dict):
+        """Кодирование куска WAV на лету через ffmpeg с отдачей байтов по мере готовности"""
+        codec = self.stt_config['UPLOAD_CODEC']
+        codec_args = self.UPLOAD_CODECS.get(codec, self.UPLOAD_CODECS['opus'])[0]
+        
+        cmd = ['ffmpeg', '-v', 'error', '-ss', f"{start:.3f}"]
+        if duration:
+            cmd += ['-t', f"{duration:.3f}"]
+        cmd += ['-i', wav_path, '-vn', '-ac', '1']
+        cmd += codec_args
+        if codec == 'opus':
+            cmd += ['-b:a', self.stt_config['OPUS_BITRATE']]
+        cmd += ['pipe:1']
+        
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.DEVNULL
+        )
+        try:
+            while True:
+                chunk = await process.stdout.read(64 * 1024)
+                if not chunk:
+                    break
+                stats['bytes'] += len(chunk)
+                yield chunk
+            await process.wait()
+            if process.returncode != 0:
+                raise RuntimeError(f"ffmpeg завершился с кодом {process.returncode}")
+        finally:
+            if process.returncode is None:
+                process.kill()
+                await process.wait()
+
+    async def _transcribe_segment(self, wav_path: str, iso_lang_code: str, start: float,
+                                  duration: Optional[float]) -> Optional[Dict]:
+        """Отправка одного куска аудио в ElevenLabs с ограничением числа одновременных запросов"""
+        codec = self.stt_config['UPLOAD_CODEC']
+        _, content_type, ext = self.UPLOAD_CODECS.get(codec, self.UPLOAD_CODECS['opus'])
+        stats = {'bytes': 0}
+        
+        async with self._request_semaphore:
+            started = time.monotonic()
+            
+            form = aiohttp.FormData()
+            form.add_field('file',
+                           self._encoded_audio_stream(wav_path, start, duration, stats),
+                           filename=f"{os.path.splitext(os.path.basename(wav_path))[0]}{ext}",
+                           content_type=content_type)
+            form.add_field('model_id', 'scribe_v1')  # ID модели для транскрибации
+            if iso_lang_code:
+                form.add_field('language_code', iso_lang_code)
+            
+            timeout = aiohttp.ClientTimeout(total=self.stt_config['REQUEST_TIMEOUT'])
+            
+            async with self._get_session().post(
+                f"{self.stt_config['BASE_URL']}/speech-to-text",
+                data=form,
+                timeout=timeout
+            ) as response:
+                if response.status != 200:
+                    error_text = await response.text()
+                    logger.error(f"Ошибка API ElevenLabs: {response.status}, {error_text}")
+                    return None
+                response_data = await response.json()
+            
+            elapsed = time.monotonic() - started
+            self.upload_stats['requests'] += 1
+            self.upload_stats['bytes'] += stats['bytes']
+            self.upload_stats['seconds'] += elapsed
+            logger.info(
+                f"ElevenLabs: отправлено {stats['bytes']/1024:.1f} KB ({codec}) "
+                f"с {start:.0f} с, ответ за {elapsed:.2f} с"
+            )
+        
+        words = [
+            {'word': w.get('text'), 'start': (w.get('start') or 0) + start, 'end': (w.get('end') or 0) + start}
+            for w in response_data.get('words', [])
+            if w.get('type', 'word') == 'word'
+        ]
+        return {'text': response_data.get('text', ''), 'words': words}
+
+    async def transcribe_with_elevenlabs(self, wav_path: str, lang: str,
+                                         checkpoint_key: Optional[str] = None) -> Optional[Dict]:
+        """
+        Транскрибация аудио с помощью ElevenLabs API, возвращает текст и тайминги слов.
+        Готовые части длинного аудио сохраняются в контрольной точке и не отправляются повторно.
+        """
         try:
             if not self.api_key:
                 logger.error("API ключ ElevenLabs не настроен")
@@ -121,13 +321,11 @@ class VideoTranscriber:
                 logger.error(f"Файл не найден: {wav_path}")
                 return None
                 
-            file_size = os.path.getsize(wav_path)
-            logger.info(f"Начинаем транскрибацию файла {wav_path} размером {file_size/1024/1024:.2f} MB через ElevenLabs")
-            
-            
+            with wave.open(wav_path, "rb") as wf:
+                total_duration = wf.getnframes() / wf.getframerate()
+                bytes_per_second = wf.getframerate() * wf.getsampwidth() * wf.getnchannels()
             
-            # Базовый URL для API ElevenLabs
-            base_url = "https://api.elevenlabs.io/v1"
+            logger.info(f"Начинаем транскрибацию файла {wav_path} длительностью {total_duration:.0f} с через ElevenLabs")
             
             # Маппинг языковых кодов для ElevenLabs
             # ISO-639-3 коды языков (трехбуквенные)
@@ -138,83 +336,305 @@ class VideoTranscriber:
             }
             iso_lang_code = language_code_map.get(lang, lang)
             
-            # Настройка заголовков запроса
-            headers = {
-                "xi-api-key": self.api_key,
-                "Accept": "application/json"
-            }
-            
-                        
-            # Настройка сессии с прокси, если он указан
-            session_kwargs = {"headers": headers}
-            if self.proxy_url:
-                session_kwargs["proxy"] = self.proxy_url
-                logger.debug("Используется прокси для ElevenLabs транскрибации")
+            # Длинное аудио режем на части и отправляем параллельно, если это разрешено
+            chunk_duration = self.stt_config['CHUNK_DURATION']
+            if self.stt_config['SPLIT_LONG_AUDIO'] and total_duration > chunk_duration:
+                segments = [
+                    (start, chunk_duration)
+                    for start in range(0, math.ceil(total_duration), chunk_duration)
+                ]
+                logger.info(f"Аудио разбито на {len(segments)} частей по {chunk_duration} с")
             else:
-                logger.debug("Прямое подключение к ElevenLabs для транскрибации")
-                
-            async with aiohttp.ClientSession(**session_kwargs) as session:
-                # Создаем форму для отправки файла
-                form = aiohttp.FormData()
-                form.add_field('file', 
-                               open(wav_path, 'rb'),
-                               filename=os.path.basename(wav_path),
-                               content_type='audio/wav')
-                
-                # Добавляем необходимые параметры
-                form.add_field('model_id', 'scribe_v1')  # ID модели для транскрибации
-                
-                # Добавляем код языка в ISO формате, если он известен
-                if iso_lang_code:
-                    form.add_field('language_code', iso_lang_code)
-                    logger.info(f"Используем язык с кодом: {iso_lang_code}")
-                
-                # Увеличиваем таймаут для больших файлов
-                timeout = aiohttp.ClientTimeout(total=600)  # 10 минут
-                
-                # Отправляем запрос
-                async with session.post(
-                    f"{base_url}/speech-to-text",
-                    data=form,
-                    timeout=timeout
-                ) as response:
-                    if response.status == 200:
-                        response_data = await response.json()
-                        logger.info(f"Успешный ответ от ElevenLabs API")
-                        
-                        # Извлекаем текст из ответа
-                        transcribed_text = response_data.get('text', '')
-                        if transcribed_text:
-                            logger.info(f"Получено {len(transcribed_text)} символов текста")
-                            return transcribed_text
-                        else:
-                            logger.warning("Получен пустой текст от API")
-                            return None
-                    else:
-                        error_text = await response.text()
-                        logger.error(f"Ошибка API ElevenLabs: {response.status}, {error_text}")
-                        return None
+                segments = [(0, None)]
+            
+            # Части, распознанные в предыдущих попытках
+            done: Dict[int, Dict] = {}
+            checkpoint = await self.checkpoints.load(checkpoint_key) if checkpoint_key else None
+            if checkpoint:
+                done = {segment['start']: segment for segment in checkpoint['segments']}
+                logger.info(f"Продолжаем с контрольной точки: готово {len(done)}/{len(segments)} частей")
+            
+            async def run_segment(start: int, duration: Optional[int]) -> Optional[Dict]:
+                result = await self._transcribe_segment(wav_path, iso_lang_code, start, duration)
+                if result is not None and checkpoint_key and len(segments) > 1:
+                    done[start] = {'start': start, **result}
+                    # Смещение - конец непрерывного префикса готовых частей
+                    prefix_end = 0
+                    while prefix_end in done:
+                        prefix_end += chunk_duration
+                    await self.checkpoints.save(
+                        checkpoint_key,
+                        int(min(prefix_end, total_duration) * bytes_per_second),
+                        list(done.values())
+                    )
+                return result
+            
+            pending = [(start, duration) for start, duration in segments if start not in done]
+            results = await asyncio.gather(*[
+                run_segment(start, duration) for start, duration in pending
+            ])
+            
+            if any(result is None for result in results):
+                return None
+            
+            for (start, _), result in zip(pending, results):
+                done[start] = {'start': start, **result}
+            results = [done[start] for start, _ in segments]
+            
+            transcribed_text = ' '.join(r['text'].strip() for r in results if r['text'].strip())
+            if not transcribed_text:
+                logger.warning("Получен пустой текст от API")
+                return None
+            
+            logger.info(f"Получено {len(transcribed_text)} символов текста")
+            return {
+                'text': transcribed_text,
+                'words': [word for r in results for word in r['words']]
+            }
 
         except Exception as e:
             logger.error(f"Ошибка при транскрибации через ElevenLabs: {e}")
             return None
 
-    async def transcribe(self, wav_path: str, lang: str) -> Optional[str]:
-        """Транскрибация аудио файла на заданном языке"""
-        # Сначала пробуем ElevenLabs, если включено
+    async def _get_fingerprint(self, wav_path: str) -> Optional[AudioFingerprint]:
+        """Отпечаток аудио: из извлечения или, если его нет, по WAV файлу"""
+        fingerprint = self.fingerprints.get(wav_path)
+        if not fingerprint:
+            fingerprint = await asyncio.get_running_loop().run_in_executor(None, fingerprint_wav, wav_path)
+            if fingerprint:
+                self.fingerprints[wav_path] = fingerprint
+        return fingerprint
+
+    def _record_timing(self, lang: str, engine: str, wav_path: str, elapsed: float):
+        """Сохранение замера времени распознавания для уровня"""
+        try:
+            with wave.open(wav_path, "rb") as wf:
+                audio_seconds = wf.getnframes() / wf.getframerate()
+        except Exception:
+            audio_seconds = 0
+        rtf = elapsed / audio_seconds if audio_seconds else 0
+        self.tier_timings.append({
+            'lang': lang,
+            'engine': engine,
+            'audio_seconds': audio_seconds,
+            'elapsed': elapsed,
+            'rtf': rtf
+        })
+        logger.info(f"Распознавание {engine} ({lang}): {audio_seconds:.0f} с аудио за {elapsed:.1f} с (RTF {rtf:.2f})")
+
+    def register_engine(self, engine: SpeechToTextEngine):
+        """Подключение дополнительного движка распознавания (например, другой локальной модели)"""
+        self.extra_engines.append(engine)
+        logger.info(f"Подключен движок распознавания {engine.name}")
+
+    def _candidate_engines(self, lang: str, duration: float) -> List[SpeechToTextEngine]:
+        """Движки для лучшего результата: облачные впереди, локальные - запасные"""
+        engines: List[SpeechToTextEngine] = []
         if self.use_elevenlabs:
+            engines.append(self.elevenlabs_engine)
+        engines.extend(self.extra_engines)
+        tiers = self.available_tiers(lang)
+        if tiers:
+            engines.append(VoskEngine(self, tiers[-1]))
+        engines = [engine for engine in engines if engine.supports(lang, duration)]
+        return sorted(engines, key=lambda engine: engine.capabilities.local)
+
+    async def _run_engines(self, engines: List[SpeechToTextEngine], wav_path: str, lang: str,
+                           on_partial: Optional[Callable[[str], None]],
+                           checkpoint_keys: Dict[str, str]) -> Tuple[Optional[Dict], Optional[str]]:
+        """Запуск движков по очереди или с хеджированием облачного движка локальным"""
+        fallback = next((engine for engine in engines[1:] if engine.capabilities.local), None)
+        if self.hedge_config['MODE'] != 'off' and not engines[0].capabilities.local and fallback:
+            return await self._run_hedged(engines[0], fallback, wav_path, lang, on_partial, checkpoint_keys)
+        
+        for engine in engines:
             try:
-                logger.info("Пробуем использовать ElevenLabs для транскрибации")
-                result = await self.transcribe_with_elevenlabs(wav_path, lang)
+                logger.info(f"Распознавание движком {engine.name}")
+                result = await engine.transcribe(wav_path, lang, on_partial, checkpoint_keys[engine.name])
                 if result:
-                    return result
-                logger.warning("ElevenLabs не вернул результат, переключаемся на локальную модель")
+                    return result, engine.name
+                logger.warning(f"{engine.name} не вернул результат, переключаемся на следующий движок")
             except Exception as e:
-                logger.error(f"Ошибка при использовании ElevenLabs: {e}")
-                logger.info("Переключаемся на локальную модель")
+                logger.error(f"Ошибка при использовании {engine.name}: {e}")
+        return None, None
+
+    async def _run_hedged(self, primary: SpeechToTextEngine, fallback: SpeechToTextEngine,
+                          wav_path: str, lang: str, on_partial: Optional[Callable[[str], None]],
+                          checkpoint_keys: Dict[str, str]) -> Tuple[Optional[Dict], Optional[str]]:
+        """
+        Хеджирование: запасной локальный движок стартует после задержки (или сразу
+        в режиме parallel), используется первый успешный результат, второй движок
+        останавливается. Отказ основного движка запускает запасной немедленно.
+        """
+        delay = 0 if self.hedge_config['MODE'] == 'parallel' else self.hedge_config['DELAY']
+        cancel_event = threading.Event()
+        tasks: Dict[asyncio.Task, SpeechToTextEngine] = {
+            asyncio.create_task(primary.transcribe(
+                wav_path, lang, None, checkpoint_keys[primary.name], cancel_event
+            )): primary
+        }
+        fallback_started = False
+        
+        def start_fallback():
+            nonlocal fallback_started
+            fallback_started = True
+            logger.info(f"Хеджирование: запускаем {fallback.name} параллельно с {primary.name}")
+            task = asyncio.create_task(fallback.transcribe(
+                wav_path, lang, on_partial, checkpoint_keys[fallback.name], cancel_event
+            ))
+            tasks[task] = fallback
+        
+        try:
+            while tasks:
+                done, _ = await asyncio.wait(
+                    tasks,
+                    timeout=None if fallback_started else delay,
+                    return_when=asyncio.FIRST_COMPLETED
+                )
+                if not done:
+                    start_fallback()
+                    continue
+                
+                for task in done:
+                    engine = tasks.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        logger.error(f"Ошибка при использовании {engine.name}: {e}")
+                        result = None
+                    if result:
+                        logger.info(f"Хеджирование: первым ответил {engine.name}")
+                        return result, engine.name
+                    logger.warning(f"{engine.name} не вернул результат")
+                
+                if not fallback_started:
+                    start_fallback()
+            return None, None
+        finally:
+            # Проигравший движок останавливаем по событию; задачу отменяем на случай ожидания вне проверок
+            cancel_event.set()
+            for task in tasks:
+                task.cancel()
+
+    async def transcribe(self, wav_path: str, lang: str,
+                         on_partial: Optional[Callable[[str], None]] = None,
+                         tier: Optional[str] = None) -> Optional[str]:
+        """
+        Транскрибация аудио файла на заданном языке
+        
+        Args:
+            wav_path: Путь к WAV файлу (16 кГц, моно)
+            lang: Код языка
+            on_partial: Вызывается в event loop с накопленным текстом после каждой завершенной фразы
+            tier: Уровень локальной модели; None - лучший доступный результат
+        """
+        fingerprint = await self._get_fingerprint(wav_path)
+        tiers = self.available_tiers(lang)
+        draft = bool(tier and tiers and tier != tiers[-1])
+        
+        try:
+            with wave.open(wav_path, "rb") as wf:
+                duration = wf.getnframes() / wf.getframerate()
+        except Exception:
+            duration = 0
+        
+        best_engines = self._candidate_engines(lang, duration)
+        engines = [VoskEngine(self, tier)] if draft else best_engines
+        if not engines:
+            logger.warning(f"Нет движка распознавания для языка {lang}")
+            return None
         
-        # Используем локальную модель Vosk, если ElevenLabs не сработал или отключен
-        model = self.get_model(lang)
+        # Проверяем кэш: повтор того же ролика не требует ни распознавания, ни запроса к API.
+        # Для черновика подходит и уже готовый точный результат
+        cache_engines = [engine.name for engine in best_engines]
+        if draft:
+            cache_engines.append(engines[0].name)
+        cached = await self.cache.get(fingerprint, lang, cache_engines)
+        if cached:
+            logger.info(f"Транскрипция найдена в кэше ({cached['engine']}, {fingerprint.key})")
+            if not draft:
+                self.fingerprints.pop(wav_path, None)
+            return cached['text']
+        
+        checkpoint_keys = {
+            engine.name: self.checkpoints.make_key(fingerprint, wav_path, lang, engine.name)
+            for engine in engines
+        }
+        started = time.monotonic()
+        
+        result, engine_name = await self._run_engines(engines, wav_path, lang, on_partial, checkpoint_keys)
+        
+        if not result:
+            return None
+        
+        self._record_timing(lang, engine_name, wav_path, time.monotonic() - started)
+        
+        # Задача завершена - контрольные точки больше не нужны
+        for key in checkpoint_keys.values():
+            await self.checkpoints.delete(key)
+        
+        try:
+            await self.cache.put(fingerprint, lang, engine_name, result['text'], result['words'])
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении транскрипции в кэш: {e}")
+        if not draft:
+            self.fingerprints.pop(wav_path, None)
+        
+        return result['text']
+
+    async def transcribe_tiered(
+        self,
+        wav_path: str,
+        lang: str,
+        on_refined: Callable[[Optional[str]], Awaitable[None]],
+        on_partial: Optional[Callable[[str], None]] = None
+    ) -> Tuple[Optional[str], Optional[asyncio.Task]]:
+        """
+        Быстрый черновик сейчас и точный текст в фоне.
+        
+        Returns:
+            Tuple: текст черновика и фоновая задача уточнения. Задача вызывает on_refined
+            с точным текстом (или None при ошибке). Если уровней меньше двух или точный
+            текст уже в кэше, сразу возвращается итоговый текст без задачи.
+        """
+        tiers = self.available_tiers(lang)
+        if len(tiers) < 2:
+            return await self.transcribe(wav_path, lang, on_partial), None
+        
+        fingerprint = await self._get_fingerprint(wav_path)
+        final_engines = [engine.name for engine in self._candidate_engines(lang, 0)]
+        cached = await self.cache.get(fingerprint, lang, final_engines)
+        if cached:
+            logger.info(f"Точная транскрипция найдена в кэше ({cached['engine']}), черновик не нужен")
+            self.fingerprints.pop(wav_path, None)
+            return cached['text'], None
+        
+        draft_text = await self.transcribe(wav_path, lang, on_partial, tier=tiers[0])
+        if not draft_text:
+            return await self.transcribe(wav_path, lang, on_partial), None
+        
+        async def refine():
+            text = None
+            try:
+                text = await self.transcribe(wav_path, lang)
+            except Exception as e:
+                logger.error(f"Ошибка при уточнении транскрипции: {e}")
+            await on_refined(text)
+        
+        return draft_text, asyncio.create_task(refine())
+
+    def transcribe_with_vosk(self, wav_path: str, lang: str,
+                             on_partial: Optional[Callable[[str], None]] = None,
+                             checkpoint_key: Optional[str] = None,
+                             tier: Optional[str] = None,
+                             cancel_event: Optional[threading.Event] = None) -> Optional[Dict]:
+        """
+        Транскрибация локальной моделью Vosk, возвращает текст и тайминги слов.
+        
+        После каждой завершенной фразы позиция в PCM и готовые сегменты сохраняются
+        в контрольную точку, и следующая попытка начинает с этой позиции.
+        """
+        model = self.get_model(lang, tier)
         if not model:
             return None
 
@@ -223,25 +643,64 @@ class VideoTranscriber:
                 if wf.getnchannels() != 1 or wf.getsampwidth() != 2:
                     raise Exception("Неправильный формат аудио")
 
+                frame_size = wf.getsampwidth() * wf.getnchannels()
+                segments = []
+                offset_frames = 0
+                
+                checkpoint = self.checkpoints.load_sync(checkpoint_key) if checkpoint_key else None
+                if checkpoint and checkpoint['offset_bytes'] // frame_size <= wf.getnframes():
+                    segments = checkpoint['segments']
+                    offset_frames = checkpoint['offset_bytes'] // frame_size
+                    wf.setpos(offset_frames)
+                    logger.info(
+                        f"Продолжаем распознавание с {offset_frames / wf.getframerate():.1f} с "
+                        f"({len(segments)} готовых фраз)"
+                    )
+                    if on_partial and segments:
+                        on_partial(' '.join(segment['text'] for segment in segments))
+
+                # Новый распознаватель считает время от точки продолжения
+                offset_seconds = offset_frames / wf.getframerate()
                 rec = KaldiRecognizer(model, wf.getframerate())
                 rec.SetWords(True)
+                
+                def add_segment(part_result: Dict):
+                    words = part_result.get('result', [])
+                    for word in words:
+                        word['start'] = word.get('start', 0) + offset_seconds
+                        word['end'] = word.get('end', 0) + offset_seconds
+                    segments.append({'text': part_result['text'], 'words': words})
 
-                results = []
+                last_checkpoint = time.monotonic()
                 while True:
+                    if cancel_event is not None and cancel_event.is_set():
+                        # Результат уже получен другим движком; прогресс сохранен в контрольной точке
+                        logger.info("Распознавание Vosk остановлено")
+                        return None
                     data = wf.readframes(4000)
                     if len(data) == 0:
                         break
                     if rec.AcceptWaveform(data):
                         part_result = json.loads(rec.Result())
                         if part_result.get('text', ''):
-                            results.append(part_result['text'])
+                            add_segment(part_result)
+                            if on_partial:
+                                on_partial(' '.join(segment['text'] for segment in segments))
+                        
+                        # Фраза завершена, буфер распознавателя пуст - позиция безопасна для продолжения
+                        if checkpoint_key and time.monotonic() - last_checkpoint >= self.checkpoint_interval:
+                            self.checkpoints.save_sync(checkpoint_key, wf.tell() * frame_size, segments)
+                            last_checkpoint = time.monotonic()
 
                 part_result = json.loads(rec.FinalResult())
                 if part_result.get('text', ''):
-                    results.append(part_result['text'])
+                    add_segment(part_result)
 
-                return ' '.join(results)
+                return {
+                    'text': ' '.join(segment['text'] for segment in segments),
+                    'words': [word for segment in segments for word in segment['words']]
+                }
 
         except Exception as e:
             logging.error(f"Ошибка при транскрибации с локальной моделью: {str(e)}")
-            return None
\ No newline at end of file
+            return None
@@ -0,0 +1,395 @@
+import asyncio
+import sqlite3
+import json
+import time
+import hashlib
+import wave
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from config.config import setup_logging, DB_FILE, TRANSCRIPT_CACHE_CONFIG
+
+logger = setup_logging(__name__)
+
+# Параметры суботпечатков: окно 256 мс с шагом 32 мс, 33 полосы 300-2000 Гц
+FP_FRAME_SECONDS = 0.256
+FP_HOP_SECONDS = 0.032
+FP_BAND_EDGES_HZ = np.geomspace(300, 2000, 34)
+FP_MIN_FRAMES = 16
+# Суботпечатки тишины и клиппинга одинаковы у любого аудио - в индекс не попадают
+FP_DEGENERATE = (0, 0xFFFFFFFF)
+
+
+@dataclass
+class AudioFingerprint:
+    """
+    Отпечаток аудио: 32-битный суботпечаток на каждый кадр.
+
+    key - точный идентификатор (хэш суботпечатков и длительности в секундах), по нему
+    сохраняются транскрипции и контрольные точки; похожее аудио с другим key находится
+    сравнением суботпечатков (см. TranscriptCache.find_similar).
+    """
+    key: str
+    duration: float
+    subprints: np.ndarray
+
+
+def compute_subfingerprints(samples: np.ndarray, sample_rate: int) -> np.ndarray:
+    """
+    Суботпечатки по схеме Haitsma-Kalker: бит m кадра n - знак разности энергий
+    соседних полос, взятой относительно предыдущего кадра. Знаки не меняются от
+    громкости, а перекодирование, шум и срезанные края портят лишь часть бит.
+    """
+    frame_len = int(sample_rate * FP_FRAME_SECONDS)
+    hop = int(sample_rate * FP_HOP_SECONDS)
+    if len(samples) < frame_len + hop * FP_MIN_FRAMES:
+        return np.empty(0, dtype=np.uint32)
+
+    edges = np.round(FP_BAND_EDGES_HZ * frame_len / sample_rate).astype(int)
+    window = np.hanning(frame_len).astype(np.float32)
+    frames = np.lib.stride_tricks.sliding_window_view(samples, frame_len)[::hop]
+
+    # Кадры обрабатываются частями, чтобы не держать весь спектр в памяти
+    energy = np.empty((len(frames), len(edges) - 1), dtype=np.float64)
+    for start in range(0, len(frames), 512):
+        chunk = frames[start:start + 512].astype(np.float32) * window
+        power = np.abs(np.fft.rfft(chunk, axis=1)[:, :edges[-1]]) ** 2
+        energy[start:start + len(chunk)] = np.add.reduceat(power, edges[:-1], axis=1)
+
+    band_diff = energy[:, :-1] - energy[:, 1:]
+    bits = (band_diff[1:] - band_diff[:-1]) > 0
+    weights = np.left_shift(np.uint64(1), np.arange(bits.shape[1], dtype=np.uint64))
+    return (bits.astype(np.uint64) @ weights).astype(np.uint32)
+
+
+def compute_audio_fingerprint(pcm: bytes, sample_rate: int = 16000,
+                              duration: Optional[float] = None) -> Optional[AudioFingerprint]:
+    """
+    Отпечаток аудио по декодированному PCM (моно, 16 бит).
+
+    Используется начало длиной FINGERPRINT_SECONDS; duration - полная длительность,
+    если передан не весь PCM. Длительность входит в key: у полной записи и ее отрезка
+    (или у роликов с одной заставкой) начало одинаковое, но key разный.
+    """
+    samples = np.frombuffer(pcm, dtype=np.int16)
+    if duration is None:
+        duration = len(samples) / sample_rate
+    samples = samples[:int(TRANSCRIPT_CACHE_CONFIG['FINGERPRINT_SECONDS'] * sample_rate)]
+
+    subprints = compute_subfingerprints(samples, sample_rate)
+    if len(subprints) < FP_MIN_FRAMES:
+        return None
+    digest = hashlib.blake2b(subprints.tobytes(), digest_size=16)
+    digest.update(str(round(duration)).encode())
+    return AudioFingerprint(digest.hexdigest(), duration, subprints)
+
+
+def fingerprint_wav(wav_path: str) -> Optional[AudioFingerprint]:
+    """Отпечаток уже извлеченного WAV файла"""
+    try:
+        with wave.open(wav_path, "rb") as wf:
+            if wf.getnchannels() != 1 or wf.getsampwidth() != 2:
+                return None
+            rate = wf.getframerate()
+            frames = min(wf.getnframes(), int(TRANSCRIPT_CACHE_CONFIG['FINGERPRINT_SECONDS'] * rate))
+            return compute_audio_fingerprint(wf.readframes(frames), rate, wf.getnframes() / rate)
+    except Exception as e:
+        logger.error(f"Ошибка при вычислении отпечатка {wav_path}: {e}")
+        return None
+
+
+def bit_error_rate(first: np.ndarray, second: np.ndarray) -> float:
+    """Доля различающихся бит двух выровненных последовательностей суботпечатков"""
+    differing = np.unpackbits(np.bitwise_xor(first, second).view(np.uint8)).sum()
+    return float(differing) / (32 * len(first))
+
+
+class TranscriptCache:
+    """
+    Постоянный кэш транскрипций по отпечатку аудио, языку и движку.
+
+    Сначала ищется точное совпадение key, затем похожий отпечаток: кандидаты
+    находятся по индексу суботпечатков (у того же аудио часть из них совпадает
+    точно) вместе со сдвигом, и принимаются, если после выравнивания доля
+    различающихся бит меньше MAX_BIT_ERROR, а длительности почти равны.
+    Запросы к базе выполняются в отдельном потоке, чтобы не блокировать event loop.
+    """
+
+    def __init__(self, db_file: str = DB_FILE, config: dict = TRANSCRIPT_CACHE_CONFIG):
+        self.db_file = db_file
+        self.config = config
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="transcript-cache")
+        self.init_db()
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def init_db(self):
+        """Создание таблиц кэша рядом с url_logs"""
+        conn = sqlite3.connect(self.db_file)
+        c = conn.cursor()
+        c.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'audio_fingerprints'")
+        migrating = c.fetchone() is None
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS transcript_cache (
+                fingerprint TEXT NOT NULL,
+                lang TEXT NOT NULL,
+                engine TEXT NOT NULL,
+                text TEXT NOT NULL,
+                words TEXT,
+                created_at INTEGER,
+                hits INTEGER DEFAULT 0,
+                PRIMARY KEY (fingerprint, lang, engine)
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS audio_fingerprints (
+                fingerprint TEXT PRIMARY KEY,
+                duration REAL NOT NULL,
+                subprints BLOB NOT NULL,
+                created_at INTEGER
+            )
+        ''')
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS audio_fingerprint_index (
+                subprint INTEGER NOT NULL,
+                fingerprint TEXT NOT NULL,
+                position INTEGER NOT NULL
+            )
+        ''')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_audio_fingerprint_index_subprint '
+                  'ON audio_fingerprint_index(subprint)')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_audio_fingerprint_index_fingerprint '
+                  'ON audio_fingerprint_index(fingerprint)')
+        if migrating:
+            # Записи со старыми точными хэшами нельзя сравнить с новыми отпечатками
+            c.execute('DELETE FROM transcript_cache')
+        self._prune(c)
+        conn.commit()
+        conn.close()
+
+    def _prune(self, c: sqlite3.Cursor):
+        """Удаление устаревших транскрипций и отпечатков, на которые они больше не ссылаются"""
+        c.execute('DELETE FROM transcript_cache WHERE created_at < ?',
+                  (int(time.time()) - self.config['PERSIST_DAYS'] * 86400,))
+        c.execute('''
+            SELECT fingerprint FROM audio_fingerprints
+            WHERE fingerprint NOT IN (SELECT fingerprint FROM transcript_cache)
+        ''')
+        stale = c.fetchall()
+        c.executemany('DELETE FROM audio_fingerprint_index WHERE fingerprint = ?', stale)
+        c.executemany('DELETE FROM audio_fingerprints WHERE fingerprint = ?', stale)
+        if stale:
+            logger.info(f"Из кэша транскрипций удалено отпечатков: {len(stale)}")
+
+    def find_similar(self, conn: sqlite3.Connection, fingerprint: AudioFingerprint) -> Optional[str]:
+        """key сохраненного отпечатка того же аудио или None"""
+        query = fingerprint.subprints
+        positions = np.unique(np.linspace(0, len(query) - 1, min(len(query), self.config['MAX_PROBES'])).astype(int))
+        probes: Dict[int, List[int]] = {}
+        for position in positions:
+            value = int(query[position])
+            if value not in FP_DEGENERATE:
+                probes.setdefault(value, []).append(int(position))
+        if not probes:
+            return None
+
+        # Голоса за пары (отпечаток, сдвиг): у того же аудио совпадения ложатся на один сдвиг
+        votes: Counter = Counter()
+        values = list(probes)
+        for start in range(0, len(values), 500):
+            batch = values[start:start + 500]
+            rows = conn.execute(
+                f'SELECT subprint, fingerprint, position FROM audio_fingerprint_index '
+                f'WHERE subprint IN ({",".join("?" * len(batch))})', batch
+            ).fetchall()
+            for subprint, key, stored_position in rows:
+                for query_position in probes[subprint]:
+                    votes[(key, stored_position - query_position)] += 1
+
+        checked = set()
+        for (key, offset), _ in votes.most_common():
+            if key in checked:
+                continue
+            checked.add(key)
+            if len(checked) > self.config['MAX_CANDIDATES']:
+                break
+            row = conn.execute('SELECT duration, subprints FROM audio_fingerprints WHERE fingerprint = ?',
+                               (key,)).fetchone()
+            if row and self._matches(fingerprint, row[0], np.frombuffer(row[1], dtype=np.uint32), offset):
+                return key
+        return None
+
+    def _matches(self, fingerprint: AudioFingerprint, duration: float, stored: np.ndarray, offset: int) -> bool:
+        tolerance = max(3.0, self.config['DURATION_TOLERANCE'] * max(duration, fingerprint.duration))
+        if abs(duration - fingerprint.duration) > tolerance:
+            return False
+        query = fingerprint.subprints
+        first = max(0, -offset)
+        last = min(len(query), len(stored) - offset)
+        if last - first < self.config['MIN_OVERLAP'] * min(len(query), len(stored)):
+            return False
+        error = bit_error_rate(query[first:last], stored[first + offset:last + offset])
+        return error < self.config['MAX_BIT_ERROR']
+
+    async def get(self, fingerprint: Optional[AudioFingerprint], lang: str, engines: List[str]) -> Optional[Dict]:
+        """Поиск транскрипции; движки перебираются в порядке предпочтения"""
+        if not fingerprint:
+            return None
+        return await self._run(self._get, fingerprint, lang, engines)
+
+    def _get(self, fingerprint: AudioFingerprint, lang: str, engines: List[str]) -> Optional[Dict]:
+        conn = sqlite3.connect(self.db_file)
+        try:
+            cached = self._lookup(conn, fingerprint.key, lang, engines)
+            if cached is None:
+                # Точного совпадения нет - ищем то же аудио с другим key
+                similar = self.find_similar(conn, fingerprint)
+                if similar and similar != fingerprint.key:
+                    cached = self._lookup(conn, similar, lang, engines)
+            return cached
+        finally:
+            conn.close()
+
+    @staticmethod
+    def _lookup(conn: sqlite3.Connection, key: str, lang: str, engines: List[str]) -> Optional[Dict]:
+        """Транскрипция по key; движки перебираются в порядке предпочтения"""
+        c = conn.cursor()
+        for engine in engines:
+            c.execute('''
+                SELECT text, words FROM transcript_cache
+                WHERE fingerprint = ? AND lang = ? AND engine = ?
+            ''', (key, lang, engine))
+            row = c.fetchone()
+            if row:
+                c.execute('''
+                    UPDATE transcript_cache SET hits = hits + 1
+                    WHERE fingerprint = ? AND lang = ? AND engine = ?
+                ''', (key, lang, engine))
+                conn.commit()
+                return {
+                    'text': row[0],
+                    'words': json.loads(row[1]) if row[1] else [],
+                    'engine': engine
+                }
+        return None
+
+    async def put(self, fingerprint: Optional[AudioFingerprint], lang: str, engine: str, text: str,
+                  words: Optional[List[Dict]] = None):
+        """Сохранение транскрипции вместе с таймингами слов и отпечатка для поиска похожего"""
+        if not fingerprint or not text:
+            return
+        await self._run(self._put, fingerprint, lang, engine, text, words)
+
+    def _put(self, fingerprint: AudioFingerprint, lang: str, engine: str, text: str,
+             words: Optional[List[Dict]]):
+        now = int(time.time())
+        conn = sqlite3.connect(self.db_file)
+        try:
+            c = conn.cursor()
+            c.execute('''
+                INSERT OR IGNORE INTO audio_fingerprints (fingerprint, duration, subprints, created_at)
+                VALUES (?, ?, ?, ?)
+            ''', (fingerprint.key, fingerprint.duration, fingerprint.subprints.tobytes(), now))
+            if c.rowcount:
+                c.executemany(
+                    'INSERT INTO audio_fingerprint_index (subprint, fingerprint, position) VALUES (?, ?, ?)',
+                    [(int(value), fingerprint.key, position)
+                     for position, value in enumerate(fingerprint.subprints) if int(value) not in FP_DEGENERATE]
+                )
+            c.execute('''
+                INSERT OR REPLACE INTO transcript_cache (fingerprint, lang, engine, text, words, created_at, hits)
+                VALUES (?, ?, ?, ?, ?, ?, 0)
+            ''', (fingerprint.key, lang, engine, text, json.dumps(words or [], ensure_ascii=False), now))
+            conn.commit()
+        finally:
+            conn.close()
+
+
+class TranscriptionCheckpoints:
+    """
+    Контрольные точки незавершенных транскрипций.
+
+    Хранит смещение в байтах PCM, до которого распознавание уже выполнено,
+    и готовые сегменты. Повторная попытка или перезапуск процесса продолжает
+    работу с последней точки, а не с начала файла.
+
+    Из event loop используются load/save/delete (запись в отдельном потоке, по
+    порядку вызовов), из рабочих потоков распознавания - варианты *_sync.
+    """
+
+    def __init__(self, db_file: str = DB_FILE, max_age: int = 24 * 3600):
+        self.db_file = db_file
+        self.max_age = max_age
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="transcript-checkpoints")
+        self.init_db()
+
+    async def _run(self, func, *args):
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def init_db(self):
+        """Создание таблицы и удаление устаревших точек"""
+        conn = sqlite3.connect(self.db_file)
+        c = conn.cursor()
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS transcription_checkpoints (
+                job_key TEXT PRIMARY KEY,
+                offset_bytes INTEGER NOT NULL,
+                segments TEXT NOT NULL,
+                updated_at INTEGER
+            )
+        ''')
+        c.execute('DELETE FROM transcription_checkpoints WHERE updated_at < ?',
+                  (int(time.time()) - self.max_age,))
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def make_key(fingerprint: Optional[AudioFingerprint], wav_path: str, lang: str, engine: str) -> str:
+        """Ключ задачи: по отпечатку, чтобы точка пережила повторное извлечение аудио"""
+        return f"{fingerprint.key if fingerprint else wav_path}:{lang}:{engine}"
+
+    async def load(self, job_key: str) -> Optional[Dict]:
+        return await self._run(self.load_sync, job_key)
+
+    async def save(self, job_key: str, offset_bytes: int, segments: List[Dict]):
+        await self._run(self.save_sync, job_key, offset_bytes, segments)
+
+    async def delete(self, job_key: str):
+        await self._run(self.delete_sync, job_key)
+
+    def load_sync(self, job_key: str) -> Optional[Dict]:
+        conn = sqlite3.connect(self.db_file)
+        try:
+            c = conn.cursor()
+            c.execute('SELECT offset_bytes, segments FROM transcription_checkpoints WHERE job_key = ?',
+                      (job_key,))
+            row = c.fetchone()
+            if not row:
+                return None
+            return {'offset_bytes': row[0], 'segments': json.loads(row[1])}
+        finally:
+            conn.close()
+
+    def save_sync(self, job_key: str, offset_bytes: int, segments: List[Dict]):
+        conn = sqlite3.connect(self.db_file)
+        try:
+            conn.execute('''
+                INSERT OR REPLACE INTO transcription_checkpoints (job_key, offset_bytes, segments, updated_at)
+                VALUES (?, ?, ?, ?)
+            ''', (job_key, offset_bytes, json.dumps(segments, ensure_ascii=False), int(time.time())))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def delete_sync(self, job_key: str):
+        conn = sqlite3.connect(self.db_file)
+        try:
+            conn.execute('DELETE FROM transcription_checkpoints WHERE job_key = ?', (job_key,))
+            conn.commit()
+        finally:
+            conn.close()
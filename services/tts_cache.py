@@ -0,0 +1,139 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from typing import Dict, Optional
+
+from config.config import setup_logging, DB_FILE, TTS_CONFIG
+
+logger = setup_logging(__name__)
+
+
+class TTSCache:
+    """
+    Кэш результатов озвучки по содержимому запроса.
+
+    MP3 хранятся на диске, индекс - в SQLite рядом с url_logs. При превышении
+    бюджета байт файлы вытесняются по давности использования, но запись
+    с Telegram file_id остается: повтор по-прежнему отправляется без API и загрузки.
+    """
+
+    def __init__(self, db_file: str = DB_FILE, cache_dir: str = TTS_CONFIG['CACHE_DIR'],
+                 max_bytes: int = TTS_CONFIG['CACHE_MAX_BYTES']):
+        self.db_file = db_file
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self.init_db()
+
+    def init_db(self):
+        conn = sqlite3.connect(self.db_file)
+        c = conn.cursor()
+        c.execute('''
+            CREATE TABLE IF NOT EXISTS tts_cache (
+                cache_key TEXT PRIMARY KEY,
+                path TEXT,
+                size INTEGER DEFAULT 0,
+                file_id TEXT,
+                created_at INTEGER,
+                last_used INTEGER,
+                hits INTEGER DEFAULT 0
+            )
+        ''')
+        c.execute('CREATE INDEX IF NOT EXISTS idx_tts_cache_last_used ON tts_cache(last_used)')
+        conn.commit()
+        conn.close()
+
+    @staticmethod
+    def make_key(text: str, voice_id: str, stability: float, similarity_boost: float, model_id: str) -> str:
+        """Ключ по всем параметрам, влияющим на результат синтеза"""
+        payload = json.dumps([text, voice_id, stability, similarity_boost, model_id], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, cache_key: str) -> Optional[Dict]:
+        """Запись кэша: {'path': str|None, 'file_id': str|None}"""
+        conn = sqlite3.connect(self.db_file)
+        try:
+            c = conn.cursor()
+            c.execute('SELECT path, file_id FROM tts_cache WHERE cache_key = ?', (cache_key,))
+            row = c.fetchone()
+            if not row:
+                return None
+
+            path, file_id = row
+            if path and not os.path.exists(path):
+                path = None
+                c.execute('UPDATE tts_cache SET path = NULL, size = 0 WHERE cache_key = ?', (cache_key,))
+            if not path and not file_id:
+                c.execute('DELETE FROM tts_cache WHERE cache_key = ?', (cache_key,))
+                conn.commit()
+                return None
+
+            c.execute('UPDATE tts_cache SET last_used = ?, hits = hits + 1 WHERE cache_key = ?',
+                      (int(time.time()), cache_key))
+            conn.commit()
+            return {'path': path, 'file_id': file_id}
+        finally:
+            conn.close()
+
+    def put_file(self, cache_key: str, src_path: str) -> str:
+        """
+        Перенос готового MP3 в кэш без чтения в память; возвращает путь в кэше.
+        Файл только что сохраненной записи при вытеснении не удаляется.
+        """
+        path = os.path.join(self.cache_dir, f"{cache_key}.mp3")
+        os.replace(src_path, path)
+        size = os.path.getsize(path)
+
+        now = int(time.time())
+        conn = sqlite3.connect(self.db_file)
+        try:
+            conn.execute('''
+                INSERT INTO tts_cache (cache_key, path, size, created_at, last_used, hits)
+                VALUES (?, ?, ?, ?, ?, 0)
+                ON CONFLICT(cache_key) DO UPDATE SET path = excluded.path, size = excluded.size,
+                                                     last_used = excluded.last_used
+            ''', (cache_key, path, size, now, now))
+            conn.commit()
+            self._evict(conn, keep=cache_key)
+        finally:
+            conn.close()
+        return path
+
+    def set_file_id(self, cache_key: str, file_id: str):
+        """Запоминаем file_id доставленного аудио для повторной отправки"""
+        conn = sqlite3.connect(self.db_file)
+        try:
+            conn.execute('UPDATE tts_cache SET file_id = ? WHERE cache_key = ?', (file_id, cache_key))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def forget_file_id(self, cache_key: str):
+        """file_id больше не принимается Telegram"""
+        self.set_file_id(cache_key, None)
+
+    def _evict(self, conn: sqlite3.Connection, keep: Optional[str] = None):
+        """LRU вытеснение файлов, пока суммарный размер больше бюджета"""
+        c = conn.cursor()
+        c.execute('SELECT COALESCE(SUM(size), 0) FROM tts_cache WHERE path IS NOT NULL')
+        total = c.fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        c.execute('SELECT cache_key, path, size FROM tts_cache WHERE path IS NOT NULL ORDER BY last_used')
+        for cache_key, path, size in c.fetchall():
+            if total <= self.max_bytes:
+                break
+            if cache_key == keep:
+                continue
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            conn.execute('UPDATE tts_cache SET path = NULL, size = 0 WHERE cache_key = ?', (cache_key,))
+            total -= size
+        conn.execute('DELETE FROM tts_cache WHERE path IS NULL AND file_id IS NULL')
+        conn.commit()
+        logger.info(f"Кэш озвучки очищен до {total / (1024 * 1024):.1f} MB")
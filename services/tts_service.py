@@ -1,12 +1,20 @@
 import aiohttp
+import aiofiles
 import logging
-from typing import Optional, Tuple
+import os
+import re
+import uuid
+from typing import List, Optional, Tuple
 from datetime import datetime
-from config.config import ELEVENLABS_API_KEY, PROXY_TTS
+from config.config import ELEVENLABS_API_KEY, PROXY_TTS, TTS_CONFIG, DOWNLOADS_DIR
+from services.tts_cache import TTSCache
 import asyncio
 
 logger = logging.getLogger(__name__)
 
+# Граница предложения: знак конца предложения и пробел после него
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?…。！？])\s+')
+
 class TTSService:
     def __init__(self, proxy: Optional[str] = None):
         self.api_key = ELEVENLABS_API_KEY
@@ -15,7 +23,13 @@ class TTSService:
         if not self.api_key:
             raise ValueError("ELEVENLABS_API_KEY не настроен")
             
-        self.base_url = "https://api.elevenlabs.io/v1"
+        self.config = TTS_CONFIG
+        self.base_url = TTS_CONFIG['BASE_URL']
+        self.model_id = TTS_CONFIG['MODEL_ID']
+        self.downloads_dir = DOWNLOADS_DIR
+        self.cache = TTSCache()
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore = asyncio.Semaphore(TTS_CONFIG['MAX_CONCURRENT_REQUESTS'])
         self.headers = {
             "xi-api-key": self.api_key,
             "Accept": "audio/mpeg",
@@ -37,48 +51,200 @@ class TTSService:
                 logger.info("TTS будет работать без прокси")
         else:
             logger.info("TTS настроен для работы без прокси")
-    async def text_to_speech(self, text: str, voice_config: dict) -> Tuple[Optional[bytes], Optional[str]]:
+
+    def cache_key(self, text: str, voice_config: dict) -> str:
+        """Ключ кэша озвучки для текста и настроек голоса"""
+        return TTSCache.make_key(
+            text,
+            voice_config['id'],
+            voice_config.get('stability', 0.5),
+            voice_config.get('similarity_boost', 0.75),
+            self.model_id
+        )
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        """Общая сессия с пулом соединений для запросов синтеза"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.config['MAX_CONCURRENT_REQUESTS'],
+                keepalive_timeout=60
+            )
+            session_kwargs = {"headers": self.headers, "connector": connector}
+            if self.proxy_url:
+                session_kwargs["proxy"] = self.proxy_url
+            self._session = aiohttp.ClientSession(**session_kwargs)
+        return self._session
+
+    async def close(self):
+        """Закрытие общей сессии"""
+        if self._session and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    @staticmethod
+    def split_text(text: str, max_chars: int) -> List[str]:
+        """Разбиение текста на куски не длиннее max_chars по границам предложений"""
+        sentences = [s for s in SENTENCE_BOUNDARY.split(text.strip()) if s]
+        chunks: List[str] = []
+        current = ""
+
+        for sentence in sentences:
+            # Слишком длинное предложение режем по пробелам
+            while len(sentence) > max_chars:
+                cut = sentence.rfind(' ', 0, max_chars)
+                if cut <= 0:
+                    cut = max_chars
+                if current:
+                    chunks.append(current)
+                    current = ""
+                chunks.append(sentence[:cut].strip())
+                sentence = sentence[cut:].strip()
+
+            if current and len(current) + 1 + len(sentence) > max_chars:
+                chunks.append(current)
+                current = sentence
+            else:
+                current = f"{current} {sentence}" if current else sentence
+
+        if current:
+            chunks.append(current)
+        return chunks
+
+    @staticmethod
+    def strip_id3(data: bytes) -> bytes:
+        """Удаление тегов ID3v2 в начале и ID3v1 в конце, чтобы склейка MP3 была чистой"""
+        if data[:3] == b'ID3' and len(data) >= 10:
+            size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+            footer = 10 if data[5] & 0x10 else 0
+            data = data[10 + size + footer:]
+        if len(data) >= 128 and data[-128:-125] == b'TAG':
+            data = data[:-128]
+        return data
+
+    async def _synthesize_chunk(self, text: str, voice_config: dict, output_path: str,
+                                previous_text: str = "", next_text: str = ""):
+        """Синтез одного куска через потоковый эндпоинт с записью на диск по мере получения"""
+        data = {
+            "text": text,
+            "model_id": self.model_id,
+            "voice_settings": {
+                "stability": voice_config.get('stability', 0.5),
+                "similarity_boost": voice_config.get('similarity_boost', 0.75)
+            }
+        }
+        # Соседние куски передаем для сохранения интонации на стыках
+        if previous_text:
+            data["previous_text"] = previous_text
+        if next_text:
+            data["next_text"] = next_text
+
+        url = f"{self.base_url}/text-to-speech/{voice_config['id']}/stream"
+        params = {"output_format": self.config['OUTPUT_FORMAT']}
+        timeout = aiohttp.ClientTimeout(total=self.config['REQUEST_TIMEOUT'])
+        delay = self.config['RETRY_DELAY']
+
+        for attempt in range(1, self.config['MAX_RETRIES'] + 1):
+            try:
+                async with self._semaphore:
+                    async with self._get_session().post(url, json=data, params=params, timeout=timeout) as response:
+                        if response.status == 200:
+                            async with aiofiles.open(output_path, 'wb') as f:
+                                async for chunk in response.content.iter_chunked(64 * 1024):
+                                    await f.write(chunk)
+                            return
+
+                        error_text = await response.text()
+                        if response.status == 429:
+                            logger.warning(f"Лимит запросов ElevenLabs, попытка {attempt}")
+                            await asyncio.sleep(self.config['RATE_LIMIT_DELAY'])
+                            continue
+                        if response.status < 500:
+                            raise RuntimeError(f"Ошибка API ElevenLabs: {error_text}")
+                        logger.warning(f"Ошибка сервера ElevenLabs ({response.status}), попытка {attempt}")
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                logger.warning(f"Сетевая ошибка синтеза, попытка {attempt}: {e}")
+
+            await asyncio.sleep(delay)
+            delay *= 2
+
+        raise RuntimeError("Не удалось синтезировать фрагмент после всех попыток")
+
+    async def text_to_speech(self, text: str, voice_config: dict) -> Tuple[Optional[str], Optional[str]]:
         """
         Асинхронное преобразование текста в речь
-        
+
+        Длинный текст делится по предложениям, куски синтезируются параллельно
+        (не больше MAX_CONCURRENT_REQUESTS), а MP3 по мере готовности дописываются
+        по порядку в один файл без перекодирования. Результат не читается в память:
+        файл переносится в кэш и отправляется с диска.
+
         Args:
             text: Текст для преобразования
             voice_config: Конфигурация голоса
         Returns:
-            Tuple[bytes, str]: Аудио данные и название файла
+            Tuple[str, str]: Путь к MP3 и название файла для отправки
         """
+        chunk_paths: List[str] = []
+        tasks: List[asyncio.Task] = []
+        output_path = None
         try:
-            voice_id = voice_config['id']
             voice_name = voice_config['name']
-            
-            data = {
-                "text": text,
-                "model_id": "eleven_multilingual_v2",
-                "voice_settings": {
-                    "stability": voice_config.get('stability', 0.5),
-                    "similarity_boost": voice_config.get('similarity_boost', 0.75)
-                }
-            }
-            
-            # Добавляем прокси в конфигурацию сессии если он установлен
-            session_kwargs = {"headers": self.headers}
-            if self.proxy:
-                session_kwargs["proxy"] = self.proxy_url
-            
-            async with aiohttp.ClientSession(**session_kwargs) as session:
-                async with session.post(
-                    f"{self.base_url}/text-to-speech/{voice_id}",
-                    json=data
-                ) as response:
-                    if response.status == 200:
-                        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                        filename = f"voice_{voice_name}_{timestamp}.mp3"
-                        return await response.read(), filename
-                    
-                    error_text = await response.text()
-                    logger.error(f"Ошибка API ElevenLabs: {error_text}")
-                    return None, None
-                    
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"voice_{voice_name}_{timestamp}.mp3"
+
+            # Тот же текст и голос уже озвучивали - отдаем с диска без запроса к API
+            cache_key = self.cache_key(text, voice_config)
+            cached = self.cache.get(cache_key)
+            if cached and cached['path']:
+                logger.info(f"Озвучка найдена в кэше: {cache_key[:12]}")
+                return cached['path'], filename
+
+            chunks = self.split_text(text, self.config['CHUNK_CHARS'])
+            job_id = uuid.uuid4().hex[:8]
+            chunk_paths = [
+                os.path.join(self.downloads_dir, f"tts_{job_id}_{i}.mp3")
+                for i in range(len(chunks))
+            ]
+            output_path = os.path.join(self.downloads_dir, f"tts_{job_id}.mp3")
+            logger.info(f"Синтез {len(text)} символов в {len(chunks)} фрагментах")
+
+            tasks = [
+                asyncio.create_task(self._synthesize_chunk(
+                    chunk, voice_config, path,
+                    previous_text=chunks[i - 1] if i > 0 else "",
+                    next_text=chunks[i + 1] if i + 1 < len(chunks) else ""
+                ))
+                for i, (chunk, path) in enumerate(zip(chunks, chunk_paths))
+            ]
+
+            # Склейка идет параллельно синтезу: фрагмент дописывается, как только готовы все предыдущие
+            async with aiofiles.open(output_path, 'wb') as out:
+                for i, (task, path) in enumerate(zip(tasks, chunk_paths)):
+                    await task
+                    async with aiofiles.open(path, 'rb') as f:
+                        part = await f.read()
+                    # Тег первого фрагмента оставляем, у остальных убираем
+                    await out.write(part if i == 0 else self.strip_id3(part))
+                    os.remove(path)
+
+            try:
+                return self.cache.put_file(cache_key, output_path), filename
+            except Exception as e:
+                logger.warning(f"Не удалось сохранить озвучку в кэш: {e}")
+            if os.path.exists(output_path):
+                return output_path, filename
+            return None, None
+
         except Exception as e:
             logger.error(f"Ошибка при генерации речи: {e}")
+            if output_path and os.path.exists(output_path):
+                os.remove(output_path)
             return None, None
+        finally:
+            # Ошибка одного фрагмента останавливает остальные до удаления их файлов
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for path in chunk_paths:
+                if os.path.exists(path):
+                    os.remove(path)
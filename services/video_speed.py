@@ -2,9 +2,18 @@ import os
 import subprocess
 import logging
 import asyncio
-from typing import Optional
+import glob
+import shutil
+import time
+import uuid
+from collections import deque
+from dataclasses import replace
+from typing import Callable, Dict, List, Optional, Set, Tuple
 from datetime import datetime
-from config.config import setup_logging
+from config.config import setup_logging, ENCODER_CONFIG
+from services.encoder_profiles import EncoderProfileSelector
+from services.media_probe import MediaProbe
+from services.media_scheduler import MediaScheduler, MediaJob, KIND_ENCODE, KIND_AUDIO, KIND_REMUX
 
 logger = setup_logging(__name__)
 
@@ -13,17 +22,150 @@ class VideoSpeedService:
     
     def __init__(self, downloads_dir="downloads"):
         self.downloads_dir = downloads_dir
+        self.profile_selector = EncoderProfileSelector()
+        self.scheduler = MediaScheduler()
+        self.probe = MediaProbe()
+        self.jobs: Dict[str, asyncio.subprocess.Process] = {}  # Запущенные ffmpeg по job_id
+        self.pending: Dict[str, asyncio.Task] = {}  # Задачи, ожидающие очереди планировщика
+        self.cancelled: Set[str] = set()
         os.makedirs(downloads_dir, exist_ok=True)
+
+    def cancel(self, job_id: str) -> bool:
+        """Отмена задачи: ffmpeg завершается, частичный файл удаляется после выхода процесса"""
+        waiting = self.pending.get(job_id)
+        if waiting and not waiting.done():
+            self.cancelled.add(job_id)
+            waiting.cancel()
+            logger.info(f"⛔ Задача {job_id} снята с очереди")
+            return True
+
+        process = self.jobs.get(job_id)
+        if not process or process.returncode is not None:
+            return False
+        self.cancelled.add(job_id)
+        process.terminate()
+        logger.info(f"⛔ Задача {job_id} отменена пользователем")
+        return True
+
+    def pop_cancelled(self, job_id: str) -> bool:
+        """Была ли задача отменена (флаг сбрасывается)"""
+        if job_id in self.cancelled:
+            self.cancelled.discard(job_id)
+            return True
+        return False
+
+    @staticmethod
+    def _timeout_for(duration: float) -> float:
+        """Таймаут кодирования: кратно длительности, но не меньше минимума"""
+        if duration <= 0:
+            return ENCODER_CONFIG['TIMEOUT_MAX']
+        return min(max(ENCODER_CONFIG['TIMEOUT_MIN'], duration * ENCODER_CONFIG['TIMEOUT_REALTIME_FACTOR']),
+                   ENCODER_CONFIG['TIMEOUT_MAX'])
+
+    @staticmethod
+    async def _terminate(process: asyncio.subprocess.Process):
+        if process.returncode is not None:
+            return
+        process.terminate()
+        try:
+            await asyncio.wait_for(process.wait(), timeout=5)
+        except asyncio.TimeoutError:
+            process.kill()
+            await process.wait()
+
+    @staticmethod
+    def _remove_partial(output_path: Optional[str]):
+        if output_path and os.path.exists(output_path):
+            try:
+                os.remove(output_path)
+                logger.info(f"🗑 Удален неполный файл: {output_path}")
+            except Exception as e:
+                logger.warning(f"Не удалось удалить неполный файл: {e}")
+
+    async def _run_ffmpeg(
+        self,
+        cmd: list,
+        output_path: Optional[str],
+        output_duration: float,
+        progress_callback: Optional[Callable[[float, Optional[float]], None]] = None,
+        job_id: Optional[str] = None,
+        timeout: Optional[float] = None
+    ) -> Tuple[int, str]:
+        """
+        Запуск ffmpeg с разбором -progress pipe:1
+
+        progress_callback(percent, eta_seconds) вызывается на каждое обновление прогресса.
+        При таймауте или отмене процесс останавливается, а неполный файл удаляется.
+
+        Returns:
+            Tuple[int, str]: Код возврата и хвост stderr
+        """
+        process = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE
+        )
+        if job_id:
+            self.jobs[job_id] = process
+
+        stderr_tail = deque(maxlen=50)
+        started = time.monotonic()
+
+        async def read_progress():
+            async for raw_line in process.stdout:
+                key, _, value = raw_line.decode('utf-8', errors='ignore').strip().partition('=')
+                # out_time_ms исторически тоже в микросекундах
+                if key not in ('out_time_us', 'out_time_ms') or not value.isdigit():
+                    continue
+                if not progress_callback or output_duration <= 0:
+                    continue
+                done = int(value) / 1_000_000
+                percent = min(done / output_duration * 100, 100.0)
+                elapsed = time.monotonic() - started
+                eta = (output_duration - done) * elapsed / done if done > 0 else None
+                progress_callback(percent, eta)
+
+        async def drain_stderr():
+            # stderr читаем постоянно, иначе ffmpeg заблокируется на заполненном канале
+            async for raw_line in process.stderr:
+                stderr_tail.append(raw_line.decode('utf-8', errors='ignore'))
+
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(read_progress(), drain_stderr(), process.wait()),
+                timeout=timeout or self._timeout_for(output_duration)
+            )
+        except (asyncio.TimeoutError, asyncio.CancelledError):
+            await self._terminate(process)
+            self._remove_partial(output_path)
+            raise
+        finally:
+            if job_id:
+                self.jobs.pop(job_id, None)
+
+        if process.returncode != 0:
+            self._remove_partial(output_path)
+        return process.returncode, ''.join(stderr_tail)
     
     async def speed_up_video(
         self, 
         input_path: str, 
         speed_coefficient: int,
         pitch_shift: float = -0.5,
-        keep_original: bool = False
+        keep_original: bool = False,
+        progress_callback: Optional[Callable[[float, Optional[float]], None]] = None,
+        job_id: Optional[str] = None,
+        on_queue_position: Optional[Callable[[int], None]] = None,
+        segmented: Optional[bool] = None
     ) -> Optional[str]:
         """
         Ускоряет видео через FFmpeg
+
+        Args:
+            progress_callback: Вызывается с процентом готовности и оценкой оставшегося времени
+            job_id: Идентификатор задачи для отмены через cancel()
+            on_queue_position: Вызывается с позицией в очереди планировщика, пока задача ждет
+            segmented: Параллельное кодирование по сегментам; None - по длительности
         """
         # НОРМАЛИЗУЕМ ПУТЬ ДЛЯ ТЕКУЩЕЙ ОС
         input_path = os.path.normpath(input_path)
@@ -102,56 +244,64 @@ class VideoSpeedService:
             logger.info(f"🎬 FFmpeg входной файл: {abs_input_path}")
             logger.info(f"🎬 FFmpeg выходной файл: {abs_output_path}")
             
-            # Формируем команду FFmpeg
-            cmd = [
-                'ffmpeg',
-                '-i', abs_input_path,  # ИСПОЛЬЗУЕМ АБСОЛЮТНЫЙ ПУТЬ
-                '-filter_complex',
-                f'[0:v]setpts=PTS/{speed_factor}[v];'
-                f'[0:a]asetrate={new_sample_rate},aresample=48000,atempo={speed_factor}[a]',
-                '-map', '[v]',
-                '-map', '[a]',
-                '-c:v', 'libx264',
-                '-preset', 'medium',
-                '-crf', '23',
-                '-c:a', 'aac',
-                '-b:a', '192k',
-                '-y',
-                abs_output_path  # ИСПОЛЬЗУЕМ АБСОЛЮТНЫЙ ПУТЬ
-            ]
-            
-            logger.info(f"🎬 Команда FFmpeg: {' '.join(cmd)}")
-            
-            # Запускаем FFmpeg асинхронно
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
-            )
-            
-            stdout, stderr = await process.communicate()
-            
-            if process.returncode == 0:
-                if os.path.exists(abs_output_path):
-                    file_size = os.path.getsize(abs_output_path) / (1024 * 1024)
-                    logger.info(f"✅ Видео ускорено: {abs_output_path} ({file_size:.2f} MB)")
-                    
-                    # Удаляем оригинал если не нужно сохранять
-                    if not keep_original and abs_input_path != abs_output_path:
-                        try:
-                            os.remove(abs_input_path)
-                            logger.info(f"🗑 Удален оригинальный файл: {abs_input_path}")
-                        except Exception as e:
-                            logger.warning(f"Не удалось удалить оригинал: {e}")
-                    
-                    return abs_output_path  # ВОЗВРАЩАЕМ АБСОЛЮТНЫЙ ПУТЬ
-                else:
-                    logger.error(f"❌ Выходной файл не создан")
+            # Профиль кодирования по длительности, разрешению и текущей нагрузке
+            video_info = await self.get_video_info(abs_input_path)
+            duration = (video_info or {}).get('duration', 0)
+
+            if segmented is None:
+                # Сегменты быстрее, только если планировщик может кодировать хотя бы два сразу
+                parallel = self.scheduler.budget // self.scheduler.encode_threads >= 2
+                segmented = (ENCODER_CONFIG['SEGMENTED'] and parallel
+                             and duration >= ENCODER_CONFIG['SEGMENTED_MIN_DURATION'])
+            if segmented and duration > 0:
+                # Длинное видео кодируем сегментами параллельно; сегменты сами ждут очереди
+                segmented_task = asyncio.ensure_future(self._encode_segmented(
+                    abs_input_path, abs_output_path, video_info, speed_factor,
+                    new_sample_rate, keep_original, progress_callback
+                ))
+                if job_id:
+                    self.pending[job_id] = segmented_task
+                try:
+                    return await segmented_task
+                except asyncio.CancelledError:
+                    if job_id and job_id in self.cancelled:
+                        logger.info(f"⛔ Сегментное ускорение отменено: {abs_input_path}")
+                        return None
+                    raise
+                except RuntimeError as e:
+                    logger.warning(f"Сегментное кодирование не удалось, кодируем целиком: {e}")
+                finally:
+                    if job_id:
+                        self.pending.pop(job_id, None)
+
+            # Ждем очереди: короткие ролики идут раньше длинных рендеров
+            acquire_task = asyncio.ensure_future(self.scheduler.acquire(
+                KIND_ENCODE,
+                self.scheduler.priority_for_duration(duration),
+                duration,
+                f"speed {os.path.basename(abs_input_path)}",
+                on_queue_position
+            ))
+            if job_id:
+                self.pending[job_id] = acquire_task
+            try:
+                slot = await acquire_task
+            except asyncio.CancelledError:
+                if job_id and job_id in self.cancelled:
+                    logger.info(f"⛔ Ускорение отменено в очереди: {abs_input_path}")
                     return None
-            else:
-                error_msg = stderr.decode('utf-8') if stderr else "Неизвестная ошибка"
-                logger.error(f"❌ FFmpeg ошибка:\n{error_msg}")
-                return None
+                raise
+            finally:
+                if job_id:
+                    self.pending.pop(job_id, None)
+
+            try:
+                return await self._encode(
+                    abs_input_path, abs_output_path, video_info, slot, speed_factor,
+                    new_sample_rate, keep_original, progress_callback, job_id
+                )
+            finally:
+                self.scheduler.release(slot)
                 
         except asyncio.TimeoutError:
             logger.error(f"❌ Превышен таймаут обработки видео")
@@ -159,43 +309,383 @@ class VideoSpeedService:
         except Exception as e:
             logger.error(f"❌ Ошибка при обработке видео: {e}", exc_info=True)
             return None
-    
-    async def get_video_info(self, video_path: str) -> Optional[dict]:
-        """Получает информацию о видео через ffprobe"""
+
+    async def _encode(
+        self,
+        abs_input_path: str,
+        abs_output_path: str,
+        video_info: Optional[dict],
+        slot: MediaJob,
+        speed_factor: float,
+        new_sample_rate: int,
+        keep_original: bool,
+        progress_callback: Optional[Callable[[float, Optional[float]], None]],
+        job_id: Optional[str]
+    ) -> Optional[str]:
+        """Кодирование в выделенном планировщиком слоте"""
+        # Остальные кодирования (идущие и ожидающие) учитываются при выборе пресета,
+        # а число потоков задает планировщик
+        active_jobs = self.scheduler.running_count(KIND_ENCODE) - 1 + self.scheduler.queued_count(KIND_ENCODE)
+        profile = replace(self.profile_selector.choose(video_info, active_jobs, speed_factor), threads=slot.threads)
+
+        video_filter = f'[0:v]setpts=PTS/{speed_factor}'
+        if profile.scale_filter():
+            video_filter += f',{profile.scale_filter()}'
+        
+        # Формируем команду FFmpeg
+        cmd = [
+            'ffmpeg',
+            '-progress', 'pipe:1',
+            '-nostats',
+            '-i', abs_input_path,  # ИСПОЛЬЗУЕМ АБСОЛЮТНЫЙ ПУТЬ
+            '-filter_complex',
+            f'{video_filter}[v];'
+            f'[0:a]asetrate={new_sample_rate},aresample=48000,atempo={speed_factor}[a]',
+            '-map', '[v]',
+            '-map', '[a]',
+            *profile.video_args(),
+            *profile.audio_args(),
+            '-y',
+            abs_output_path  # ИСПОЛЬЗУЕМ АБСОЛЮТНЫЙ ПУТЬ
+        ]
+        
+        logger.info(f"🎬 Команда FFmpeg: {' '.join(cmd)}")
+        
+        # Запускаем FFmpeg асинхронно
+        output_duration = (video_info or {}).get('duration', 0) / speed_factor
+        started = time.monotonic()
+        returncode, stderr_text = await self._run_ffmpeg(
+            cmd, abs_output_path, output_duration, progress_callback, job_id
+        )
+        elapsed = time.monotonic() - started
+
+        if job_id and job_id in self.cancelled:
+            logger.info(f"⛔ Ускорение отменено: {abs_input_path}")
+            return None
+        
+        if returncode == 0:
+            if os.path.exists(abs_output_path):
+                output_size = os.path.getsize(abs_output_path)
+                file_size = output_size / (1024 * 1024)
+                logger.info(f"✅ Видео ускорено: {abs_output_path} ({file_size:.2f} MB)")
+                await self.profile_selector.record(profile, video_info, active_jobs, elapsed, output_size)
+                
+                # Удаляем оригинал если не нужно сохранять
+                if not keep_original:
+                    self._remove_original(abs_input_path, abs_output_path)
+                
+                return abs_output_path  # ВОЗВРАЩАЕМ АБСОЛЮТНЫЙ ПУТЬ
+            else:
+                logger.error(f"❌ Выходной файл не создан")
+                return None
+        else:
+            error_msg = stderr_text or "Неизвестная ошибка"
+            logger.error(f"❌ FFmpeg ошибка:\n{error_msg}")
+            return None
+
+    async def speed_up_video_batch(
+        self,
+        input_path: str,
+        speed_coefficients: List[int],
+        pitch_shift: float = -0.5,
+        keep_original: bool = False,
+        progress_callback: Optional[Callable[[float, Optional[float]], None]] = None,
+        job_id: Optional[str] = None,
+        on_queue_position: Optional[Callable[[int], None]] = None
+    ) -> Dict[int, str]:
+        """
+        Ускорение с несколькими коэффициентами за одно декодирование
+
+        Один процесс ffmpeg: split/asplit размножают декодированные кадры и звук,
+        каждая ветка получает свой setpts/atempo и свой кодировщик.
+
+        Returns:
+            Dict[int, str]: Коэффициент -> путь к результату (пустой при ошибке или отмене)
+        """
+        coefficients = sorted(set(speed_coefficients))
+        if len(coefficients) == 1:
+            path = await self.speed_up_video(
+                input_path, coefficients[0], pitch_shift, keep_original,
+                progress_callback, job_id, on_queue_position
+            )
+            return {coefficients[0]: path} if path else {}
+
+        if not all(1 <= c <= 10 for c in coefficients):
+            logger.error(f"❌ Неверные коэффициенты: {coefficients}. Должны быть от 1 до 10")
+            return {}
+
+        abs_input_path = os.path.abspath(os.path.normpath(input_path))
+        if not os.path.exists(abs_input_path):
+            logger.error(f"❌ Файл НЕ найден по пути: {abs_input_path}")
+            return {}
+
+        file_dir = os.path.dirname(abs_input_path)
+        name, ext = os.path.splitext(os.path.basename(abs_input_path))
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        factors = {c: 1.0 + (c / 100) for c in coefficients}
+        outputs = {c: os.path.join(file_dir, f"{name}_speed{c}x_{timestamp}{ext}") for c in coefficients}
+        new_sample_rate = int(48000 * 2 ** (pitch_shift / 12))
+        count = len(coefficients)
+
+        video_info = await self.get_video_info(abs_input_path)
+        duration = (video_info or {}).get('duration', 0)
+
+        # Один слот с весом по числу кодировщиков
+        acquire_task = asyncio.ensure_future(self.scheduler.acquire(
+            KIND_ENCODE,
+            self.scheduler.priority_for_duration(duration * count),
+            duration * count,
+            f"speed batch {name}",
+            on_queue_position,
+            weight=count
+        ))
+        if job_id:
+            self.pending[job_id] = acquire_task
+        try:
+            slot = await acquire_task
+        except asyncio.CancelledError:
+            if job_id and job_id in self.cancelled:
+                logger.info(f"⛔ Пакетное ускорение отменено в очереди: {abs_input_path}")
+                return {}
+            raise
+        finally:
+            if job_id:
+                self.pending.pop(job_id, None)
+
         try:
+            active_jobs = self.scheduler.running_count(KIND_ENCODE) - 1 + self.scheduler.queued_count(KIND_ENCODE)
+            # Все результаты кодируются одним профилем: битрейт - под самый длинный из них
+            profile = self.profile_selector.choose(
+                video_info, active_jobs, factors[coefficients[0]], outputs=count
+            )
+            profile = replace(profile, threads=max(1, slot.threads // count))
+
+            # Высота звука меняется один раз до asplit, темп - в каждой ветке
+            scale = f",{profile.scale_filter()}" if profile.scale_filter() else ""
+            graph = [
+                f"[0:v]split={count}" + ''.join(f"[v{i}]" for i in range(count)),
+                f"[0:a]asetrate={new_sample_rate},aresample=48000,asplit={count}"
+                + ''.join(f"[a{i}]" for i in range(count)),
+            ]
+            output_args = []
+            for i, c in enumerate(coefficients):
+                graph.append(f"[v{i}]setpts=PTS/{factors[c]}{scale}[vo{i}]")
+                graph.append(f"[a{i}]atempo={factors[c]}[ao{i}]")
+                output_args += [
+                    '-map', f'[vo{i}]', '-map', f'[ao{i}]',
+                    *profile.video_args(), *profile.audio_args(),
+                    outputs[c]
+                ]
+
             cmd = [
-                'ffprobe',
-                '-v', 'quiet',
-                '-print_format', 'json',
-                '-show_format',
-                '-show_streams',
-                video_path
+                'ffmpeg', '-progress', 'pipe:1', '-nostats',
+                '-i', abs_input_path,
+                '-filter_complex', ';'.join(graph),
+                '-y',
+                *output_args
             ]
-            
-            process = await asyncio.create_subprocess_exec(
-                *cmd,
-                stdout=asyncio.subprocess.PIPE,
-                stderr=asyncio.subprocess.PIPE
+            logger.info(f"🎬 Команда FFmpeg (пакет {count}): {' '.join(cmd)}")
+
+            # out_time в -progress - максимум по всем выходам, то есть по самому медленному
+            longest_output = duration / factors[coefficients[0]]
+            started = time.monotonic()
+            returncode, stderr_text = await self._run_ffmpeg(
+                cmd, outputs[coefficients[0]], longest_output, progress_callback, job_id,
+                timeout=self._timeout_for(longest_output) * count
             )
-            
-            stdout, _ = await process.communicate()
-            
-            if process.returncode == 0:
-                import json
-                info = json.loads(stdout.decode('utf-8'))
-                
-                # Извлекаем полезную информацию
-                duration = float(info.get('format', {}).get('duration', 0))
-                size = int(info.get('format', {}).get('size', 0))
-                
-                return {
-                    'duration': duration,
-                    'size_mb': size / (1024 * 1024),
-                    'format': info.get('format', {}).get('format_name', 'unknown')
-                }
-            
-            return None
-            
+            elapsed = time.monotonic() - started
+        except asyncio.TimeoutError:
+            # Как и speed_up_video: таймаут - обычная неудача, частичные результаты удаляются
+            logger.error(f"❌ Превышен таймаут пакетного ускорения {coefficients}")
+            for path in outputs.values():
+                self._remove_partial(path)
+            return {}
+        except asyncio.CancelledError:
+            for path in outputs.values():
+                self._remove_partial(path)
+            raise
+        finally:
+            self.scheduler.release(slot)
+
+        if returncode != 0 or (job_id and job_id in self.cancelled):
+            for path in outputs.values():
+                self._remove_partial(path)
+            if returncode != 0 and not (job_id and job_id in self.cancelled):
+                logger.error(f"❌ FFmpeg ошибка:\n{stderr_text or 'Неизвестная ошибка'}")
+            return {}
+
+        results = {c: path for c, path in outputs.items() if os.path.exists(path)}
+        total_size = sum(os.path.getsize(path) for path in results.values())
+        logger.info(f"✅ Пакетное ускорение {coefficients}: {elapsed:.1f} с, {total_size / (1024 * 1024):.2f} MB")
+        await self.profile_selector.record(
+            replace(profile, name=f"{profile.name}-batch{count}"), video_info, active_jobs, elapsed, total_size
+        )
+
+        if not keep_original and len(results) == count:
+            self._remove_original(abs_input_path, '')
+        return results
+
+    @staticmethod
+    def _remove_original(abs_input_path: str, abs_output_path: str):
+        if abs_input_path == abs_output_path:
+            return
+        try:
+            os.remove(abs_input_path)
+            logger.info(f"🗑 Удален оригинальный файл: {abs_input_path}")
         except Exception as e:
-            logger.error(f"Ошибка получения информации о видео: {e}")
-            return None
\ No newline at end of file
+            logger.warning(f"Не удалось удалить оригинал: {e}")
+
+    async def _encode_segmented(
+        self,
+        abs_input_path: str,
+        abs_output_path: str,
+        video_info: dict,
+        speed_factor: float,
+        new_sample_rate: int,
+        keep_original: bool,
+        progress_callback: Optional[Callable[[float, Optional[float]], None]]
+    ) -> Optional[str]:
+        """
+        Параллельное кодирование длинного видео по сегментам.
+
+        Видеодорожка режется по ключевым кадрам без перекодирования, сегменты
+        кодируются отдельными процессами ffmpeg (каждый - в своем слоте
+        планировщика) и склеиваются concat demuxer'ом без перекодирования.
+        Звук обрабатывается одним проходом по всему файлу: так на стыках
+        сегментов не появляется рассинхронизация и щелчков.
+        """
+        duration = video_info['duration']
+        priority = self.scheduler.priority_for_duration(duration)
+        work_dir = os.path.join(self.downloads_dir, f"segments_{uuid.uuid4().hex[:8]}")
+        os.makedirs(work_dir, exist_ok=True)
+        started = time.monotonic()
+
+        try:
+            # 1. Нарезка видеодорожки по ключевым кадрам
+            async with self.scheduler.slot(KIND_REMUX, priority, duration, "segment split"):
+                returncode, stderr_text = await self._run_ffmpeg([
+                    'ffmpeg', '-v', 'error',
+                    '-i', abs_input_path,
+                    '-map', '0:v:0',
+                    '-c', 'copy',
+                    '-f', 'segment',
+                    '-segment_time', str(ENCODER_CONFIG['SEGMENT_DURATION']),
+                    '-reset_timestamps', '1',
+                    os.path.join(work_dir, 'src_%04d.mp4')
+                ], None, duration)
+            if returncode != 0:
+                raise RuntimeError(f"нарезка на сегменты: {stderr_text}")
+
+            sources = sorted(glob.glob(os.path.join(work_dir, 'src_*.mp4')))
+            if len(sources) < 2:
+                raise RuntimeError("видео не делится на сегменты по ключевым кадрам")
+
+            source_durations = []
+            for source in sources:
+                source_durations.append(((await self.get_video_info(source)) or {}).get('duration', 0))
+
+            active_jobs = self.scheduler.running_count(KIND_ENCODE) + self.scheduler.queued_count(KIND_ENCODE)
+            profile = self.profile_selector.choose(video_info, active_jobs, speed_factor)
+            logger.info(f"🧩 Сегментное кодирование: {len(sources)} сегментов, профиль {profile.name}")
+
+            # Общий прогресс - сумма готовых секунд по всем сегментам
+            total_output = duration / speed_factor
+            done = [0.0] * len(sources)
+
+            def segment_progress(index: int):
+                def callback(percent: float, eta: Optional[float]):
+                    done[index] = source_durations[index] / speed_factor * percent / 100
+                    if not progress_callback:
+                        return
+                    completed = sum(done)
+                    elapsed = time.monotonic() - started
+                    overall_eta = (total_output - completed) * elapsed / completed if completed > 0 else None
+                    progress_callback(min(completed / total_output * 100, 100.0), overall_eta)
+                return callback
+
+            async def encode_segment(index: int, source: str) -> str:
+                output = os.path.join(work_dir, f"out_{index:04d}.mp4")
+                async with self.scheduler.slot(KIND_ENCODE, priority, source_durations[index],
+                                               f"segment {index}") as slot:
+                    segment_profile = replace(profile, threads=slot.threads)
+                    video_filter = f"setpts=PTS/{speed_factor}"
+                    if segment_profile.scale_filter():
+                        video_filter += f",{segment_profile.scale_filter()}"
+                    returncode, stderr_text = await self._run_ffmpeg([
+                        'ffmpeg', '-progress', 'pipe:1', '-nostats',
+                        '-i', source,
+                        '-vf', video_filter,
+                        '-an',
+                        *segment_profile.video_args(),
+                        '-y', output
+                    ], output, source_durations[index] / speed_factor, segment_progress(index))
+                if returncode != 0:
+                    raise RuntimeError(f"кодирование сегмента {index}: {stderr_text}")
+                return output
+
+            async def encode_audio() -> str:
+                output = os.path.join(work_dir, 'audio.m4a')
+                async with self.scheduler.slot(KIND_AUDIO, priority, duration, "segment audio"):
+                    returncode, stderr_text = await self._run_ffmpeg([
+                        'ffmpeg', '-v', 'error',
+                        '-i', abs_input_path,
+                        '-vn',
+                        '-af', f'asetrate={new_sample_rate},aresample=48000,atempo={speed_factor}',
+                        *profile.audio_args(),
+                        '-y', output
+                    ], output, total_output)
+                if returncode != 0:
+                    raise RuntimeError(f"обработка звука: {stderr_text}")
+                return output
+
+            # 2. Звук и сегменты параллельно; при ошибке одного останавливаем остальные
+            tasks = [asyncio.ensure_future(encode_audio())]
+            tasks += [asyncio.ensure_future(encode_segment(i, source)) for i, source in enumerate(sources)]
+            try:
+                audio_path, *segment_outputs = await asyncio.gather(*tasks)
+            except BaseException:
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+
+            # 3. Склейка без перекодирования
+            list_path = os.path.join(work_dir, 'concat.txt')
+            with open(list_path, 'w', encoding='utf-8') as f:
+                for output in segment_outputs:
+                    escaped = os.path.abspath(output).replace("'", "'\\''")
+                    f.write(f"file '{escaped}'\n")
+
+            async with self.scheduler.slot(KIND_REMUX, priority, duration, "segment concat"):
+                returncode, stderr_text = await self._run_ffmpeg([
+                    'ffmpeg', '-v', 'error',
+                    '-f', 'concat', '-safe', '0', '-i', list_path,
+                    '-i', audio_path,
+                    '-map', '0:v', '-map', '1:a',
+                    '-c', 'copy',
+                    '-movflags', '+faststart',
+                    '-y', abs_output_path
+                ], abs_output_path, total_output)
+            if returncode != 0:
+                raise RuntimeError(f"склейка сегментов: {stderr_text}")
+
+            elapsed = time.monotonic() - started
+            output_size = os.path.getsize(abs_output_path)
+            logger.info(
+                f"✅ Видео ускорено сегментами: {abs_output_path} ({output_size / (1024 * 1024):.2f} MB), "
+                f"{elapsed:.1f} с, x{duration / elapsed:.2f} от реального времени"
+            )
+            await self.profile_selector.record(
+                replace(profile, name=f"{profile.name}-segmented"), video_info, active_jobs, elapsed, output_size
+            )
+
+            if not keep_original:
+                self._remove_original(abs_input_path, abs_output_path)
+            return abs_output_path
+
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    async def get_video_info(self, video_path: str) -> Optional[dict]:
+        """Получает информацию о видео через общий кэш ffprobe"""
+        return await self.probe.probe(video_path)
\ No newline at end of file
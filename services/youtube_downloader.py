@@ -1,8 +1,10 @@
 import yt_dlp
 import os
+import asyncio
 import aiohttp
 from typing import Dict, List, Optional
 from services.base_downloader import BaseDownloader
+from services.media_scheduler import MediaScheduler, YtDlpSchedulerHook
 
 class YouTubeDownloader(BaseDownloader):
     """Загрузчик для YouTube с поддержкой резервных методов"""
@@ -63,13 +65,24 @@ class YouTubeDownloader(BaseDownloader):
                 'skip_unavailable_fragments': True,
             }
             
-            with yt_dlp.YoutubeDL(ydl_opts) as ydl:
-                ydl.download([url])
+            # Загрузка в отдельном потоке, слияние дорожек - через очередь планировщика
+            loop = asyncio.get_event_loop()
+            scheduler = MediaScheduler()
+            scheduler_hook = YtDlpSchedulerHook(scheduler, loop)
+            ydl_opts['postprocessor_hooks'] = [scheduler_hook]
+            ydl_opts['postprocessor_args'] = {'default': ['-threads', str(scheduler.encode_threads)]}
+            try:
+                await loop.run_in_executor(
+                    None,
+                    lambda: yt_dlp.YoutubeDL(ydl_opts).download([url])
+                )
+            finally:
+                scheduler_hook.release_all()
                 
-                if os.path.exists(temp_path):
-                    os.replace(temp_path, output_path)
-                    self.logger.info(f"Успешная загрузка через yt-dlp: {output_path}")
-                    return output_path
+            if os.path.exists(temp_path):
+                os.replace(temp_path, output_path)
+                self.logger.info(f"Успешная загрузка через yt-dlp: {output_path}")
+                return output_path
         except Exception as e:
             self.logger.warning(f"Ошибка загрузки через yt-dlp: {e}")
             # Метод 1 не сработал, пробуем Метод 2